@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of pipelined EZ-Serial commands.
+
+The peripheral bring-up sequence of sample_custom_gatt_batch.py (stop advertising,
+set the advertising parameters and data, create the four Battery Service
+attributes and start advertising) is sent to a simulated module, one command
+at a time with send_and_wait() and pipelined with send_batch(), through the
+blocking and the asyncio ports. The module delays every response by a
+round-trip latency, so one command at a time costs about one latency per
+command and a batch about one latency in all. POSIX only.
+
+Results can be saved as JSON and compared with an earlier run:
+
+    python benchmark_ezserial_batch.py -o baseline.json
+    python benchmark_ezserial_batch.py -b baseline.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+sys.path.append('./libraries')
+from AsyncEzSerialPort import AsyncEzSerialPort
+from EzSerialApi import EzSerialApiMode
+from EzSerialFakeModule import EzSerialFakeModule
+from SyncEzSerialPort import SyncEzSerialPort
+
+ADV_PARAMETERS = {'mode': 0, 'type': 3, 'channels': 7, 'high_interval': 0x40, 'high_duration': 0,
+                  'low_interval': 0x40, 'low_duration': 0, 'flags': 0x0F, 'directAddr': bytes(6),
+                  'directAddrType': 0}
+BRING_UP = [
+    ('gap_stop_adv', {}),
+    ('gap_set_adv_parameters', ADV_PARAMETERS),
+    ('gap_set_adv_data', {'data': bytes.fromhex('02010608086261747465727903020f18')}),
+    ('gatts_create_attr', {'type': 0, 'perm': 2, 'length': 4, 'data': bytes.fromhex('00280F18')}),
+    ('gatts_create_attr', {'type': 0, 'perm': 2, 'length': 7, 'data': bytes.fromhex('0328121800192A')}),
+    ('gatts_create_attr', {'type': 1, 'perm': 0x22, 'length': 1, 'data': bytes([100])}),
+    ('gatts_create_attr', {'type': 0, 'perm': 0x0A, 'length': 4, 'data': bytes.fromhex('02290000')}),
+    ('gap_start_adv', ADV_PARAMETERS),
+]
+
+
+def check(results: list):
+    if len(results) != len(BRING_UP) or any(err for err, _ in results):
+        raise ValueError(f'Bring-up failed: {[err for err, _ in results]}')
+
+
+def run_sync(port_name: str, api_mode: EzSerialApiMode, runs: int) -> dict:
+    """Time the sequence through the blocking port.
+
+    Returns:
+        dict: median milliseconds by method
+    """
+    times = {'one_by_one': [], 'batched': []}
+    with SyncEzSerialPort(api_mode) as port:
+        port.open(port_name, rtscts=False)
+        for _ in range(runs):
+            start = time.perf_counter()
+            check([port.send_and_wait(command, **kwargs) for command, kwargs in BRING_UP])
+            times['one_by_one'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            check(port.send_batch(BRING_UP))
+            times['batched'].append(time.perf_counter() - start)
+    return {k: round(statistics.median(v) * 1000, 1) for k, v in times.items()}
+
+
+async def run_async(port_name: str, api_mode: EzSerialApiMode, runs: int) -> dict:
+    """Time the sequence through the asyncio port.
+
+    Returns:
+        dict: median milliseconds by method
+    """
+    times = {'one_by_one': [], 'batched': []}
+    async with AsyncEzSerialPort(api_mode) as port:
+        await port.open(port_name, rtscts=False)
+        for _ in range(runs):
+            start = time.perf_counter()
+            check([await port.send_and_wait(command, **kwargs) for command, kwargs in BRING_UP])
+            times['one_by_one'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            check(await port.send_batch(BRING_UP))
+            times['batched'].append(time.perf_counter() - start)
+    return {k: round(statistics.median(v) * 1000, 1) for k, v in times.items()}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-l', '--latency', type=float, default=0.005,
+                        help="round-trip latency of the simulated module in seconds")
+    parser.add_argument('-n', '--runs', type=int, default=20,
+                        help="number of times to send the sequence")
+    parser.add_argument('-m', '--mode', choices=['text', 'binary'], default='text',
+                        help="API format")
+    parser.add_argument('-o', '--output',
+                        help="save the results to a JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with the results in a JSON file")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s | %(levelname)s | %(message)s', level=logging.WARNING)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    api_mode = EzSerialApiMode[args.mode.upper()]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+
+    results = []
+    with EzSerialFakeModule(api_mode, args.latency) as module:
+        results.append({'name': 'sync', **run_sync(module.port_name, api_mode, args.runs)})
+        results.append({'name': 'async', **asyncio.run(run_async(module.port_name, api_mode, args.runs))})
+
+    print(f'{len(BRING_UP)} commands, {args.latency * 1000:g} ms round trip, {args.mode} mode, '
+          f'median of {args.runs} runs')
+    print(f"{'Port':<6} {'One by one (ms)':>16} {'Batched (ms)':>13} {'Speedup':>8}  Baseline")
+    for result in results:
+        compare = ''
+        base = baseline.get(result['name'])
+        if base:
+            compare = f"{base['one_by_one']:.1f} / {base['batched']:.1f} ms"
+        print(f"{result['name']:<6} {result['one_by_one']:>16.1f} {result['batched']:>13.1f} "
+              f"{result['one_by_one'] / result['batched']:>7.1f}x  {compare}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'settings': {'latency': args.latency, 'runs': args.runs, 'mode': args.mode},
+                       'results': results}, f, indent=2)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark of the EZ-Serial packet codecs.
+
+A stream of packets like the PUART carries under load (scan results, GATT
+notifications and command responses) is decoded in UART sized chunks by the
+BinaryDecoder or TextDecoder and by a reference parser.
+
+The codecs are the receive path of the in-tree SyncEzSerialPort and
+AsyncEzSerialPort, in binary and text mode. The reference parsers are written
+for this benchmark. They are not the parser common_lib's EzSerialPort uses
+today, so the speedup is against the reference and not against the current
+code. benchmark_ezserial_ports.py compares the receive path with common_lib's
+EzSerialPort itself. The binary reference parser goes one byte at a time
+through a state machine, copying each packet to a new buffer and unpacking
+each field on its own into an object with a dict. The text reference parser
+looks up each line's definition and field by name. Commands are not measured:
+they are formatted field by field as before and take a few microseconds.
+
+Results can be saved as JSON and compared with an earlier run:
+
+    python benchmark_ezserial_decoder.py -o baseline.json
+    python benchmark_ezserial_decoder.py -b baseline.json
+"""
+
+import argparse
+import json
+import random
+import struct
+import sys
+import time
+sys.path.append('./libraries')
+from EzSerialApi import API_DEFINITIONS, COMMANDS, EVENTS
+from EzSerialBinary import BinaryDecoder, CHECKSUM_SEED, RESULT_FIELD, TYPE_COMMAND, TYPE_EVENT, \
+    encode_fields, encode_packet
+from EzSerialText import TextDecoder, encode_line
+
+ARRAY_SIZES = {'uint8a': 'B', 'longuint8a': 'H'}
+SCALAR_FORMATS = {'uint8': '<B', 'int8': '<b', 'uint16': '<H', 'int16': '<h', 'uint32': '<I'}
+
+# Mix of packets, by weight
+TRAFFIC = {
+    'scan': [('gap_scan_result', 1)],
+    'notify': [('gattc_data_received', 1)],
+    'mixed': [('gap_scan_result', 6), ('gattc_data_received', 3), ('system_ping', 1)],
+}
+
+class ReferencePayload:
+    pass
+
+
+class ReferenceParser:
+    """Byte at a time parser, for comparison."""
+
+    def __init__(self):
+        self.definitions = {}
+        for d in COMMANDS.values():
+            self.definitions[(TYPE_COMMAND, d.group, d.id)] = (d.name, [RESULT_FIELD] + d.returns)
+        for d in EVENTS.values():
+            self.definitions[(TYPE_EVENT, d.group, d.id)] = (d.name, d.params)
+        self.packet = b''
+        self.expected = 0
+
+    def feed(self, data) -> list:
+        packets = []
+        for b in data:
+            if not self.packet and b & 0xC0 not in (TYPE_COMMAND, TYPE_EVENT):
+                continue
+            self.packet += bytes([b])
+            if len(self.packet) == 2:
+                self.expected = 4 + ((self.packet[0] & 0x07) << 8 | self.packet[1]) + 1
+            if len(self.packet) < 4 or len(self.packet) < self.expected:
+                continue
+            packet, self.packet = self.packet, b''
+            if (CHECKSUM_SEED + sum(packet[:-1])) & 0xFF != packet[-1]:
+                continue
+            name, fields = self.definitions[(packet[0] & 0xC0, packet[2], packet[3])]
+            payload = ReferencePayload()
+            offset = 4
+            for field, type, _ in fields:
+                if type == 'macaddr':
+                    value = packet[offset:offset + 6]
+                    offset += 6
+                elif type in ARRAY_SIZES:
+                    size_format = '<' + ARRAY_SIZES[type]
+                    length, = struct.unpack(size_format, packet[offset:offset + struct.calcsize(size_format)])
+                    offset += struct.calcsize(size_format)
+                    value = packet[offset:offset + length]
+                    offset += length
+                else:
+                    value, = struct.unpack(SCALAR_FORMATS[type],
+                                           packet[offset:offset + struct.calcsize(SCALAR_FORMATS[type])])
+                    offset += struct.calcsize(SCALAR_FORMATS[type])
+                setattr(payload, field, value)
+            packets.append((name, payload))
+        return packets
+
+
+class ReferenceTextParser:
+    """Line parser that looks everything up by name, for comparison."""
+
+    def __init__(self):
+        self.text = ''
+
+    def feed(self, data) -> list:
+        packets = []
+        self.text += data.decode('ascii')
+        *lines, self.text = self.text.split('\n')
+        for line in lines:
+            items = line.strip().split(',')
+            kind = items[0][1:]
+            for d in API_DEFINITIONS:
+                if d.text == items[2] and (d.name in COMMANDS) == (kind == 'R'):
+                    break
+            fields = [RESULT_FIELD] + d.returns if kind == 'R' else d.params
+            payload = ReferencePayload()
+            for field in fields:
+                setattr(payload, field[0], None)
+            if kind == 'R':
+                payload.result = int(items[3], 16)
+            for item in items[4 if kind == 'R' else 3:]:
+                key, value = item.split('=')
+                for field, type, k in fields[1:] if kind == 'R' else fields:
+                    if k == key:
+                        if type == 'macaddr':
+                            value = bytes.fromhex(value)[::-1]
+                        elif type in ARRAY_SIZES:
+                            value = bytes.fromhex(value)
+                        else:
+                            value = int(value, 16)
+                            if type == 'int8' and value > 0x7F:
+                                value -= 0x100
+                        setattr(payload, field, value)
+                        break
+            packets.append((d.name, payload))
+        return packets
+
+
+def make_values(rng: random.Random, name: str) -> dict:
+    values = {'result_type': 0, 'address': rng.randbytes(6), 'address_type': 0, 'rssi': -rng.randrange(100),
+              'bond': 0xFF, 'data': rng.randbytes(31), 'conn_handle': 1, 'attr_handle': 0x10, 'type': 1,
+              'runtime': rng.randrange(1 << 32), 'fraction': rng.randrange(1 << 15)}
+    if name == 'gattc_data_received':
+        values['data'] = rng.randbytes(244)
+    return values
+
+
+def make_packet(rng: random.Random, name: str) -> bytes:
+    values = make_values(rng, name)
+    if name in COMMANDS:
+        d = COMMANDS[name]
+        return encode_packet(TYPE_COMMAND, d.group, d.id, encode_fields([RESULT_FIELD] + d.returns, values))
+    d = EVENTS[name]
+    return encode_packet(TYPE_EVENT, d.group, d.id, encode_fields(d.params, values))
+
+
+def make_line(rng: random.Random, name: str) -> bytes:
+    values = make_values(rng, name)
+    return encode_line('R' if name in COMMANDS else 'E', name, **values)
+
+
+def make_stream(mode: str, traffic: str, count: int) -> bytes:
+    rng = random.Random(820)
+    names, weights = zip(*TRAFFIC[traffic])
+    make = make_packet if mode == 'binary' else make_line
+    return b''.join(make(rng, name) for name in rng.choices(names, weights, k=count))
+
+
+def run(decoder, stream: bytes, chunk: int) -> tuple:
+    packets = 0
+    start = time.perf_counter()
+    for i in range(0, len(stream), chunk):
+        packets += len(decoder.feed(stream[i:i + chunk]))
+    return packets, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--mode', choices=['binary', 'text'], nargs='+', default=['binary', 'text'],
+                        help="API modes to benchmark")
+    parser.add_argument('-t', '--traffic', choices=list(TRAFFIC), nargs='+', default=list(TRAFFIC),
+                        help="traffic to decode")
+    parser.add_argument('-n', '--packets', type=int, default=20000,
+                        help="packets to decode per run (default: 20000)")
+    parser.add_argument('-c', '--chunk', type=int, default=512,
+                        help="bytes per read, as from the serial port (default: 512)")
+    parser.add_argument('-o', '--output',
+                        help="save the results to a JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with the results in a JSON file")
+    args, unknown = parser.parse_known_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = {(r['mode'], r['traffic']): r for r in json.load(f)['results']}
+
+    results = []
+    print(f"{'Mode':<7} {'Traffic':<9} {'Reference (pkt/s)':>18} {'Codec (pkt/s)':>14} {'Speedup':>8}  Baseline")
+    for mode in args.mode:
+        for traffic in args.traffic:
+            stream = make_stream(mode, traffic, args.packets)
+            reference = ReferenceParser() if mode == 'binary' else ReferenceTextParser()
+            decoder = BinaryDecoder() if mode == 'binary' else TextDecoder()
+            ref_packets, ref_seconds = run(reference, stream, args.chunk)
+            packets, seconds = run(decoder, stream, args.chunk)
+            if packets != args.packets or ref_packets != args.packets:
+                print(f"{mode} {traffic}: decoded {packets} and {ref_packets} of {args.packets} packets")
+                exit(1)
+            result = {'mode': mode,
+                      'traffic': traffic,
+                      'packets': args.packets,
+                      'reference_pps': round(args.packets / ref_seconds),
+                      'codec_pps': round(args.packets / seconds)}
+            results.append(result)
+            note = ''
+            base = baseline.get((mode, traffic))
+            if base:
+                note = f"{(result['codec_pps'] - base['codec_pps']) / base['codec_pps'] * 100:+.1f}%"
+            print(f"{mode:<7} {traffic:<9} {result['reference_pps']:>18} {result['codec_pps']:>14} "
+                  f"{result['codec_pps'] / result['reference_pps']:>7.1f}x  {note}")
+
+    print("Reference: parsers written for this benchmark, not the common_lib EzSerialPort parser")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
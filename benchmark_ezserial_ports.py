@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+Receive benchmark of common_lib's EzSerialPort against the in-tree port.
+
+A simulated module sends a burst of events, as under scan or GATT notification
+load, over a pseudo terminal. Each port waits for them one by one with
+wait_event(), as the samples and the Robot suites do, and the events received
+per second are reported for text and binary mode. This measures the whole
+receive path of each port: reading the UART, framing, parsing and queueing.
+
+common_lib's EzSerialPort is the port the samples and the Robot suites use.
+It is loaded from the common_lib submodule; when the submodule is not checked
+out it is skipped and only the in-tree SyncEzSerialPort is measured. POSIX only.
+
+Results can be saved as JSON and compared with an earlier run:
+
+    python benchmark_ezserial_ports.py -o baseline.json
+    python benchmark_ezserial_ports.py -b baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+sys.path.append('./libraries')
+from EzSerialApi import EVENT_GAP_SCAN_RESULT, EVENT_GATTC_DATA_RECEIVED, EzSerialApiMode
+from EzSerialFakeModule import EzSerialFakeModule
+from SyncEzSerialPort import SyncEzSerialPort
+
+COMMON_LIB = os.path.join('common_lib', 'libraries')
+EVENT_VALUES = {
+    EVENT_GAP_SCAN_RESULT: {'result_type': 0, 'address': bytes.fromhex('563412A05000'), 'address_type': 0,
+                            'rssi': -60, 'bond': 0xFF, 'data': bytes.fromhex('0201060908494638323020')},
+    EVENT_GATTC_DATA_RECEIVED: {'conn_handle': 1, 'attr_handle': 0x12, 'type': 1, 'data': bytes(range(20))},
+}
+
+
+def load_common_lib():
+    """Import common_lib's EzSerialPort module.
+
+    Returns:
+        module: EzSerialPort module, or None if common_lib is not checked out
+    """
+    if not os.path.isdir(COMMON_LIB):
+        return None
+    sys.path.append(COMMON_LIB)
+    try:
+        import EzSerialPort
+    except ImportError as e:
+        logging.warning(f'Unable to import common_lib EzSerialPort: {e}')
+        return None
+    return EzSerialPort
+
+
+def receive(module: EzSerialFakeModule, wait_event, event: str, count: int, timeout: float) -> dict:
+    """Send a burst of events and wait for each of them.
+
+    Returns:
+        dict: events received and events per second
+    """
+    start = time.perf_counter()
+    module.event(event, count, **EVENT_VALUES[event])
+    received = 0
+    while received < count:
+        err, packet = wait_event(event, timeout)
+        if err:
+            break
+        received += 1
+    seconds = time.perf_counter() - start
+    return {'received': received, 'pps': round(received / seconds)}
+
+
+def run_common_lib(ez_port, module: EzSerialFakeModule, api_mode: EzSerialApiMode, event: str,
+                   count: int, timeout: float) -> dict:
+    port = ez_port.EzSerialPort()
+    port.open(module.port_name, port.IF820_DEFAULT_BAUD, False)
+    try:
+        port.set_api_format(api_mode.value)
+        return receive(module, port.wait_event, event, count, timeout)
+    finally:
+        port.close()
+
+
+def run_in_tree(module: EzSerialFakeModule, api_mode: EzSerialApiMode, event: str,
+                count: int, timeout: float) -> dict:
+    # The queue holds the whole burst, as an unbounded queue would
+    with SyncEzSerialPort(api_mode, queue_size=count) as port:
+        port.open(module.port_name, rtscts=False)
+        return receive(module, port.wait_event, event, count, timeout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-m', '--mode', choices=['text', 'binary'], nargs='+', default=['text', 'binary'],
+                        help="API modes to benchmark")
+    parser.add_argument('-e', '--events', choices=list(EVENT_VALUES), nargs='+', default=list(EVENT_VALUES),
+                        help="events to send")
+    parser.add_argument('-n', '--count', type=int, default=5000,
+                        help="events per burst (default: 5000)")
+    parser.add_argument('-t', '--timeout', type=float, default=2.0,
+                        help="seconds to wait for each event before giving up (default: 2)")
+    parser.add_argument('-o', '--output',
+                        help="save the results to a JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with the results in a JSON file")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s | %(levelname)s | %(message)s', level=logging.WARNING)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = {(r['mode'], r['event']): r for r in json.load(f)['results']}
+
+    ez_port = load_common_lib()
+    results = []
+    print(f"{'Mode':<7} {'Event':<20} {'common_lib (ev/s)':>18} {'In-tree (ev/s)':>15} {'Speedup':>8}  Baseline")
+    for mode in args.mode:
+        api_mode = EzSerialApiMode[mode.upper()]
+        for event in args.events:
+            result = {'mode': mode, 'event': event, 'count': args.count}
+            if ez_port:
+                with EzSerialFakeModule(api_mode) as module:
+                    common_lib = run_common_lib(ez_port, module, api_mode, event, args.count, args.timeout)
+                result.update(common_lib_received=common_lib['received'], common_lib_pps=common_lib['pps'])
+            with EzSerialFakeModule(api_mode) as module:
+                in_tree = run_in_tree(module, api_mode, event, args.count, args.timeout)
+            result.update(in_tree_received=in_tree['received'], in_tree_pps=in_tree['pps'])
+            results.append(result)
+            for name in ('common_lib', 'in_tree'):
+                if result.get(f'{name}_received', args.count) != args.count:
+                    print(f"{mode} {event}: {name} received {result[f'{name}_received']} of {args.count} events")
+            reference = result.get('common_lib_pps')
+            speedup = f"{result['in_tree_pps'] / reference:>7.1f}x" if reference else f"{'-':>8}"
+            note = ''
+            base = baseline.get((mode, event))
+            if base:
+                note = f"{(result['in_tree_pps'] - base['in_tree_pps']) / base['in_tree_pps'] * 100:+.1f}%"
+            print(f"{mode:<7} {event:<20} {reference or '-':>18} {result['in_tree_pps']:>15} {speedup}  {note}")
+
+    if not ez_port:
+        print("common_lib is not checked out, only the in-tree port was measured")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the HCI firmware download against a fake target on a pseudo terminal.
+No hardware is required. POSIX only.
+
+The same firmware is downloaded with different numbers of writes in flight,
+and the time, HCI command count and throughput of each run are reported.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import time
+import sys
+sys.path.append('./libraries')
+from HciDownloader import HciDownloader
+from HciFakeTarget import HciFakeTarget
+from FirmwareImage import load_image
+
+FIRMWARE_DIR = f'files{os.sep}v1.4.16.16_int-ant'
+MINIDRIVER = f'{FIRMWARE_DIR}{os.sep}minidriver-20820A1-uart-patchram.hex'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', default=glob.glob(f'{FIRMWARE_DIR}{os.sep}*_download.hcd')[0],
+                        help="firmware file to download")
+    parser.add_argument('-l', '--latency', type=float, default=0.002,
+                        help="round-trip latency of the fake target in seconds")
+    parser.add_argument('-p', '--processing', type=float, default=0.0002,
+                        help="processing time of each command in seconds")
+    parser.add_argument('-e', '--error_rate', type=float, default=0.0,
+                        help="fraction of writes that fail and must be resent")
+    parser.add_argument('-w', '--windows', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="numbers of writes in flight to benchmark")
+    parser.add_argument('-cr', '--credits', type=int, default=8,
+                        help="commands the fake target accepts before a Command Complete")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s | %(levelname)s | %(message)s', level=logging.WARNING)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    image = load_image(args.file)
+    print(f"{os.path.basename(args.file)}: {image.size} bytes, "
+          f"latency {args.latency * 1000:.1f}ms, processing {args.processing * 1000:.2f}ms, "
+          f"{args.credits} credits")
+    print(f"{'Window':>6} {'Time (s)':>9} {'Commands':>9} {'Retries':>8} {'KB/s':>8}")
+    for window in args.windows:
+        with HciFakeTarget(args.latency, args.processing, args.error_rate,
+                           credits=args.credits) as target:
+            downloader = HciDownloader(target.port_name, window=window)
+            start = time.monotonic()
+            downloader.program_firmware(MINIDRIVER, args.file)
+            elapsed = time.monotonic() - start
+            for address, data in image.segments:
+                if target.read(address, len(data)) != data:
+                    logging.error(f"Window {window}: image mismatch at {hex(address)}")
+                    exit(1)
+        print(f"{window:>6} {elapsed:>9.2f} {downloader.commands_sent:>9} "
+              f"{downloader.retransmits:>8} {image.size / elapsed / 1024:>8.1f}")
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""
+Flashing benchmark suite. Every firmware image in files/ is programmed into the
+simulated HCI target, which models the UART bandwidth, command latency and
+flash erase times. The time, throughput and command counts of each run are
+reported. POSIX only.
+
+Results can be saved as JSON and compared with an earlier run, to catch speed
+regressions before they reach the line:
+
+    python benchmark_hci_suite.py -o baseline.json
+    python benchmark_hci_suite.py -b baseline.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+sys.path.append('./libraries')
+from FirmwareCatalog import FirmwareCatalog, FIRMWARE_FORMATS
+from FirmwareImage import load_image
+from HciDownloader import HciDownloader, VERIFY_MODES, VERIFY_READBACK
+from HciFakeTarget import HciFakeTarget
+
+FIRMWARE_DIR = 'files'
+
+
+def run(release, fmt: str, args) -> dict:
+    """Program one image into a new simulated target.
+
+    Returns:
+        dict: benchmark result
+    """
+    firmware = release.firmware(fmt)
+    image = load_image(firmware)
+    with HciFakeTarget(args.latency, args.processing, args.error_rate,
+                       baudrate=HciDownloader.HCI_DEFAULT_BAUDRATE,
+                       chip_erase_time=args.chip_erase_time,
+                       credits=args.credits) as target:
+        downloader = HciDownloader(target.port_name, window=args.window,
+                                   verify=args.verify)
+        downloader.program_firmware(release.minidriver, firmware,
+                                    chip_erase=args.chip_erase)
+        for address, data in image.segments:
+            if target.read(address, len(data)) != data:
+                raise ValueError(f'Image mismatch at {hex(address)}')
+    phases = {p.name: p for p in downloader.timing.phases.values()}
+    write_time = phases['write'].seconds
+    return {'name': f'{release.variant}/{fmt}',
+            'size': image.size,
+            'seconds': round(downloader.timing.total, 3),
+            'write_seconds': round(write_time, 3),
+            'write_kbps': round(image.size / write_time / 1024, 1) if write_time else 0,
+            'commands': downloader.commands_sent,
+            'bytes': downloader.bytes_sent,
+            'retransmits': downloader.retransmits}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-l', '--latency', type=float, default=0.002,
+                        help="round-trip latency of the simulated target in seconds")
+    parser.add_argument('-p', '--processing', type=float, default=0.0002,
+                        help="processing time of each command in seconds")
+    parser.add_argument('-e', '--error_rate', type=float, default=0.0,
+                        help="fraction of writes that fail and must be resent")
+    parser.add_argument('-w', '--window', type=int, default=1,
+                        help="number of HCI writes to keep in flight")
+    parser.add_argument('-cr', '--credits', type=int, default=1,
+                        help="commands the simulated target accepts before a Command Complete")
+    parser.add_argument('-vm', '--verify', choices=VERIFY_MODES, default=VERIFY_READBACK,
+                        help="verify mode (default: readback). crc is experimental")
+    parser.add_argument('-ce', '--chip_erase', action='store_true',
+                        help="chip erase before writing")
+    parser.add_argument('--chip_erase_time', type=float, default=1.0,
+                        help="simulated chip erase time in seconds")
+    parser.add_argument('-o', '--output',
+                        help="save the results to a JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with the results in a JSON file")
+    parser.add_argument('-t', '--threshold', type=float, default=10.0,
+                        help="slowdown against the baseline that counts as a regression, in percent")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s | %(levelname)s | %(message)s', level=logging.WARNING)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+
+    catalog = FirmwareCatalog(FIRMWARE_DIR)
+    results = []
+    regressions = 0
+    print(f"{'Image':<24} {'Time (s)':>9} {'Write KB/s':>11} {'Commands':>9} {'Retries':>8}  Baseline")
+    for release in catalog.find():
+        for fmt in FIRMWARE_FORMATS:
+            if not release.path(fmt):
+                continue
+            result = run(release, fmt, args)
+            results.append(result)
+            compare = ''
+            base = baseline.get(result['name'])
+            if base:
+                change = (result['seconds'] - base['seconds']) / base['seconds'] * 100
+                compare = f"{change:+.1f}%"
+                if change > args.threshold:
+                    compare += ' REGRESSION'
+                    regressions += 1
+            print(f"{result['name']:<24} {result['seconds']:>9.2f} {result['write_kbps']:>11.1f} "
+                  f"{result['commands']:>9} {result['retransmits']:>8}  {compare}")
+
+    if args.output:
+        settings = {k: getattr(args, k) for k in ('latency', 'processing', 'error_rate', 'window', 'credits',
+                                                  'verify', 'chip_erase', 'chip_erase_time')}
+        with open(args.output, 'w') as f:
+            json.dump({'settings': settings, 'results': results}, f, indent=2)
+    if regressions:
+        print(f"\n{regressions} regression(s) over {args.threshold}%")
+        exit(1)
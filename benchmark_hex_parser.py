@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark firmware file parsing: intelhex against the streaming FirmwareReader.
+
+Each parser runs in a fresh process so its peak memory is measured on its own.
+Reports the parse time, the peak Python allocations (tracemalloc) and the peak
+resident set size above an interpreter that parses nothing. "image" is a full
+parse into a FirmwareImage, as done on a cache miss.
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+sys.path.append('./libraries')
+
+FIRMWARE_DIR = f'files{os.sep}v1.4.16.16_int-ant'
+
+
+def parse_none(path: str):
+    pass
+
+
+def parse_intelhex(path: str):
+    from intelhex import IntelHex
+    ih = IntelHex(path)
+    for start, end in ih.segments():
+        ih.tobinstr(start=start, end=end - 1)
+
+
+def parse_reader(path: str):
+    from FirmwareReader import FirmwareReader
+    for _ in FirmwareReader(path):
+        pass
+
+
+def parse_image(path: str):
+    from FirmwareImage import FirmwareImage
+    FirmwareImage.parse(path)
+
+
+PARSERS = {
+    'intelhex': parse_intelhex,
+    'reader': parse_reader,
+    'image': parse_image,
+}
+
+
+def peak_rss_kb() -> int:
+    try:
+        import resource
+    except ImportError:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_child(parser: str, path: str, repeat: int):
+    parse = PARSERS.get(parser, parse_none)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        parse(path)
+    elapsed = (time.perf_counter() - start) / repeat
+    # tracemalloc slows parsing down, so measure allocations in a separate run
+    tracemalloc.start()
+    parse(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({'time': elapsed, 'peak': peak, 'rss': peak_rss_kb()}))
+
+
+def run_parser(parser: str, path: str, repeat: int) -> dict:
+    out = subprocess.run([sys.executable, __file__, '--child', parser, '-f', path, '-r', str(repeat)],
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        return None
+    return json.loads(out.stdout)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--file', default=glob.glob(f'{FIRMWARE_DIR}{os.sep}*_download.hex')[0],
+                        help="firmware file to parse")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="number of times to parse the file in each process")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args, unknown = parser.parse_known_args()
+
+    if args.child:
+        run_child(args.child, args.file, args.repeat)
+        exit(0)
+
+    print(f"{os.path.basename(args.file)}: {os.path.getsize(args.file)} bytes")
+    print(f"{'Parser':<10} {'Time (ms)':>10} {'Alloc (KB)':>11} {'RSS (KB)':>9}")
+    baseline = run_parser('none', args.file, 1)
+    for name in PARSERS:
+        result = run_parser(name, args.file, args.repeat)
+        if result is None:
+            print(f"{name:<10} {'failed':>10}")
+            continue
+        print(f"{name:<10} {result['time'] * 1000:>10.1f} {result['peak'] / 1024:>11.0f} "
+              f"{result['rss'] - baseline['rss']:>9}")
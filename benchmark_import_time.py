@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+"""
+Startup benchmark for the command line entry points.
+
+Each entry point runs in a fresh interpreter with python -X importtime and an
+argument that exits before any board is touched (--version or --help). The
+wall time, the total import time and the slowest top level imports are
+reported, with any heavy dependency that was loaded even though no board
+operation ran.
+
+Results can be saved as JSON and compared with an earlier run:
+
+    python benchmark_import_time.py -o baseline.json
+    python benchmark_import_time.py -b baseline.json
+"""
+
+import argparse
+import glob
+import json
+import re
+import subprocess
+import sys
+import time
+
+# Only needed to talk to a board, these should not load at startup
+HEAVY_MODULES = ('pyocd', 'cmsis_pack_manager', 'intelhex', 'serial')
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def entry_points() -> list:
+    """Get the entry points and the arguments that make them exit at startup.
+
+    Returns:
+        list: (script, arguments) tuples
+    """
+    entries = [('if820_flasher_cli.py', ['--version'])]
+    for script in sorted(glob.glob('if820_*.py') + glob.glob('sample_*.py')):
+        entries.append((script, ['--help']))
+    return entries
+
+
+def run(script: str, arguments: list) -> dict:
+    """Start an entry point with import timing.
+
+    Returns:
+        dict: benchmark result
+    """
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, '-X', 'importtime', script] + arguments,
+                         capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    imports = []
+    modules = set()
+    for line in out.stderr.splitlines():
+        m = IMPORTTIME_LINE.match(line)
+        if not m:
+            continue
+        modules.add(m.group(4).split('.')[0])
+        # Only the first level of nesting are imports made by the script itself
+        if len(m.group(3)) == 1:
+            imports.append((m.group(4), int(m.group(2))))
+    imports.sort(key=lambda i: i[1], reverse=True)
+    return {'name': f"{script} {' '.join(arguments)}",
+            'ok': out.returncode == 0,
+            'seconds': round(wall, 3),
+            'import_seconds': round(sum(us for _, us in imports) / 1e6, 3),
+            'slowest': [{'module': name, 'seconds': round(us / 1e6, 3)} for name, us in imports[:3]],
+            'heavy': sorted(modules.intersection(HEAVY_MODULES))}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output',
+                        help="save the results to a JSON file")
+    parser.add_argument('-b', '--baseline',
+                        help="compare with the results in a JSON file")
+    parser.add_argument('-t', '--threshold', type=float, default=20.0,
+                        help="slowdown against the baseline that counts as a regression, in percent")
+    parser.add_argument('-s', '--script', nargs='+', default=[],
+                        help="only benchmark these entry points")
+    args, unknown = parser.parse_known_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = {r['name']: r for r in json.load(f)['results']}
+
+    results = []
+    regressions = 0
+    print(f"{'Entry point':<42} {'Wall (s)':>9} {'Import (s)':>11}  Slowest import / heavy modules / baseline")
+    for script, arguments in entry_points():
+        if args.script and script not in args.script:
+            continue
+        result = run(script, arguments)
+        results.append(result)
+        notes = []
+        if not result['ok']:
+            notes.append('failed')
+        if result['slowest']:
+            slowest = result['slowest'][0]
+            notes.append(f"{slowest['module']} {slowest['seconds']:.3f}s")
+        if result['heavy']:
+            notes.append('loads ' + ','.join(result['heavy']))
+        base = baseline.get(result['name'])
+        if base and base['seconds']:
+            change = (result['seconds'] - base['seconds']) / base['seconds'] * 100
+            notes.append(f"{change:+.1f}%")
+            if change > args.threshold:
+                notes.append('REGRESSION')
+                regressions += 1
+        print(f"{result['name']:<42} {result['seconds']:>9.3f} {result['import_seconds']:>11.3f}  "
+              f"{' / '.join(notes)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+    if regressions:
+        print(f"\n{regressions} regression(s) over {args.threshold}%")
+        exit(1)
@@ -5,7 +5,7 @@ import logging
 import textwrap
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -29,12 +29,13 @@ if __name__ == "__main__":
         format="%(asctime)s | %(levelname)s | %(message)s", level=logging.INFO
     )
     args, unknown = parser.parse_known_args()
+    from BoardDiscovery import BoardDiscovery
     if args.debug:
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
     reboot_to_bootloader = args.bootloader
 
-    boards = If820Board.get_connected_boards()
+    boards = BoardDiscovery().get_connected_boards()
     if len(boards) == 0:
         logging.error("No boards found")
         exit(1)
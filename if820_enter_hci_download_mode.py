@@ -4,7 +4,7 @@ import argparse
 import logging
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
 
 
 if __name__ == '__main__':
@@ -20,13 +20,14 @@ if __name__ == '__main__':
     logging.basicConfig(
         format='%(asctime)s | %(levelname)s | %(message)s', level=logging.INFO)
     args, unknown = parser.parse_known_args()
+    from BoardDiscovery import BoardDiscovery
     if args.debug:
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
     hci_port = args.connection
 
-    boards = If820Board.get_connected_boards()
+    boards = BoardDiscovery().get_connected_boards()
 
     if len(boards) == 0:
         logging.error("No boards found")
@@ -5,18 +5,27 @@ Python CLI for IF820 Firmware Upgrade
 
 pyinstaller command to produce a single executable file:
 
-pyinstaller --clean --console --noconfirm  --onefile --add-data "files/v1.4.16.16_int-ant/minidriver-20820A1-uart-patchram.hex:files/v1.4.16.16_int-ant/" --collect-all pyocd  --collect-all cmsis_pack_manager -p common_lib/libraries if820_flasher_cli.py
+pyinstaller --clean --console --noconfirm  --onefile --add-data "files:files" --collect-all pyocd  --collect-all cmsis_pack_manager -p common_lib/libraries -p libraries if820_flasher_cli.py
 
 """
 
 import argparse
+import concurrent.futures
+import json
 import logging
 import textwrap
+import time
 import os
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
-from HciProgrammer import HciProgrammer
+sys.path.append('./libraries')
+from BoardDiscovery import BoardDiscovery
+from BtpPreset import BtpPreset
+from ConfigData import config_image, read_cgs_overrides
+from FirmwareCatalog import FirmwareCatalog, FIRMWARE_FORMATS
+from FirmwareImage import load_image
+from HciDownloader import (HciDownloader, flash_board, flash_board_common_lib, SKIP_RECORD, SKIP_UNCHANGED_MODES,
+                           PROGRAMMER_COMMON_LIB, PROGRAMMER_HCI, PROGRAMMERS, VERIFY_MODES)
 
 LOG_MODULE_HCI_PORT = 'hci_port'
 VERSION = '2.0.0'
@@ -29,6 +38,122 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+def select_boards(boards: list, selection: list) -> list:
+    """Select boards by probe ID or by index in the list of connected boards.
+
+    Args:
+        boards (list): connected boards
+        selection (list): probe IDs or indexes. An empty list selects all boards.
+
+    Returns:
+        list: selected boards
+    """
+    if not selection:
+        return boards
+    selected = []
+    for item in selection:
+        match = [b for b in boards if b.probe.id == item]
+        if not match and item.isdigit() and int(item) < len(boards):
+            match = [boards[int(item)]]
+        if not match:
+            raise ValueError(f"Board {item} not found")
+        if match[0] not in selected:
+            selected.append(match[0])
+    return selected
+
+
+def timing_report(board_id: str, downloader: HciDownloader, firmware: str) -> dict:
+    """Build the --timing report of one download.
+    """
+    report = {'board': board_id,
+              'firmware': os.path.basename(firmware) if firmware else None,
+              'sha256': load_image(firmware).sha256 if firmware else None,
+              'baudrate': downloader.baudrate,
+              'window': downloader.window,
+              'max_write_size': downloader.max_write_size,
+              'verify': downloader.verify,
+              'retransmits': downloader.retransmits,
+              'erase_seconds': round(downloader.erase_time, 3)}
+    report.update(downloader.timing.to_dict())
+    return report
+
+
+def write_timing(path: str, reports: list):
+    """Write --timing reports as JSON."""
+    with open(path, 'w') as f:
+        json.dump(reports, f, indent=2)
+    logging.info(f"Timing written to {path}")
+
+
+def flash_board_timed(board: 'If820Board', mini_driver: str, firmware: str,
+                      programmer: str = PROGRAMMER_COMMON_LIB, **options) -> tuple:
+    """Flash a single board.
+
+    Returns:
+        tuple: (elapsed time in seconds, HciDownloader or None with the common_lib programmer)
+    """
+    start = time.monotonic()
+    logging.info(f"[{board.probe.id}] Flashing...")
+    if programmer == PROGRAMMER_HCI:
+        downloader = flash_board(board, mini_driver, firmware, **options)
+    else:
+        flash_board_common_lib(board, mini_driver, firmware, **options)
+        downloader = None
+    return time.monotonic() - start, downloader
+
+
+def flash_boards(boards: list, mini_driver: str, firmware: str, timings: list = None, **options) -> bool:
+    """Flash several boards in parallel, one worker per board (HCI port).
+    Progress is logged as each board finishes and a summary table is printed at the end.
+    Options are passed to flash_board_timed().
+
+    Args:
+        timings (list, optional): list to append the timing report of each board to. Defaults to None.
+
+    Returns:
+        bool: True if all boards were flashed successfully
+    """
+    def flash_one(board) -> tuple:
+        # Timed in the worker, so a board that fails reports its own time and
+        # not the time since the run started
+        start = time.monotonic()
+        try:
+            return flash_board_timed(board, mini_driver, firmware, **options) + (None,)
+        except Exception as e:
+            return time.monotonic() - start, None, e
+
+    results = {}
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(boards)) as executor:
+        futures = {executor.submit(flash_one, board): board for board in boards}
+        for future in concurrent.futures.as_completed(futures):
+            board = futures[future]
+            elapsed, downloader, error = future.result()
+            if error is None:
+                results[board.probe.id] = ('PASS', elapsed, '')
+                if timings is not None and downloader:
+                    timings.append(timing_report(
+                        board.probe.id, downloader, firmware))
+                logging.info(
+                    f"[{board.probe.id}] Done in {elapsed:.1f}s")
+            else:
+                results[board.probe.id] = ('FAIL', elapsed, str(error))
+                logging.error(f"[{board.probe.id}] Failed after {elapsed:.1f}s: {error}")
+            logging.info(
+                f"Progress: {len(results)}/{len(boards)} boards complete")
+    total = time.monotonic() - start
+
+    print()
+    print(f"{'Board':<24} {'Result':<6} {'Time (s)':>8}  Error")
+    print(f"{'-' * 24} {'-' * 6} {'-' * 8}  {'-' * 5}")
+    for board in boards:
+        result, elapsed, error = results[board.probe.id]
+        print(f"{board.probe.id:<24} {result:<6} {elapsed:>8.1f}  {error}")
+    passed = len([r for r in results.values() if r[0] == 'PASS'])
+    print(f"\n{passed}/{len(boards)} boards passed in {total:.1f}s")
+    return passed == len(boards)
+
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog='if820_flasher_cli',
                                      formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -36,16 +161,57 @@ if __name__ == '__main__':
         CLI tool to flash an IF820 board (or compatible boards) with new firmware.
         If no COM port is specified, the tool will automatically detect the board and flash it.
         If there is more than one board detected, the user will be prompted to select the board to flash.
+        Use --all or --boards to flash several boards at the same time.
         The CLI supports chip erase, firmware update, and flashing firmware with chip erase.
                                         '''))
+    parser.add_argument('-a', '--all', action='store_true',
+                        help="flash all connected boards in parallel")
+    parser.add_argument('-b', '--boards', nargs='+', default=[],
+                        help="flash the boards with these probe IDs (or indexes) in parallel")
     parser.add_argument('-c', '--connection',
                         type=str, default=str(), help="HCI COM port")
+    parser.add_argument('-pg', '--programmer', choices=PROGRAMMERS, default=PROGRAMMER_COMMON_LIB,
+                        help="common_lib: the qualified If820Board/HciProgrammer download. hci: the in-tree "
+                        "HciDownloader, required by --preset, --window, --verify, --skip_unchanged, --timing and "
+                        "the configuration options (default: common_lib)")
+    parser.add_argument('-p', '--preset',
+                        help="download preset (.btp) file. Defaults to the .btp file next to the firmware")
     parser.add_argument('-ce', '--chip_erase', action='store_true',
                         help="perform full chip erase.")
+    parser.add_argument('-ln', '--local_name',
+                        help="patch this Bluetooth local name into the firmware configuration. "
+                        "Implies --chip_erase: the whole firmware is written, for one board only")
+    parser.add_argument('-ba', '--bd_address',
+                        help="patch this BD address, for example 00:16:A4:12:34:56, into the firmware configuration. "
+                        "Implies --chip_erase: the whole firmware is written, for one board only")
+    parser.add_argument('-cg', '--cgs',
+                        help="patch the local name and BD address from this .cgs file into the firmware "
+                        "configuration. Implies --chip_erase: the whole firmware is written, for one board only")
     parser.add_argument('-d', '--debug', action='store_true',
                         help="Enable verbose debug messages")
+    parser.add_argument('-su', '--skip_unchanged', choices=SKIP_UNCHANGED_MODES,
+                        help="skip the download when the firmware is already on the board, comparing each "
+                        "flash sector on the target or against the record of the last download to the board. "
+                        "If any sector differs, the chip is erased and the whole firmware written")
+    parser.add_argument('-n', '--dry_run', action='store_true',
+                        help="report what would be erased and written, and the unchanged sectors, without doing it")
     parser.add_argument('-f', '--file',
                         help="application hex file to flash")
+    parser.add_argument('-vt', '--variant',
+                        help="flash the bundled firmware for this variant, for example ext-ant-int-lpo")
+    parser.add_argument('-fv', '--fw_version',
+                        help="bundled firmware version to flash. Defaults to the newest")
+    parser.add_argument('-ff', '--fw_format', choices=FIRMWARE_FORMATS, default=FIRMWARE_FORMATS[0],
+                        help="bundled firmware file format to flash (default: hex)")
+    parser.add_argument('-ls', '--list', action='store_true',
+                        help="list the bundled firmware and exit")
+    parser.add_argument('-w', '--window', type=int, default=1,
+                        help="number of HCI writes to keep in flight (default: 1)")
+    parser.add_argument('-vm', '--verify', choices=VERIFY_MODES,
+                        help="verify mode. Defaults to readback if the preset asks for verification, otherwise none. "
+                        "crc is experimental: it assumes the minidriver returns a CRC-32, not confirmed on hardware")
+    parser.add_argument('-t', '--timing', metavar='FILE',
+                        help="write the time, bytes and HCI commands of each flashing phase to a JSON file")
     parser.add_argument('-v', '--version', action='store_true',
                         help="Print the version of the tool and exit.")
 
@@ -62,27 +228,141 @@ if __name__ == '__main__':
 
     print(f"IF820 Flasher CLI v{VERSION}")
 
+    catalog = FirmwareCatalog(resource_path('files'))
+    if args.list:
+        for release in catalog.find():
+            print(f"{release.variant:<20} v{release.version:<12} {release.date:<10} "
+                  f"{' '.join(sorted(release.files))}")
+        exit(0)
+
     mini_driver = resource_path(
         f'files{os.sep}v1.4.16.16_int-ant{os.sep}minidriver-20820A1-uart-patchram.hex')
     com_port = args.connection
     firmware = args.file
     chip_erase = args.chip_erase
 
+    if args.variant or args.fw_version:
+        if firmware:
+            logging.error("--file cannot be used with --variant or --fw_version")
+            exit(1)
+        try:
+            release = catalog.resolve(args.variant, args.fw_version)
+        except ValueError as e:
+            logging.error(e)
+            exit(1)
+        logging.info(f"Firmware {release.variant} v{release.version} ({release.date})")
+        firmware = release.firmware(args.fw_format)
+        mini_driver = release.minidriver or mini_driver
+
+    if firmware:
+        # Parse (or fetch from the image cache) before touching any board,
+        # so a bad file is reported up front instead of once per board.
+        try:
+            image = load_image(firmware)
+        except (OSError, ValueError) as e:
+            logging.error(f"Invalid firmware file {firmware}: {e}")
+            exit(1)
+        logging.info(
+            f"Firmware {os.path.basename(firmware)}: {image.size} bytes, sha256 {image.sha256[:16]}")
+
+    hci_options = [name for name, value in (('--preset', args.preset), ('--local_name', args.local_name),
+                                            ('--bd_address', args.bd_address), ('--cgs', args.cgs),
+                                            ('--skip_unchanged', args.skip_unchanged),
+                                            ('--dry_run', args.dry_run), ('--window', args.window != 1),
+                                            ('--verify', args.verify), ('--timing', args.timing)) if value]
+    if args.programmer != PROGRAMMER_HCI and hci_options:
+        logging.error(f"{', '.join(hci_options)} require --programmer {PROGRAMMER_HCI}")
+        exit(1)
+
+    preset = None
+    try:
+        if args.preset:
+            preset = BtpPreset.load(args.preset)
+        elif args.programmer == PROGRAMMER_HCI:
+            preset = BtpPreset.find(firmware if firmware else mini_driver)
+    except (OSError, ValueError) as e:
+        logging.error(f"Invalid download preset: {e}")
+        exit(1)
+    if preset:
+        logging.info(
+            f"Preset {preset.name}: {preset.minidriver_rebaud_rate} baud, "
+            f"{preset.max_write_size} byte writes, {preset.write_verify_mode or 'Write only'}")
+
+    if args.skip_unchanged and (chip_erase or not firmware):
+        logging.error("--skip_unchanged requires a firmware file and cannot be used with --chip_erase")
+        exit(1)
+    if args.skip_unchanged == SKIP_RECORD and com_port:
+        logging.error(f"--skip_unchanged {SKIP_RECORD} needs the board's probe ID and cannot be used with --connection")
+        exit(1)
+    if args.dry_run and not firmware:
+        logging.error("--dry_run requires a firmware file")
+        exit(1)
+
+    config = None
+    if args.cgs or args.local_name or args.bd_address:
+        if args.skip_unchanged or not firmware:
+            logging.error("Configuration updates require a firmware file and cannot be used with --skip_unchanged")
+            exit(1)
+        try:
+            config = read_cgs_overrides(args.cgs) if args.cgs else {}
+        except OSError as e:
+            logging.error(f"Invalid .cgs file: {e}")
+            exit(1)
+        if args.local_name:
+            config['local_name'] = args.local_name
+        if args.bd_address:
+            config['bd_address'] = args.bd_address
+        try:
+            config_image(load_image(firmware), **config)
+        except ValueError as e:
+            logging.error(e)
+            exit(1)
+
+    options = dict(chip_erase=chip_erase)
+    if args.programmer == PROGRAMMER_HCI:
+        options.update(preset=preset, window=args.window, verify=args.verify,
+                       skip_unchanged=args.skip_unchanged, dry_run=args.dry_run, config=config)
+
     # If the user specifies a COM port, flash firmware in manual mode
     if com_port:
         input("Ensure the board is in HCI download mode and press enter to continue...")
-        p = HciProgrammer(mini_driver, com_port,
-                          HciProgrammer.HCI_DEFAULT_BAUDRATE, chip_erase)
         if args.debug:
             logging.getLogger(LOG_MODULE_HCI_PORT).setLevel(logging.DEBUG)
-        p.program_firmware(
-            HciProgrammer.HCI_FLASH_FIRMWARE_BAUDRATE, firmware, chip_erase)
+        if args.programmer == PROGRAMMER_HCI:
+            p = HciDownloader(com_port, preset=preset,
+                              window=args.window, verify=args.verify)
+            p.program_firmware(mini_driver, firmware, chip_erase=chip_erase,
+                               skip_unchanged=args.skip_unchanged, dry_run=args.dry_run, config=config)
+            if args.timing:
+                write_timing(args.timing, [timing_report(com_port, p, firmware)])
+        else:
+            from HciProgrammer import HciProgrammer
+            p = HciProgrammer(mini_driver, com_port,
+                              HciProgrammer.HCI_DEFAULT_BAUDRATE, chip_erase)
+            p.program_firmware(
+                HciProgrammer.HCI_FLASH_FIRMWARE_BAUDRATE, firmware, chip_erase)
     else:
-        boards = If820Board.get_connected_boards()
+        boards = BoardDiscovery().get_connected_boards()
         if len(boards) == 0:
             logging.error("No boards found")
             exit(1)
 
+        if args.all or args.boards:
+            try:
+                boards = select_boards(boards, args.boards)
+            except ValueError as e:
+                logging.error(e)
+                exit(1)
+            if config and len(boards) > 1:
+                logging.error("Configuration updates set per-unit values and can only flash one board")
+                exit(1)
+            timings = []
+            ok = flash_boards(boards, mini_driver, firmware, timings=timings,
+                              programmer=args.programmer, **options)
+            if args.timing:
+                write_timing(args.timing, timings)
+            exit(0 if ok else 1)
+
         choice = 0
         if len(boards) > 1:
             print("Which board do you want to flash?")
@@ -90,4 +370,8 @@ if __name__ == '__main__':
                 print(f"{i}: {board.probe.id}")
             choice = int(input("Enter the number of the board: "))
         board = boards[choice]
-        board.flash_firmware(mini_driver, firmware, chip_erase)
+        _, downloader = flash_board_timed(board, mini_driver, firmware,
+                                          programmer=args.programmer, **options)
+        if args.timing:
+            write_timing(args.timing, [timing_report(
+                board.probe.id, downloader, firmware)])
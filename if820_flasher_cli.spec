@@ -1,7 +1,7 @@
 # -*- mode: python ; coding: utf-8 -*-
 from PyInstaller.utils.hooks import collect_all
 
-datas = [('files/v1.4.16.16_int-ant/minidriver-20820A1-uart-patchram.hex', 'files/v1.4.16.16_int-ant/')]
+datas = [('files', 'files')]
 binaries = []
 hiddenimports = []
 tmp_ret = collect_all('pyocd')
@@ -12,7 +12,7 @@ datas += tmp_ret[0]; binaries += tmp_ret[1]; hiddenimports += tmp_ret[2]
 
 a = Analysis(
     ['if820_flasher_cli.py'],
-    pathex=['common_lib/libraries'],
+    pathex=['common_lib/libraries', 'libraries'],
     binaries=binaries,
     datas=datas,
     hiddenimports=hiddenimports,
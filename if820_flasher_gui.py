@@ -5,18 +5,26 @@ Python GUI for IF820 Firmware Upgrade
 
 pyinstaller command to produce a single executable file:
 
-pyinstaller --clean --windowed --noconfirm  --onefile --add-data "img/IF820_fw_upgrade_header.png:img" --add-data "files/v1.4.16.16_int-ant/minidriver-20820A1-uart-patchram.hex:files/v1.4.16.16_int-ant" --collect-all pyocd  --collect-all cmsis_pack_manager -p common_lib/libraries if820_flasher_gui.py
+pyinstaller --clean --windowed --noconfirm  --onefile --add-data "img/IF820_fw_upgrade_header.png:img" --add-data "files:files" --collect-all pyocd  --collect-all cmsis_pack_manager -p common_lib/libraries -p libraries if820_flasher_gui.py
 
 """
 
 
+import argparse
+import collections
+import queue
 import threading
 import os
+import time
 import wx
 import logging
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
+from BoardDiscovery import BoardDiscovery
+from BtpPreset import BtpPreset
+from FirmwareCatalog import FirmwareCatalog
+from HciDownloader import flash_board, flash_board_common_lib, PROGRAMMER_COMMON_LIB, PROGRAMMER_HCI, PROGRAMMERS
 
 
 LOG_MODULE_HCI_PORT = 'hci_port'
@@ -31,18 +39,125 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+# Log output is added to the GUI in batches this often
+LOG_FLUSH_INTERVAL_MS = 100
+# Lines shown in the log output, older lines are removed
+LOG_DISPLAY_LINES = 2000
+# Lines kept for saving the log
+LOG_HISTORY_LINES = 200000
+
+
 class WxTextCtrlLogHandler(logging.Handler):
-    def __init__(self, ctrl: wx.TextCtrl):
+    """
+    Log handler that shows records in a TextCtrl. Records are queued by the
+    logging threads and added to the control in batches by a timer, so heavy
+    debug logging does not flood the GUI event queue or slow down flashing.
+    """
+
+    def __init__(self, ctrl: wx.TextCtrl, interval_ms: int = LOG_FLUSH_INTERVAL_MS,
+                 max_lines: int = LOG_DISPLAY_LINES, history_lines: int = LOG_HISTORY_LINES):
         logging.Handler.__init__(self)
         self.ctrl = ctrl
+        self.max_lines = max_lines
+        self.lines = 0
+        self.history = collections.deque(maxlen=history_lines)
+        self.queue = queue.SimpleQueue()
+        self.timer = wx.Timer(ctrl)
+        ctrl.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+        self.timer.Start(interval_ms)
 
     def emit(self, record):
-        s = self.format(record) + '\n'
-        wx.CallAfter(self.ctrl.AppendText, s)
+        try:
+            self.queue.put(self.format(record) + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def write(self, text: str):
+        """Queue text to show in order with the log records"""
+        self.queue.put(text)
+
+    def flush_to_ctrl(self):
+        """Add all queued text to the control. Must run on the GUI thread."""
+        batch = []
+        try:
+            while True:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        if not batch:
+            return
+        text = ''.join(batch)
+        self.history.extend(batch)
+        self.ctrl.AppendText(text)
+        self.lines += text.count('\n')
+        excess = self.lines - self.max_lines
+        if excess > 0:
+            self.ctrl.Remove(0, self.ctrl.XYToPosition(0, excess))
+            self.lines -= excess
+
+    def save(self, path: str):
+        """Save the retained log, including lines no longer shown"""
+        self.flush_to_ctrl()
+        with open(path, 'w') as f:
+            f.writelines(self.history)
+
+    def OnTimer(self, event):
+        self.flush_to_ctrl()
+
+    def close(self):
+        self.timer.Stop()
+        logging.Handler.close(self)
 
 
 HEADER_IMG = resource_path(f'img{os.sep}IF820_fw_upgrade_header.png')
 MINIDRIVER = resource_path(f'files{os.sep}v1.4.16.16_int-ant{os.sep}minidriver-20820A1-uart-patchram.hex')
+FIRMWARE_DIR = resource_path('files')
+CUSTOM_FIRMWARE = 'Other file...'
+# Serial ports are polled this often for boards being plugged in or removed
+DISCOVERY_INTERVAL_SECONDS = 2
+# Boards flashed without progress reports are animated this often
+BUSY_INTERVAL_MS = 200
+
+
+class BoardRow:
+    """
+    Controls for one board: a checkbox to queue it, a progress bar and its status.
+    A programmer that reports no progress shows a pulsing bar and the elapsed time.
+    """
+
+    def __init__(self, parent: wx.Window, board: 'If820Board'):
+        self.board = board
+        self.flashing = False
+        self.busy_since = None
+        self.busy_status = ''
+        self.ch_select = wx.CheckBox(parent, label=board.probe.id, size=(180, -1))
+        self.gauge = wx.Gauge(parent, range=100, size=(100, -1))
+        self.st_status = wx.StaticText(parent, label='Ready')
+        self.sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.sizer.Add(self.ch_select, flag=wx.ALIGN_CENTER_VERTICAL)
+        self.sizer.Add(self.gauge, flag=wx.ALIGN_CENTER_VERTICAL | wx.RIGHT, border=10)
+        self.sizer.Add(self.st_status, flag=wx.ALIGN_CENTER_VERTICAL)
+
+    def set_status(self, status: str, percent: int = None):
+        self.busy_since = None
+        self.st_status.SetLabel(status)
+        if percent is not None:
+            self.gauge.SetValue(percent)
+
+    def set_busy(self, status: str):
+        """Show an indeterminate progress bar until the next set_status()."""
+        self.busy_since = time.monotonic()
+        self.busy_status = status
+        self.pulse()
+
+    def pulse(self):
+        if self.busy_since is not None:
+            self.gauge.Pulse()
+            self.st_status.SetLabel(f'{self.busy_status} {time.monotonic() - self.busy_since:.0f}s')
+
+    def destroy(self):
+        for ctrl in (self.ch_select, self.gauge, self.st_status):
+            ctrl.Destroy()
 
 
 class Window(wx.Frame):
@@ -51,8 +166,9 @@ class Window(wx.Frame):
     """
 
     # Initialization for window, panel, gui elements
-    def __init__(self, *args, **kw):
+    def __init__(self, *args, variant: str = None, programmer: str = PROGRAMMER_COMMON_LIB, **kw):
         super(Window, self).__init__(*args, **kw)
+        self.programmer = programmer
 
         # Create a panel for gui elements
         panel = wx.Panel(self)
@@ -67,24 +183,11 @@ class Window(wx.Frame):
         hbox_image.Add(img_header)
         vbox.Add(hbox_image)
 
-        # Find available boards from the system
-        boards = If820Board.get_connected_boards()
-        if len(boards) <= 0:
-            wx.MessageBox('No boards connected.\n\nConnect an IF820 board and try again.',
-                          PROGRAM_TITLE, wx.OK | wx.ICON_ERROR)
-            wx.Exit()
-
-        # Show text and combo box for board selection
-        st_selboard = wx.StaticText(panel, label="Select Board:")
+        # Show text and a list of boards to select. Boards are found in the background.
+        st_selboard = wx.StaticText(panel, label="Select Boards:")
         font = st_selboard.GetFont()
         font = font.Bold()
         st_selboard.SetFont(font)
-        board_list = []
-        self.cb_selboard = wx.ComboBox(
-            panel, style=wx.CB_READONLY, value=boards[0].probe.id, choices=board_list, size=(180, -1))
-        for board in boards:
-            self.cb_selboard.Append(board.probe.id, board)
-        self.cb_selboard.SetSelection(0)
 
         # Add checkbox for chip erase
         self.ch_chiperase = wx.CheckBox(panel, label='Chip erase')
@@ -92,21 +195,49 @@ class Window(wx.Frame):
         # Add GUI elements into a horizontal BoxSizer and add to the main vertical BoxSizer
         hbox_selboard = wx.BoxSizer(wx.HORIZONTAL)
         hbox_selboard.Add(st_selboard, wx.SizerFlags().Border(wx.RIGHT, 10))
-        hbox_selboard.Add(self.cb_selboard)
         hbox_selboard.AddStretchSpacer()
         hbox_selboard.Add(self.ch_chiperase)
         vbox.Add(hbox_selboard, flag=wx.EXPAND | wx.ALL, border=10)
 
-        # Add file picker for firmware selection
+        self.sw_boards = wx.ScrolledWindow(panel, size=(-1, 100), style=wx.BORDER_SUNKEN)
+        self.sw_boards.SetScrollRate(0, 10)
+        self.vbox_boards = wx.BoxSizer(wx.VERTICAL)
+        self.st_noboards = wx.StaticText(self.sw_boards, label="Searching for boards...")
+        self.vbox_boards.Add(self.st_noboards, flag=wx.ALL, border=5)
+        self.sw_boards.SetSizer(self.vbox_boards)
+        vbox.Add(self.sw_boards, flag=wx.EXPAND | wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        self.board_rows = {}
+
+        # Add bundled firmware variants, with a file picker for any other firmware
         st_selfirmware = wx.StaticText(panel, label="Select firmware:")
         font = st_selfirmware.GetFont()
         font = font.Bold()
         st_selfirmware.SetFont(font)
         vbox.Add(st_selfirmware, flag=wx.LEFT | wx.RIGHT, border=10)
+        self.cb_firmware = wx.ComboBox(panel, style=wx.CB_READONLY)
+        catalog = FirmwareCatalog(FIRMWARE_DIR)
+        for release in catalog.find():
+            if release.firmware():
+                self.cb_firmware.Append(
+                    f'{release.variant} (v{release.version})', release)
+        self.cb_firmware.Append(CUSTOM_FIRMWARE, None)
+        selection = 0
+        if variant:
+            try:
+                release = catalog.resolve(variant)
+                selection = self.cb_firmware.FindString(
+                    f'{release.variant} (v{release.version})')
+            except ValueError as e:
+                logging.error(e)
+        self.cb_firmware.SetSelection(max(selection, 0))
+        self.cb_firmware.Bind(wx.EVT_COMBOBOX, self.FirmwareSelectedEvent)
+        vbox.Add(self.cb_firmware, flag=wx.EXPAND |
+                 wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
         self.picker_firmware = wx.FilePickerCtrl(
             panel, message='Select firmware hex file', wildcard='Firmware files (.hex, .hcd)|*.hex;*.hcd')
         vbox.Add(self.picker_firmware, flag=wx.EXPAND |
                  wx.LEFT | wx.RIGHT | wx.BOTTOM, border=10)
+        self.picker_firmware.Enable(self.selected_release() is None)
 
         # Add a log output textctrl
         st_logoutput = wx.StaticText(panel, label="Log output:")
@@ -125,6 +256,8 @@ class Window(wx.Frame):
         # Add buttons to start firmware upgrade and quit
         self.bt_fwupgrade = wx.Button(panel, -1, "Upgrade Firmware")
         self.bt_fwupgrade.Bind(wx.EVT_BUTTON, self.ButtonUpdateFirmwareEvent)
+        bt_savelog = wx.Button(panel, -1, "Save Log...")
+        bt_savelog.Bind(wx.EVT_BUTTON, self.ButtonSaveLogEvent)
         bt_quit = wx.Button(panel, -1, "Quit")
         bt_quit.Bind(wx.EVT_BUTTON, self.OnExit)
 
@@ -132,6 +265,7 @@ class Window(wx.Frame):
         hbox_buttons = wx.BoxSizer(wx.HORIZONTAL)
         hbox_buttons.Add(self.bt_fwupgrade)
         hbox_buttons.AddStretchSpacer()
+        hbox_buttons.Add(bt_savelog, wx.SizerFlags().Border(wx.RIGHT, 10))
         hbox_buttons.Add(bt_quit)
         vbox.Add(hbox_buttons, flag=wx.EXPAND | wx.ALL, border=10)
 
@@ -143,47 +277,196 @@ class Window(wx.Frame):
         self.SetStatusText(f"Version {VERSION}")
 
         # Add a log handler to the root logger to show log messages in the GUI
-        log_handler = WxTextCtrlLogHandler(self.tx_logoutput)
+        self.log_handler = WxTextCtrlLogHandler(self.tx_logoutput)
         formatter = logging.Formatter(LOGGING_FORMAT)
-        log_handler.setFormatter(formatter)
+        self.log_handler.setFormatter(formatter)
         root = logging.getLogger()
-        root.addHandler(log_handler)
+        root.addHandler(self.log_handler)
+
+        # Find boards now and whenever the serial ports change
+        self.jobs = 0
+        self.discovery_stop = threading.Event()
+        self.discovery_thread = threading.Thread(target=self.discover_boards)
+        self.discovery_thread.daemon = True
+        self.discovery_thread.start()
+        self.busy_timer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnBusyTimer, self.busy_timer)
+        self.busy_timer.Start(BUSY_INTERVAL_MS)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def discover_boards(self):
+        """Background task to find connected boards. Enumerating the probes is
+        slow, so BoardDiscovery only does it when the list of serial ports changes.
+        """
+        discovery = BoardDiscovery()
+        found = None
+        while not self.discovery_stop.is_set():
+            if not self.jobs:
+                try:
+                    boards = discovery.get_connected_boards()
+                    ids = [board.probe.id for board in boards]
+                    if found != ids:
+                        found = ids
+                        wx.CallAfter(self.update_boards, boards)
+                except Exception as e:
+                    logging.error(f'Board discovery failed: {e}')
+            self.discovery_stop.wait(DISCOVERY_INTERVAL_SECONDS)
+
+    def update_boards(self, boards: list):
+        """Add rows for new boards and remove the rows of boards that were unplugged.
+        """
+        found = {board.probe.id: board for board in boards}
+        for probe_id in list(self.board_rows):
+            row = self.board_rows[probe_id]
+            if probe_id not in found and not row.flashing:
+                logging.info(f'Board {probe_id} removed')
+                self.vbox_boards.Detach(row.sizer)
+                row.destroy()
+                del self.board_rows[probe_id]
+        for probe_id, board in found.items():
+            if probe_id not in self.board_rows:
+                logging.info(f'Board {probe_id} connected')
+                row = BoardRow(self.sw_boards, board)
+                row.ch_select.Enable(not self.jobs)
+                self.board_rows[probe_id] = row
+                self.vbox_boards.Add(row.sizer, flag=wx.EXPAND | wx.ALL, border=5)
+        if len(self.board_rows) == 1:
+            next(iter(self.board_rows.values())).ch_select.SetValue(True)
+        self.st_noboards.Show(not self.board_rows)
+        self.st_noboards.SetLabel("No boards connected")
+        self.sw_boards.FitInside()
+        self.sw_boards.Layout()
+        self.SetStatusText(f"Version {VERSION} | {len(self.board_rows)} board(s)")
+
+    def selected_release(self):
+        """Get the selected bundled firmware release, or None for a custom file.
+        """
+        return self.cb_firmware.GetClientData(self.cb_firmware.GetSelection())
 
-    def flash_firmware_done(self):
-        """Re-enable GUI elements after firmware upgrade is done.
+    def FirmwareSelectedEvent(self, event):
+        """Firmware combo box event handler.
         """
-        self.bt_fwupgrade.Enable()
-        self.cb_selboard.Enable()
-        self.picker_firmware.Enable()
-        self.ch_chiperase.Enable()
+        self.picker_firmware.Enable(self.selected_release() is None)
 
-    def flash_firmware(self):
-        """Task to flash firmware to the board.
+    def enable_controls(self, enable: bool):
+        """Enable or disable GUI elements while boards are being flashed.
         """
+        self.bt_fwupgrade.Enable(enable)
+        self.cb_firmware.Enable(enable)
+        self.picker_firmware.Enable(enable and self.selected_release() is None)
+        self.ch_chiperase.Enable(enable)
+        for row in self.board_rows.values():
+            row.ch_select.Enable(enable)
+
+    def OnBusyTimer(self, event):
+        for row in self.board_rows.values():
+            row.pulse()
+
+    def flash_firmware_done(self, row: BoardRow, status: str):
+        """Show the result of one board and re-enable the GUI when all boards are done.
+        """
+        row.flashing = False
+        row.set_status(status)
+        self.jobs -= 1
+        if not self.jobs:
+            self.enable_controls(True)
+
+    def flash_firmware(self, row: BoardRow, minidriver: str, firmware: str, chip_erase: bool,
+                       preset: BtpPreset):
+        """Task to flash firmware to one board.
+        """
+        probe_id = row.board.probe.id
+        start = time.monotonic()
+        write_start = None
+        last_percent = -1
+
+        def progress(written: int, total: int):
+            nonlocal write_start, last_percent
+            now = time.monotonic()
+            if write_start is None:
+                write_start = now
+            percent = written * 100 // total if total else 0
+            # Only update the GUI when the percentage changes
+            if percent != last_percent:
+                last_percent = percent
+                rate = written / max(now - write_start, 1e-3) / 1024
+                wx.CallAfter(row.set_status, f'{percent}%  {rate:.1f} KB/s', percent)
+
         try:
-            self.selected_board.flash_firmware(
-                MINIDRIVER, f'{self.picker_firmware.GetTextCtrl().GetValue()}', self.ch_chiperase.GetValue())
+            if self.programmer == PROGRAMMER_HCI:
+                wx.CallAfter(row.set_status, 'Starting...', 0)
+                flash_board(row.board, minidriver, firmware, chip_erase=chip_erase,
+                            progress=progress, preset=preset)
+            else:
+                # common_lib reports no progress
+                wx.CallAfter(row.set_busy, 'Flashing...')
+                flash_board_common_lib(row.board, minidriver, firmware, chip_erase)
+            status = f'Done in {time.monotonic() - start:.1f}s'
+            logging.info(f'[{probe_id}] {status}')
         except Exception as e:
             # Log any error
-            logging.error(e)
-            self.selected_board.cancel_flash_firmware()
-        wx.CallAfter(self.flash_firmware_done)
+            logging.error(f'[{probe_id}] {e}')
+            status = 'Failed'
+        wx.CallAfter(self.flash_firmware_done, row, status)
 
     def ButtonUpdateFirmwareEvent(self, event):
         """Firmware upgrade button event handler.
         """
-        self.bt_fwupgrade.Disable()
-        self.cb_selboard.Disable()
-        self.picker_firmware.Disable()
-        self.ch_chiperase.Disable()
-        self.selected_board = self.cb_selboard.GetClientData(
-            self.cb_selboard.GetSelection())
-        self.tx_logoutput.AppendText(
-            f'\n\nFlashing board {self.selected_board.probe.id}...\n')
-        # Run programming in a separate thread to avoid blocking the GUI
-        thread = threading.Thread(target=self.flash_firmware)
-        thread.daemon = True
-        thread.start()
+        rows = [row for row in self.board_rows.values() if row.ch_select.GetValue()]
+        if not rows:
+            wx.MessageBox('Select at least one board.', PROGRAM_TITLE, wx.OK | wx.ICON_INFORMATION)
+            return
+        release = self.selected_release()
+        if release:
+            minidriver = release.minidriver or MINIDRIVER
+            firmware = release.firmware()
+        else:
+            minidriver = MINIDRIVER
+            firmware = self.picker_firmware.GetTextCtrl().GetValue().strip()
+            if not os.path.isfile(firmware):
+                wx.MessageBox('Select a firmware file.' if not firmware else f'{firmware} not found.',
+                              PROGRAM_TITLE, wx.OK | wx.ICON_INFORMATION)
+                return
+        preset = None
+        if self.programmer == PROGRAMMER_HCI:
+            try:
+                preset = BtpPreset.find(firmware)
+            except (OSError, ValueError) as e:
+                logging.error(f'Invalid download preset: {e}')
+                return
+        self.enable_controls(False)
+        self.jobs = len(rows)
+        self.log_handler.write(
+            f'\n\nFlashing {len(rows)} board(s)...\n')
+        # Run programming in separate threads, one per board, to avoid blocking the GUI
+        for row in rows:
+            row.flashing = True
+            thread = threading.Thread(target=self.flash_firmware, args=(
+                row, minidriver, firmware, self.ch_chiperase.GetValue(), preset))
+            thread.daemon = True
+            thread.start()
+
+    def ButtonSaveLogEvent(self, event):
+        """Save log button event handler.
+        """
+        with wx.FileDialog(self, 'Save log', defaultFile='if820_flasher.log',
+                           wildcard='Log files (*.log;*.txt)|*.log;*.txt',
+                           style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT) as dialog:
+            if dialog.ShowModal() == wx.ID_CANCEL:
+                return
+            try:
+                self.log_handler.save(dialog.GetPath())
+            except OSError as e:
+                logging.error(f'Could not save log: {e}')
+
+    def OnClose(self, event):
+        """Stop board discovery, progress and log updates when the window closes
+        """
+        self.discovery_stop.set()
+        self.busy_timer.Stop()
+        logging.getLogger().removeHandler(self.log_handler)
+        self.log_handler.close()
+        event.Skip()
 
     def OnExit(self, event):
         """Button press event to close the app
@@ -192,12 +475,20 @@ class Window(wx.Frame):
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='if820_flasher_gui')
+    parser.add_argument('-vt', '--variant',
+                        help="preselect the bundled firmware for this variant, for example ext-ant-int-lpo")
+    parser.add_argument('-pg', '--programmer', choices=PROGRAMMERS, default=PROGRAMMER_COMMON_LIB,
+                        help="common_lib: the qualified If820Board/HciProgrammer download. hci: the in-tree "
+                        "HciDownloader (default: common_lib)")
+    args, unknown = parser.parse_known_args()
+
     logging.basicConfig(
         format=LOGGING_FORMAT, level=logging.INFO)
 
     # Create wxPython app, window and show it and start main loop to wait for user interaction
     app = wx.App()
-    frm = Window(None, title=PROGRAM_TITLE,
+    frm = Window(None, variant=args.variant, programmer=args.programmer, title=PROGRAM_TITLE,
                  style=wx.DEFAULT_FRAME_STYLE ^ wx.RESIZE_BORDER, size=(500, 600))
     frm.Show()
     app.MainLoop()
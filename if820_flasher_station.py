@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+IF820 flashing station for production.
+
+Runs until stopped with Ctrl+C. Every IF820 board attached to the PC is
+flashed, started and checked, and the result is appended to a JSON lines file.
+Station status and metrics are served over HTTP on a local TCP port, or on a
+Unix socket:
+
+    curl http://127.0.0.1:8820/status
+    curl http://127.0.0.1:8820/metrics
+    curl --unix-socket /tmp/if820_station.sock http://localhost/metrics
+"""
+
+import argparse
+import http.server
+import json
+import logging
+import os
+import socketserver
+import sys
+import textwrap
+import threading
+sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
+from BtpPreset import BtpPreset
+from FirmwareCatalog import FirmwareCatalog, FIRMWARE_FORMATS
+from FirmwareCheck import parse_version
+from FirmwareImage import load_image
+from FlashStation import FlashStation
+from HciDownloader import HciDownloader, PROGRAMMER_COMMON_LIB, PROGRAMMER_HCI, PROGRAMMERS, VERIFY_MODES
+
+LOG_MODULE_HCI_PORT = 'hci_port'
+VERSION = '2.0.0'
+DEFAULT_LISTEN = '127.0.0.1:8820'
+# USB full speed bulk transfers, less a margin for the other probe traffic
+DEFAULT_USB_BANDWIDTH = 800000
+
+
+def resource_path(relative_path):
+    """ Get absolute path to resource, works for dev and for PyInstaller """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(
+        os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+
+class StatusHandler(http.server.BaseHTTPRequestHandler):
+    """Serves /status and /metrics of the station as JSON.
+    """
+
+    station = None
+
+    def do_GET(self):
+        if self.path == '/status':
+            body = self.station.status()
+        elif self.path == '/metrics':
+            body = self.station.metrics()
+        else:
+            self.send_error(404)
+            return
+        data = json.dumps(body, indent=1).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        logging.debug(f'HTTP {self.address_string()} {format % args}')
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+if hasattr(socketserver, 'UnixStreamServer'):
+    class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+
+def start_status_server(station: FlashStation, listen: str) -> socketserver.BaseServer:
+    """Serve the station status on host:port, or on a Unix socket if listen is a path."""
+    StatusHandler.station = station
+    if os.sep in listen:
+        if os.path.exists(listen):
+            os.remove(listen)
+        server = ThreadingUnixHTTPServer(listen, StatusHandler)
+    else:
+        host, port = listen.rsplit(':', 1)
+        server = ThreadingHTTPServer((host, int(port)), StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f'Status on {listen}')
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='if820_flasher_station',
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     description=textwrap.dedent('''\
+        Production station that flashes every IF820 board attached to the PC.
+        Each board is flashed once per attach, then started and checked with
+        CMD_QUERY_FW and CMD_GET_BT_ADDR.
+                                        '''))
+    parser.add_argument('-f', '--file',
+                        help="application hex file to flash. Its name must contain the version, for example "
+                        "v1.4.16.16, unless --expected_version or --no_check is given")
+    parser.add_argument('-ev', '--expected_version',
+                        help="application version the boards must report after flashing, for example "
+                        "1.4.16.16. Defaults to the version in the firmware file name")
+    parser.add_argument('-vt', '--variant',
+                        help="flash the bundled firmware for this variant, for example ext-ant-int-lpo")
+    parser.add_argument('-fv', '--fw_version',
+                        help="bundled firmware version to flash. Defaults to the newest")
+    parser.add_argument('-ff', '--fw_format', choices=FIRMWARE_FORMATS, default=FIRMWARE_FORMATS[0],
+                        help="bundled firmware file format to flash (default: hex)")
+    parser.add_argument('-pg', '--programmer', choices=PROGRAMMERS, default=PROGRAMMER_COMMON_LIB,
+                        help="common_lib: the qualified If820Board/HciProgrammer download. hci: the in-tree "
+                        "HciDownloader, required by --preset and --verify (default: common_lib)")
+    parser.add_argument('-p', '--preset',
+                        help="download preset (.btp) file. Defaults to the .btp file next to the firmware")
+    parser.add_argument('-ce', '--chip_erase', action='store_true',
+                        help="perform full chip erase.")
+    parser.add_argument('-vm', '--verify', choices=VERIFY_MODES,
+                        help="verify mode. Defaults to readback if the preset asks for verification, otherwise none. "
+                        "crc is experimental: it assumes the minidriver returns a CRC-32, not confirmed on hardware")
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help="most boards to flash at the same time (default: 8)")
+    parser.add_argument('-ub', '--usb_bandwidth', type=int, default=DEFAULT_USB_BANDWIDTH,
+                        help="USB bytes per second available for flashing, limits the boards "
+                        f"flashed at the same time (default: {DEFAULT_USB_BANDWIDTH})")
+    parser.add_argument('-nc', '--no_check', action='store_true',
+                        help="do not start and check the boards after flashing")
+    parser.add_argument('-i', '--interval', type=float, default=2.0,
+                        help="seconds between checks for attached boards (default: 2)")
+    parser.add_argument('-r', '--results', default='station_results.jsonl',
+                        help="JSON lines file to append the result of each board to")
+    parser.add_argument('-l', '--listen', default=DEFAULT_LISTEN,
+                        help=f"host:port or Unix socket path to serve status on (default: {DEFAULT_LISTEN})")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    parser.add_argument('-v', '--version', action='store_true',
+                        help="Print the version of the tool and exit.")
+
+    logging.basicConfig(
+        format='%(asctime)s | %(levelname)s | %(message)s', level=logging.INFO)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.info("Debugging mode enabled")
+        logging.getLogger().setLevel(logging.DEBUG)
+        logging.getLogger(LOG_MODULE_HCI_PORT).setLevel(logging.DEBUG)
+
+    if args.version:
+        print(f"{VERSION}")
+        exit(0)
+
+    mini_driver = resource_path(
+        f'files{os.sep}v1.4.16.16_int-ant{os.sep}minidriver-20820A1-uart-patchram.hex')
+    firmware = args.file
+    if args.variant or args.fw_version or not firmware:
+        if firmware:
+            logging.error("--file cannot be used with --variant or --fw_version")
+            exit(1)
+        try:
+            release = FirmwareCatalog(resource_path('files')).resolve(args.variant, args.fw_version)
+        except ValueError as e:
+            logging.error(e)
+            exit(1)
+        logging.info(f"Firmware {release.variant} v{release.version} ({release.date})")
+        firmware = release.firmware(args.fw_format)
+        mini_driver = release.minidriver or mini_driver
+        if not firmware:
+            logging.error(f"No {args.fw_format} firmware for {release.variant} v{release.version}")
+            exit(1)
+
+    hci_options = [name for name, value in (('--preset', args.preset), ('--verify', args.verify)) if value]
+    if args.programmer != PROGRAMMER_HCI and hci_options:
+        logging.error(f"{', '.join(hci_options)} require --programmer {PROGRAMMER_HCI}")
+        exit(1)
+
+    try:
+        load_image(firmware)
+        # The preset sets the download baud rate, which limits the boards flashed at once
+        if args.preset:
+            preset = BtpPreset.load(args.preset)
+        else:
+            preset = BtpPreset.find(firmware)
+        expected_version = parse_version(args.expected_version) if args.expected_version else None
+    except (OSError, ValueError) as e:
+        logging.error(e)
+        exit(1)
+
+    baudrate = preset.minidriver_rebaud_rate if preset and preset.minidriver_rebaud_rate \
+        else HciDownloader.HCI_DEFAULT_BAUDRATE
+    workers = FlashStation.usb_workers(args.jobs, args.usb_bandwidth, baudrate)
+    options = dict(chip_erase=args.chip_erase)
+    if args.programmer == PROGRAMMER_HCI:
+        options.update(preset=preset, verify=args.verify)
+    try:
+        station = FlashStation(mini_driver, firmware, workers=workers, results_file=args.results,
+                               poll_interval=args.interval, check=not args.no_check,
+                               expected_version=expected_version, programmer=args.programmer, **options)
+    except ValueError as e:
+        logging.error(f"{e}. Give the version with --expected_version, or --no_check")
+        exit(1)
+    server = start_status_server(station, args.listen)
+    station.start()
+    try:
+        while not station.stop_event.wait(1):
+            pass
+    except KeyboardInterrupt:
+        logging.info('Stopping after the boards being flashed are done...')
+    station.stop()
+    server.shutdown()
+    metrics = station.metrics()
+    print(f"\n{metrics['boards_passed']} passed, {metrics['boards_failed']} failed, "
+          f"{metrics['units_per_hour']} units per hour")
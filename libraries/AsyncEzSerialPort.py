@@ -0,0 +1,393 @@
+"""
+asyncio interface to EZ-Serial.
+
+The serial port is non-blocking and registered with the event loop, so one
+thread can drive many boards:
+
+    async with AsyncIf820Board(board) as b:
+        err, rsp = await b.p_uart.send_and_wait(CMD_GET_BT_ADDR)
+        async for packet in b.p_uart.events(EVENT_GAP_SCAN_RESULT):
+            ...
+
+Where the port cannot be registered with the event loop, it is read on a
+thread instead: on Windows, where serial ports have no file descriptor, and
+with event loops without add_reader().
+
+Results are returned as (error, packet) like EzSerialPort: the error is the
+response result code, 0 for an event, or TIMEOUT_ERROR.
+
+Commands can be pipelined, sending the next ones before the responses to
+the first have arrived. Responses are matched to the commands by command
+and order:
+
+    async with port.batch(stop_on_error=True) as batch:
+        attr = batch.add(CMD_GATTS_CREATE_ATTR, type=..., perm=..., length=..., data=...)
+        batch.add(CMD_GAP_SET_ADV_DATA, data=...)
+        batch.add(CMD_GAP_START_ADV, mode=...)
+    if not batch.ok:
+        ...
+    handle = batch.response(attr).payload.handle
+"""
+
+import asyncio
+import collections
+import io
+import logging
+import os
+import serial
+from EzSerialApi import EVENT_SYSTEM_BOOT, EzSerialApiMode
+from EzSerialDispatcher import AsyncEventDispatcher, DEFAULT_QUEUE_SIZE
+import EzSerialBinary
+import EzSerialText
+
+DEFAULT_BAUDRATE = 115200
+DEFAULT_TIMEOUT = 1.0
+BOOT_TIMEOUT = 5.0
+TIMEOUT_ERROR = -1
+READ_SIZE = 4096
+# Raw data chunks kept while nothing reads them
+RAW_QUEUE_SIZE = 1024
+# Most pipelined commands without a response, so the module's receive buffer does not overflow
+BATCH_WINDOW = 8
+
+
+class CommandBatch:
+    """Commands to send pipelined when the with block ends.
+    """
+
+    def __init__(self, port: 'AsyncEzSerialPort', stop_on_error: bool, timeout: float, window: int):
+        self.port = port
+        self.stop_on_error = stop_on_error
+        self.timeout = timeout
+        self.window = window
+        self.commands = []
+        self.results = []
+
+    def add(self, command: str, **kwargs) -> int:
+        """Add a command to the batch.
+
+        Returns:
+            int: index of the command, to get its response with response()
+        """
+        self.commands.append((command, kwargs))
+        return len(self.commands) - 1
+
+    def response(self, index: int):
+        """Response to a command of the batch, once it has been sent.
+
+        Args:
+            index (int): index returned by add()
+
+        Returns:
+            Packet: the response, or None if the command was not sent or got no response
+        """
+        return self.results[index][1] if index < len(self.results) else None
+
+    @property
+    def ok(self) -> bool:
+        """True if every command was sent and succeeded."""
+        return len(self.results) == len(self.commands) and not any(err for err, _ in self.results)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.results = await self.port.send_batch(self.commands, self.stop_on_error,
+                                                      self.timeout, self.window)
+
+
+class AsyncEzSerialPort:
+    """EZ-Serial over a serial port, for asyncio.
+    """
+
+    def __init__(self, api_mode: EzSerialApiMode = EzSerialApiMode.TEXT, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """Create a port.
+
+        Args:
+            api_mode (EzSerialApiMode, optional): API format of the module. Defaults to TEXT.
+            queue_size (int, optional): most packets queued for each response and event type.
+            Defaults to DEFAULT_QUEUE_SIZE.
+        """
+        self.dispatcher = AsyncEventDispatcher(queue_size)
+        self.serial = None
+        self.loop = None
+        self.reader_thread = None
+        self.raw = False
+        self.raw_data = collections.deque(maxlen=RAW_QUEUE_SIZE)
+        self.raw_event = asyncio.Event()
+        self.tx = bytearray()
+        self.tx_done = None
+        self.set_api_format(api_mode)
+
+    def set_api_format(self, api_mode: EzSerialApiMode):
+        """Set the API format the module uses."""
+        self.api_mode = api_mode
+        self.codec = EzSerialBinary if api_mode == EzSerialApiMode.BINARY else EzSerialText
+        self.decoder = EzSerialBinary.BinaryDecoder() if api_mode == EzSerialApiMode.BINARY \
+            else EzSerialText.TextDecoder()
+
+    def set_raw(self, raw: bool):
+        """Pass received data through as is instead of decoding it, for example
+        while a CYSPP or SPP connection is open."""
+        self.raw = raw
+        self.decoder.reset()
+
+    async def open(self, port_name: str, baudrate: int = DEFAULT_BAUDRATE, rtscts: bool = True):
+        """Open the serial port and start receiving."""
+        self.loop = asyncio.get_running_loop()
+        self.serial = await self.loop.run_in_executor(
+            None, lambda: serial.Serial(port_name, baudrate, rtscts=rtscts, timeout=0, write_timeout=0))
+        try:
+            if not self._add_reader():
+                self.reader_thread = self.loop.run_in_executor(None, self._read_thread)
+        except BaseException:
+            self.serial.close()
+            self.serial = None
+            raise
+
+    def _add_reader(self) -> bool:
+        """Register the port with the event loop.
+
+        Returns:
+            bool: False if the port has no file descriptor or the loop cannot watch it
+        """
+        if os.name == 'nt':
+            return False
+        try:
+            self.loop.add_reader(self.serial.fileno(), self._on_readable)
+        except (NotImplementedError, AttributeError, io.UnsupportedOperation):
+            return False
+        return True
+
+    def close(self):
+        if self.serial is None:
+            return
+        if self.reader_thread is None:
+            self.loop.remove_reader(self.serial.fileno())
+            self.loop.remove_writer(self.serial.fileno())
+        if self.tx_done and not self.tx_done.done():
+            self.tx_done.cancel()
+        self.tx.clear()
+        self.serial.close()
+        self.serial = None
+        self.reader_thread = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.serial.fileno(), READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.error(f'{self.serial.port} read failed: {e}')
+            self.loop.remove_reader(self.serial.fileno())
+            return
+        self._received(data)
+
+    def _read_thread(self):
+        port = self.serial
+        port.timeout = 0.1
+        while port.is_open:
+            try:
+                data = port.read(max(1, port.in_waiting))
+            except serial.SerialException:
+                return
+            if data:
+                self.loop.call_soon_threadsafe(self._received, data)
+
+    def _received(self, data: bytes):
+        if self.raw:
+            self.raw_data.append(data)
+            self.raw_event.set()
+        else:
+            self.dispatcher.dispatch_all(self.decoder.feed(data))
+
+    def _on_writable(self):
+        try:
+            n = os.write(self.serial.fileno(), self.tx)
+        except BlockingIOError:
+            return
+        del self.tx[:n]
+        if not self.tx:
+            self.loop.remove_writer(self.serial.fileno())
+            self.tx_done.set_result(None)
+
+    async def send(self, data: bytes):
+        """Write data, waiting until the port has taken all of it."""
+        if self.reader_thread is not None:
+            await self.loop.run_in_executor(None, self._write_blocking, data)
+            return
+        if self.tx:
+            # Queue behind a write that is still waiting for the port
+            self.tx += data
+            await asyncio.shield(self.tx_done)
+            return
+        try:
+            n = os.write(self.serial.fileno(), data)
+        except BlockingIOError:
+            n = 0
+        if n < len(data):
+            self.tx += data[n:]
+            self.tx_done = self.loop.create_future()
+            self.loop.add_writer(self.serial.fileno(), self._on_writable)
+            await asyncio.shield(self.tx_done)
+
+    def _write_blocking(self, data: bytes):
+        self.serial.write_timeout = None
+        self.serial.write(data)
+
+    async def send_command(self, command: str, **kwargs):
+        """Send a command without waiting for its response."""
+        await self.send(self.codec.encode_command(command, **kwargs))
+
+    async def send_and_wait(self, command: str, apiformat: EzSerialApiMode = None,
+                            response_timeout: float = DEFAULT_TIMEOUT, **kwargs) -> tuple:
+        """Send a command and wait for its response.
+
+        Args:
+            command (str): command name, for example CMD_PING
+            apiformat (EzSerialApiMode, optional): API format to switch to after sending, for
+            commands that change it. Defaults to None.
+            response_timeout (float, optional): seconds to wait. Not named timeout, which is
+            a parameter of gap_start_scan. Defaults to DEFAULT_TIMEOUT.
+            kwargs: command parameters
+
+        Returns:
+            tuple: (error, response packet)
+        """
+        self.dispatcher.clear(command)
+        await self.send_command(command, **kwargs)
+        if apiformat is not None:
+            self.set_api_format(apiformat)
+        packet = await self.dispatcher.wait_response(command, response_timeout)
+        if packet is None:
+            return TIMEOUT_ERROR, None
+        return packet.payload.result, packet
+
+    async def send_batch(self, commands: list, stop_on_error: bool = False, timeout: float = DEFAULT_TIMEOUT,
+                         window: int = BATCH_WINDOW) -> list:
+        """Send commands pipelined and wait for their responses.
+
+        Args:
+            commands (list): (command, parameters dict) tuples
+            stop_on_error (bool, optional): send no more commands after one fails. Up to
+            window - 1 commands after it have already been sent, and the module still runs
+            them; their results are returned too. Defaults to False.
+            timeout (float, optional): seconds to wait for each response. A timeout always
+            stops the batch. Defaults to DEFAULT_TIMEOUT.
+            window (int, optional): most commands waiting for a response. Defaults to BATCH_WINDOW.
+
+        Returns:
+            list: (error, response packet) for each command sent, in order
+        """
+        for command, _ in commands:
+            self.dispatcher.clear(command)
+        results = []
+        sent = 0
+        stop = False
+        while len(results) < len(commands) and not (stop and len(results) == sent):
+            if not stop and sent < len(commands) and sent - len(results) < window:
+                # Send all the window allows in one write
+                end = min(len(commands), len(results) + window)
+                await self.send(b''.join(self.codec.encode_command(command, **kwargs)
+                                         for command, kwargs in commands[sent:end]))
+                sent = end
+            command, _ = commands[len(results)]
+            packet = await self.dispatcher.wait_response(command, timeout)
+            if packet is None:
+                logging.error(f'No response to {command}')
+                results.append((TIMEOUT_ERROR, None))
+                # Responses to the other commands sent are not waited for
+                break
+            results.append((packet.payload.result, packet))
+            if packet.payload.result and stop_on_error:
+                stop = True
+        return results
+
+    def batch(self, stop_on_error: bool = False, timeout: float = DEFAULT_TIMEOUT,
+              window: int = BATCH_WINDOW) -> CommandBatch:
+        """Collect commands in a with block and send them pipelined when it ends,
+        see send_batch(). The results are in the batch's results."""
+        return CommandBatch(self, stop_on_error, timeout, window)
+
+    async def wait_event(self, event: str, timeout: float = DEFAULT_TIMEOUT, predicate=None, **fields) -> tuple:
+        """Wait for an event, see EventDispatcher.wait_event().
+
+        Returns:
+            tuple: (error, event packet)
+        """
+        packet = await self.dispatcher.wait_event(event, timeout, predicate, **fields)
+        if packet is None:
+            return TIMEOUT_ERROR, None
+        return 0, packet
+
+    def events(self, event: str, predicate=None, **fields):
+        """Iterate over the matching events as they arrive."""
+        return self.dispatcher.events(event, predicate, **fields)
+
+    def subscribe(self, event: str, callback, predicate=None, consume: bool = False, **fields):
+        """Call a function for each matching event, see EventDispatcher.subscribe()."""
+        return self.dispatcher.subscribe(event, callback, predicate, consume, **fields)
+
+    async def read(self) -> bytes:
+        """Wait for raw data, see set_raw()."""
+        while not self.raw_data:
+            self.raw_event.clear()
+            await self.raw_event.wait()
+        return self.raw_data.popleft()
+
+    async def data(self):
+        """Iterate over raw data as it arrives, see set_raw()."""
+        while True:
+            yield await self.read()
+
+
+class AsyncIf820Board:
+    """Opens an If820Board's PUART for asyncio and resets the module.
+    """
+
+    def __init__(self, board, api_mode: EzSerialApiMode = EzSerialApiMode.TEXT,
+                 baudrate: int = DEFAULT_BAUDRATE, wait_for_boot: bool = True):
+        """Create the board.
+
+        Args:
+            board: If820Board, for example from BoardDiscovery
+            api_mode (EzSerialApiMode, optional): API format of the module. Defaults to TEXT.
+            baudrate (int, optional): PUART baud rate. Defaults to DEFAULT_BAUDRATE.
+            wait_for_boot (bool, optional): reset the module and wait for it to boot
+            when entered. Defaults to True.
+        """
+        self.board = board
+        self.baudrate = baudrate
+        self.wait_for_boot = wait_for_boot
+        self.p_uart = AsyncEzSerialPort(api_mode)
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        await self.p_uart.open(self.board.puart_port_name, self.baudrate)
+        if self.wait_for_boot:
+            try:
+                await loop.run_in_executor(None, self._reset)
+                err, _ = await self.p_uart.wait_event(EVENT_SYSTEM_BOOT, BOOT_TIMEOUT)
+                if err:
+                    raise RuntimeError(f'{self.board.probe.id} did not boot')
+            except BaseException:
+                self.p_uart.close()
+                raise
+        return self
+
+    async def __aexit__(self, *exc):
+        self.p_uart.close()
+
+    def _reset(self):
+        self.board.probe.open()
+        try:
+            self.board.probe.reset_target()
+        finally:
+            self.board.probe.close()
@@ -0,0 +1,217 @@
+"""
+Board discovery with a persistent cache.
+
+If820Board.get_connected_boards() enumerates every pyocd probe and matches
+the serial ports to them, which takes seconds. The probe IDs, USB serial
+numbers and port names it finds are saved, keyed by the serial ports that
+were present. While the same ports are present the cached boards are returned
+without enumerating. A cached board is created by the real enumeration the
+first time anything other than its probe ID or port names is used. Whether
+it is initialized is answered without enumerating, it is not until used.
+
+Can be used as a Robot Framework library.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from FirmwareImage import CACHE_DIR
+
+DISCOVERY_CACHE_FILE = os.path.join(CACHE_DIR, 'discovery.json')
+
+
+def _port_fingerprint() -> list:
+    """Serial ports present and the USB serial number of each."""
+    from serial.tools import list_ports
+    return sorted([p.device, p.serial_number or ''] for p in list_ports.comports())
+
+
+class _CachedProbe:
+    """Probe of a cached board. The ID is known, anything else comes from the real probe."""
+
+    def __init__(self, board: 'CachedBoard', probe_id: str):
+        self._board = board
+        self.id = probe_id
+
+    def __getattr__(self, name: str):
+        return getattr(self._board.board.probe, name)
+
+
+class CachedBoard:
+    """Board found in the discovery cache. Stands in for If820Board.
+    """
+
+    def __init__(self, discovery: 'BoardDiscovery', entry: dict):
+        self._discovery = discovery
+        self._board = None
+        self.probe = _CachedProbe(self, entry['probe_id'])
+        self.usb_serial = entry['usb_serial']
+        self.puart_port_name = entry['puart_port_name']
+        self.hci_port_name = entry['hci_port_name']
+
+    @property
+    def board(self):
+        """The If820Board, enumerating the boards on first use."""
+        if self._board is None:
+            self._board = self._discovery.resolve(self.probe.id)
+        return self._board
+
+    @property
+    def is_initialized(self) -> bool:
+        """False until the board has been created, without enumerating."""
+        board = self._board or BoardDiscovery._boards.get(self.probe.id)
+        return board is not None and board.is_initialized
+
+    def __getattr__(self, name: str):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.board, name)
+
+
+class BoardDiscovery:
+    """Find connected IF820 boards, enumerating only when the serial ports change.
+    """
+
+    ROBOT_LIBRARY_SCOPE = 'GLOBAL'
+    POLL_INTERVAL_SECONDS = 0.05
+
+    # Boards enumerated by this process, shared by all instances
+    _boards = {}
+    _fingerprint = None
+    # Held while enumerating, so threads do not enumerate at the same time
+    _lock = threading.Lock()
+
+    def __init__(self, cache_file: str = DISCOVERY_CACHE_FILE):
+        self.cache_file = cache_file
+
+    def _load(self) -> dict:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f'Ignoring board discovery cache: {e}')
+            return None
+
+    def _save(self, fingerprint: list, boards: list):
+        entries = [{'probe_id': b.probe.id,
+                    'usb_serial': self._usb_serial(fingerprint, b.puart_port_name),
+                    'puart_port_name': b.puart_port_name,
+                    'hci_port_name': b.hci_port_name} for b in boards]
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(self.cache_file, 'w') as f:
+                json.dump({'ports': fingerprint, 'boards': entries}, f, indent=1)
+        except OSError as e:
+            logging.warning(f'Unable to save board discovery cache: {e}')
+
+    @staticmethod
+    def _usb_serial(fingerprint: list, device: str) -> str:
+        return next((serial for port, serial in fingerprint if port == device), '')
+
+    @staticmethod
+    def _nodes_exist(cache: dict) -> bool:
+        """Quick check that the cached ports still exist, where ports are device files."""
+        if os.name != 'posix':
+            return True
+        return all(os.path.exists(port) for port, _ in cache['ports'])
+
+    def _enumerate(self, fingerprint: list) -> list:
+        """Enumerate the boards. Called with _lock held."""
+        from If820Board import If820Board
+        start = time.monotonic()
+        boards = If820Board.get_connected_boards()
+        logging.debug(f'Enumerated {len(boards)} board(s) in {time.monotonic() - start:.1f}s')
+        BoardDiscovery._boards = {b.probe.id: b for b in boards}
+        BoardDiscovery._fingerprint = fingerprint
+        self._save(fingerprint, boards)
+        return boards
+
+    def resolve(self, probe_id: str):
+        """Get the If820Board for a probe ID, enumerating the boards if needed.
+
+        Raises:
+            LookupError: if the board is no longer connected
+        """
+        if probe_id not in BoardDiscovery._boards:
+            with BoardDiscovery._lock:
+                # Another thread may have enumerated while this one waited
+                if probe_id not in BoardDiscovery._boards:
+                    self._enumerate(_port_fingerprint())
+        try:
+            return BoardDiscovery._boards[probe_id]
+        except KeyError:
+            raise LookupError(f'Board {probe_id} is no longer connected') from None
+
+    def ports_changed(self) -> bool:
+        """Check if the serial ports changed since this process last enumerated."""
+        return _port_fingerprint() != BoardDiscovery._fingerprint
+
+    def get_connected_boards(self, refresh: bool = False) -> list:
+        """Get the connected boards. Only enumerates if the serial ports changed
+        since the last enumeration or if asked to.
+
+        Args:
+            refresh (bool, optional): always enumerate. Defaults to False.
+
+        Returns:
+            list: If820Board, or CachedBoard from the cache of another process
+        """
+        fingerprint = _port_fingerprint()
+        if not refresh and fingerprint == BoardDiscovery._fingerprint:
+            return list(BoardDiscovery._boards.values())
+        cache = None if refresh else self._load()
+        if cache and self._nodes_exist(cache) and cache['ports'] == fingerprint:
+            boards = [CachedBoard(self, entry) for entry in cache['boards']]
+            if boards:
+                return boards
+        with BoardDiscovery._lock:
+            if not refresh and fingerprint == BoardDiscovery._fingerprint:
+                return list(BoardDiscovery._boards.values())
+            return self._enumerate(fingerprint)
+
+    def get_board(self):
+        """Get the first connected board, like If820Board.get_board().
+
+        Raises:
+            LookupError: if no boards are connected
+        """
+        boards = self.get_connected_boards()
+        if not boards:
+            raise LookupError('No IF820 boards found')
+        return boards[0]
+
+    def wait_for_boards(self, timeout: float) -> bool:
+        """Wait for the cached boards' ports to be present, for example after a reset.
+        Waits the whole timeout if nothing is cached.
+
+        Args:
+            timeout (float): seconds to wait
+
+        Returns:
+            bool: True if the cached ports are present
+        """
+        timeout = float(timeout)
+        cache = self._load()
+        deadline = time.monotonic() + timeout
+        while cache and cache['boards']:
+            if self._nodes_exist(cache) and _port_fingerprint() == cache['ports']:
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(self.POLL_INTERVAL_SECONDS)
+        time.sleep(timeout)
+        return False
+
+    def clear_cache(self):
+        """Forget all discovered boards."""
+        with BoardDiscovery._lock:
+            BoardDiscovery._boards = {}
+            BoardDiscovery._fingerprint = None
+        try:
+            os.remove(self.cache_file)
+        except FileNotFoundError:
+            pass
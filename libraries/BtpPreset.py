@@ -0,0 +1,133 @@
+"""
+Parser for the download presets (.btp) shipped with each firmware build.
+
+A .btp file holds one DevicePreset block of "Key = value" lines:
+
+    DevicePreset "20819A1 Serial Flash (4K pages)"
+    {
+        DLMaxWriteSize = 240
+        DLWriteVerifyMode = "Write and verify"
+        ...
+    }
+"""
+
+import glob
+import os
+import re
+
+BTP_BLOCK = re.compile(r'DevicePreset\s+"(?P<name>[^"]*)"\s*\{(?P<body>[^}]*)\}')
+BTP_LINE = re.compile(r'^\s*(?P<key>\w+)\s*=\s*(?P<value>.*?)\s*$')
+BTP_PAGE_SIZE = re.compile(r'\((?P<size>\d+)K pages\)')
+BTP_VERIFY_MODE = 'Write and verify'
+
+
+class BtpPreset:
+    """Download parameters from a .btp preset file.
+    """
+
+    DEFAULT_MINIDRIVER_REBAUD_RATE = 3000000
+    DEFAULT_MAX_WRITE_SIZE = 240
+    DEFAULT_POST_RESET_DELAY_MS = 100
+    DEFAULT_PAGE_SIZE = 4096
+
+    def __init__(self, name: str, params: dict, path: str = ''):
+        """Create a preset.
+
+        Args:
+            name (str): preset name
+            params (dict): preset parameters
+            path (str, optional): file the preset was loaded from. Defaults to ''.
+        """
+        self.name = name
+        self.params = params
+        self.path = path
+
+    def __repr__(self):
+        return f'BtpPreset("{self.name}", rebaud={self.minidriver_rebaud_rate}, max_write={self.max_write_size})'
+
+    def get(self, key: str, default=None):
+        """Get a raw parameter value."""
+        return self.params.get(key, default)
+
+    @property
+    def minidriver_rebaud_rate(self) -> int:
+        """Baud rate to switch to once the minidriver is running."""
+        return self.get('MinidriverRebaudRate', self.DEFAULT_MINIDRIVER_REBAUD_RATE)
+
+    @property
+    def max_write_size(self) -> int:
+        """Maximum data bytes per write command."""
+        return self.get('DLMaxWriteSize', self.DEFAULT_MAX_WRITE_SIZE)
+
+    @property
+    def write_verify_mode(self) -> str:
+        """Write verify mode, for example "Write and verify"."""
+        return self.get('DLWriteVerifyMode', '')
+
+    @property
+    def verify(self) -> bool:
+        """True if written data should be verified."""
+        return self.write_verify_mode == BTP_VERIFY_MODE
+
+    @property
+    def post_reset_delay_ms(self) -> int:
+        """Delay after a reset or launch before the target accepts commands."""
+        return self.get('DLPostResetDelay_ms', self.DEFAULT_POST_RESET_DELAY_MS)
+
+    @property
+    def page_size(self) -> int:
+        """Serial flash page size, from the preset name."""
+        m = BTP_PAGE_SIZE.search(self.name)
+        return int(m.group('size')) * 1024 if m else self.DEFAULT_PAGE_SIZE
+
+    @staticmethod
+    def parse(text: str, path: str = '') -> 'BtpPreset':
+        """Parse the text of a .btp file.
+
+        Args:
+            text (str): file contents
+            path (str, optional): file path, for error messages. Defaults to ''.
+
+        Returns:
+            BtpPreset: parsed preset
+        """
+        m = BTP_BLOCK.search(text)
+        if not m:
+            raise ValueError(f'{path}: no DevicePreset found')
+        params = {}
+        for line in m.group('body').splitlines():
+            kv = BTP_LINE.match(line)
+            if kv:
+                params[kv.group('key')] = _parse_value(kv.group('value'))
+        return BtpPreset(m.group('name'), params, path)
+
+    @staticmethod
+    def load(path: str) -> 'BtpPreset':
+        """Load a .btp file."""
+        with open(path, 'r') as f:
+            return BtpPreset.parse(f.read(), path)
+
+    @staticmethod
+    def find(file_path: str) -> 'BtpPreset':
+        """Load the preset that ships next to a firmware or minidriver file.
+
+        Args:
+            file_path (str): firmware file path
+
+        Returns:
+            BtpPreset: preset, or None if there is no .btp file in the same directory
+        """
+        presets = sorted(glob.glob(os.path.join(
+            os.path.dirname(os.path.abspath(file_path)), '*.btp')))
+        if not presets:
+            return None
+        return BtpPreset.load(presets[0])
+
+
+def _parse_value(value: str):
+    if value.startswith('"') and value.endswith('"'):
+        return value[1:-1]
+    try:
+        return int(value, 0)
+    except ValueError:
+        return value
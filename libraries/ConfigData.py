@@ -0,0 +1,145 @@
+"""
+Per-unit configuration of a firmware image.
+
+The firmware holds two configuration sections in serial flash: the static
+section (SS, "BRCMcfgS") with the BD address, and the config data section
+(DS, "BRCMcfgD") that starts with the local name and continues with the
+patches. Each starts with a 16 byte header (magic, reserved, length) followed
+by entries of a 16-bit tag, an 8-bit length and the data.
+
+config_image() patches these entries in place in a base image, so per-unit
+settings can be programmed with the firmware. Writing only the SS and DS
+records is not possible: NOR flash must be erased before it is rewritten, the
+sections share flash sectors with the rest of the image, and the minidriver
+can only erase the whole chip. The patched image is therefore written in full
+after a chip erase, which takes as long as a normal download.
+
+Only the entries below can be changed. Other .cgs entries, for example the LPO
+settings, are compiled by the SDK tools from the chip's .hdf definitions.
+"""
+
+import re
+import struct
+from FirmwareImage import FirmwareImage, merge_segments
+
+CONFIG_HEADER = struct.Struct('<8sII')
+CONFIG_ENTRY = struct.Struct('<HB')
+SS_MAGIC = b'BRCMcfgS'
+DS_MAGIC = b'BRCMcfgD'
+
+TAG_BD_ADDRESS = 0x0300
+TAG_LOCAL_NAME = 0x0303
+TAG_END = 0x00FE
+
+CGS_ENTRY = re.compile(r'ENTRY\s+"(?P<entry>[^"]+)"\s*\{(?P<body>[^}]*)\}')
+CGS_FIELD = re.compile(r'"(?P<field>[^"]+)"\s*=\s*(?P<value>"[^"]*"|[^\s]+)')
+BD_ADDRESS = re.compile(r'^[0-9a-fA-F]{2}([:-]?[0-9a-fA-F]{2}){5}$')
+
+
+def find_section(image: FirmwareImage, magic: bytes) -> tuple:
+    """Find a configuration section.
+
+    Returns:
+        tuple: (address, data) from the section header to the end of its segment,
+        or None if the image has no such section
+    """
+    for address, data in image.segments:
+        offset = bytes(data).find(magic)
+        if offset >= 0:
+            return address + offset, data[offset:]
+    return None
+
+
+def find_entry(section: tuple, tag: int) -> tuple:
+    """Find an entry of a configuration section. Entries are followed from the
+    header, so only the entries before the patches in the DS can be found.
+
+    Args:
+        section (tuple): (address, data) from find_section()
+        tag (int): entry tag
+
+    Returns:
+        tuple: (address, length) of the entry data, or None if not found
+    """
+    address, data = section
+    offset = CONFIG_HEADER.size
+    while offset + CONFIG_ENTRY.size <= len(data):
+        t, length = CONFIG_ENTRY.unpack_from(data, offset)
+        offset += CONFIG_ENTRY.size
+        if offset + length > len(data):
+            return None
+        if t == tag:
+            return address + offset, length
+        if t == TAG_END:
+            return None
+        offset += length
+    return None
+
+
+def parse_bd_address(address: str) -> bytes:
+    """Convert a BD address such as 00:16:A4:12:34:56 to flash byte order (LSB first).
+
+    Raises:
+        ValueError: if the address is invalid
+    """
+    if not BD_ADDRESS.match(address):
+        raise ValueError(f'Invalid BD address {address}')
+    return bytes.fromhex(re.sub(r'[:-]', '', address))[::-1]
+
+
+def read_cgs_overrides(path: str) -> dict:
+    """Read the settings config_image() supports from a .cgs file.
+
+    Returns:
+        dict: keyword arguments for config_image()
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    overrides = {}
+    for m in CGS_ENTRY.finditer(text):
+        fields = {f.group('field'): f.group('value').strip('"') for f in CGS_FIELD.finditer(m.group('body'))}
+        if m.group('entry') == 'Local Name' and 'Name' in fields:
+            overrides['local_name'] = fields['Name']
+        elif m.group('entry') in ('BD Address', 'BD_ADDR') and fields:
+            overrides['bd_address'] = next(iter(fields.values()))
+    return overrides
+
+
+def _entry_value(image: FirmwareImage, magic: bytes, tag: int, name: str) -> tuple:
+    section = find_section(image, magic)
+    entry = find_entry(section, tag) if section else None
+    if not entry:
+        raise ValueError(f'No {name} entry in the firmware configuration')
+    return entry
+
+
+def config_image(image: FirmwareImage, local_name: str = None, bd_address: str = None) -> FirmwareImage:
+    """Patch per-unit settings into the configuration of an image.
+
+    Args:
+        image (FirmwareImage): base firmware image
+        local_name (str, optional): Bluetooth local name. Must fit the entry in the
+        base image. Defaults to None, which keeps the base image value.
+        bd_address (str, optional): BD address, for example 00:16:A4:12:34:56. Defaults to
+        None, which keeps the base image value.
+
+    Raises:
+        ValueError: if the image has no such entry or a setting is invalid
+
+    Returns:
+        FirmwareImage: a copy of the whole image with the settings patched in. It has no
+        sha256 since it matches no file.
+    """
+    patches = []
+    if local_name is not None:
+        address, length = _entry_value(image, DS_MAGIC, TAG_LOCAL_NAME, 'local name')
+        name = local_name.encode('utf-8')
+        if len(name) >= length:
+            raise ValueError(f'Local name is longer than the {length - 1} bytes this firmware has room for')
+        patches.append((address, name.ljust(length, b'\0')))
+    if bd_address is not None:
+        address, length = _entry_value(image, SS_MAGIC, TAG_BD_ADDRESS, 'BD address')
+        patches.append((address, parse_bd_address(bd_address)))
+    # Patches are applied after the base data they overlap
+    segments = merge_segments(list(image.segments) + patches)
+    return FirmwareImage(segments, image.launch_address, image.record_count, '')
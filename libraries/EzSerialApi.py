@@ -0,0 +1,234 @@
+"""
+EZ-Serial API definitions for the host side packet codecs.
+
+Each command and event has a binary group and ID, a text mode name and its
+fields in wire order. Commands have parameters and response fields, events
+have parameters. Binary responses and text responses also carry a 16-bit
+result code ahead of the response fields.
+
+This is the subset of the EZ-Serial API used by the samples and the Robot
+suites. Further commands and events are added to API_DEFINITIONS.
+"""
+
+import collections
+import enum
+
+# Field types and their sizes in binary mode. uint8a and longuint8a are byte
+# arrays with a 1 and 2 byte length prefix.
+FIELD_SIZES = {
+    'uint8': 1,
+    'int8': 1,
+    'uint16': 2,
+    'int16': 2,
+    'uint32': 4,
+    'macaddr': 6,
+    'uint8a': None,
+    'longuint8a': None,
+}
+
+KIND_COMMAND = 'command'
+KIND_EVENT = 'event'
+
+ApiField = collections.namedtuple('ApiField', 'name type key')
+
+
+class EzSerialApiMode(enum.IntEnum):
+    TEXT = 0
+    BINARY = 1
+
+
+class ApiDefinition:
+    """A command or an event.
+    """
+
+    __slots__ = ('kind', 'name', 'group', 'id', 'text', 'params', 'returns')
+
+    def __init__(self, kind: str, name: str, group: int, id: int, text: str, params: list, returns: list = None):
+        """Create a definition.
+
+        Args:
+            kind (str): KIND_COMMAND or KIND_EVENT
+            name (str): API name, for example system_ping
+            group (int): binary group
+            id (int): binary ID within the group
+            text (str): text mode name, for example /PING
+            params (list): (name, type, text key) tuples of the command or event fields
+            returns (list, optional): (name, type, text key) tuples of the response fields,
+            for commands. Defaults to None.
+        """
+        self.kind = kind
+        self.name = name
+        self.group = group
+        self.id = id
+        self.text = text
+        self.params = [ApiField(*p) for p in params]
+        self.returns = [ApiField(*r) for r in returns or []]
+
+    def __repr__(self):
+        return f'ApiDefinition({self.kind} {self.name} {self.group}/{self.id} {self.text})'
+
+
+def _command(name, group, id, text, params=(), returns=()):
+    return ApiDefinition(KIND_COMMAND, name, group, id, text, list(params), list(returns))
+
+
+def _event(name, group, id, text, params=()):
+    return ApiDefinition(KIND_EVENT, name, group, id, text, list(params))
+
+
+_ADV_PARAMETERS = [('mode', 'uint8', 'M'), ('type', 'uint8', 'T'), ('channels', 'uint8', 'C'),
+                   ('high_interval', 'uint16', 'H'), ('high_duration', 'uint16', 'D'),
+                   ('low_interval', 'uint16', 'L'), ('low_duration', 'uint16', 'O'),
+                   ('flags', 'uint8', 'F'), ('directAddr', 'macaddr', 'A'), ('directAddrType', 'uint8', 'Y')]
+_CONN_PARAMETERS = [('interval', 'uint16', 'I'), ('slave_latency', 'uint16', 'L'),
+                    ('supervision_timeout', 'uint16', 'O'), ('scan_interval', 'uint16', 'V'),
+                    ('scan_window', 'uint16', 'W'), ('scan_timeout', 'uint16', 'M')]
+_UART_PARAMETERS = [('baud', 'uint32', 'B'), ('autobaud', 'uint8', 'A'), ('autocorrect', 'uint8', 'C'),
+                    ('flow', 'uint8', 'F'), ('databits', 'uint8', 'D'), ('parity', 'uint8', 'P'),
+                    ('stopbits', 'uint8', 'S')]
+_FIRMWARE_VERSION = [('app', 'uint32', 'E'), ('stack', 'uint32', 'S'), ('protocol', 'uint16', 'P'),
+                     ('hardware', 'uint8', 'H')]
+
+API_DEFINITIONS = [
+    # System
+    _command('system_ping', 2, 1, '/PING', returns=[('runtime', 'uint32', 'R'), ('fraction', 'uint16', 'F')]),
+    _command('system_reboot', 2, 2, '/RBT'),
+    _command('system_factory_reset', 2, 5, '/RFAC'),
+    _command('system_query_firmware_version', 2, 6, '/QFW', returns=_FIRMWARE_VERSION),
+    _command('system_set_bluetooth_address', 2, 13, 'SBA', [('address', 'macaddr', 'A')]),
+    _command('system_get_bluetooth_address', 2, 14, 'GBA', returns=[('address', 'macaddr', 'A')]),
+    _command('system_set_tx_power', 2, 17, 'STXP', [('power', 'uint8', 'P')]),
+    _command('system_get_tx_power', 2, 18, 'GTXP', returns=[('power', 'uint8', 'P')]),
+    _command('system_set_sleep_parameters', 2, 19, 'SSLP', [('level', 'uint8', 'L')]),
+    _command('system_get_sleep_parameters', 2, 20, 'GSLP', returns=[('level', 'uint8', 'L')]),
+    _command('system_set_uart_parameters', 2, 25, 'STU', _UART_PARAMETERS),
+    _command('system_get_uart_parameters', 2, 26, 'GTU', returns=_UART_PARAMETERS),
+    # GAP
+    _command('gap_connect', 4, 1, '/C', [('address', 'macaddr', 'A'), ('type', 'uint8', 'T')] + _CONN_PARAMETERS,
+             returns=[('conn_handle', 'uint8', 'C')]),
+    _command('gap_disconnect', 4, 5, '/DIS', [('conn_handle', 'uint8', 'C')]),
+    _command('gap_start_adv', 4, 8, '/A', _ADV_PARAMETERS),
+    _command('gap_stop_adv', 4, 9, '/AX'),
+    _command('gap_start_scan', 4, 10, '/S', [('mode', 'uint8', 'M'), ('interval', 'uint16', 'I'),
+                                             ('window', 'uint16', 'W'), ('active', 'uint8', 'A'),
+                                             ('filter', 'uint8', 'F'), ('nodupe', 'uint8', 'D'),
+                                             ('timeout', 'uint16', 'O')]),
+    _command('gap_stop_scan', 4, 11, '/SX'),
+    _command('gap_set_adv_data', 4, 19, 'SAD', [('data', 'uint8a', 'D')]),
+    _command('gap_set_adv_parameters', 4, 23, 'SAP', _ADV_PARAMETERS),
+    _command('gap_get_adv_parameters', 4, 24, 'GAP', returns=_ADV_PARAMETERS),
+    _command('gap_get_conn_parameters', 4, 28, 'GCP', returns=_CONN_PARAMETERS),
+    # GATT server
+    _command('gatts_create_attr', 5, 1, '/CAC', [('type', 'uint8', 'T'), ('perm', 'uint8', 'P'),
+                                                 ('length', 'uint16', 'L'), ('data', 'longuint8a', 'V')],
+             returns=[('handle', 'uint16', 'H'), ('valid', 'uint16', 'V')]),
+    _command('gatts_write_handle', 5, 6, '/WLH', [('attr_handle', 'uint16', 'H'), ('data', 'longuint8a', 'D')]),
+    _command('gatts_notify_handle', 5, 8, '/NH', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H'),
+                                                  ('data', 'longuint8a', 'D')]),
+    # GATT client
+    _command('gattc_read_handle', 6, 4, '/RRH', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H')]),
+    _command('gattc_write_handle', 6, 5, '/WRH', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H'),
+                                                  ('type', 'uint8', 'T'), ('data', 'longuint8a', 'D')]),
+    # CYSPP profile
+    _command('p_cyspp_set_parameters', 10, 2, '.CYSPPSP', [('enable', 'uint8', 'E'), ('role', 'uint8', 'G'),
+                                                          ('company', 'uint16', 'C'), ('local_key', 'uint32', 'L'),
+                                                          ('remote_key', 'uint32', 'R'),
+                                                          ('remote_mask', 'uint32', 'M'),
+                                                          ('sleep_level', 'uint8', 'P'),
+                                                          ('server_security', 'uint8', 'S'),
+                                                          ('client_flags', 'uint8', 'F')]),
+
+    # System events
+    _event('system_boot', 2, 1, 'BOOT', _FIRMWARE_VERSION + [('cause', 'uint8', 'C'), ('address', 'macaddr', 'A')]),
+    _event('system_error', 2, 2, 'ERR', [('error', 'uint16', 'E')]),
+    _event('system_factory_reset_complete', 2, 3, 'RFAC'),
+    # GAP events
+    _event('gap_adv_state_changed', 4, 2, 'ASC', [('state', 'uint8', 'S'), ('reason', 'uint8', 'R')]),
+    _event('gap_scan_state_changed', 4, 3, 'SSC', [('state', 'uint8', 'S'), ('reason', 'uint8', 'R')]),
+    _event('gap_scan_result', 4, 4, 'S', [('result_type', 'uint8', 'R'), ('address', 'macaddr', 'A'),
+                                          ('address_type', 'uint8', 'T'), ('rssi', 'int8', 'S'),
+                                          ('bond', 'uint8', 'B'), ('data', 'uint8a', 'D')]),
+    _event('gap_connected', 4, 5, 'C', [('conn_handle', 'uint8', 'C'), ('address', 'macaddr', 'A'),
+                                        ('type', 'uint8', 'T'), ('interval', 'uint16', 'I'),
+                                        ('slave_latency', 'uint16', 'L'), ('supervision_timeout', 'uint16', 'O'),
+                                        ('bond', 'uint8', 'B')]),
+    _event('gap_disconnected', 4, 6, 'DIS', [('conn_handle', 'uint8', 'C'), ('reason', 'uint16', 'R')]),
+    _event('gap_connection_updated', 4, 8, 'CU', [('conn_handle', 'uint8', 'C'), ('interval', 'uint16', 'I'),
+                                                  ('slave_latency', 'uint16', 'L'),
+                                                  ('supervision_timeout', 'uint16', 'O')]),
+    # GATT events
+    _event('gatts_data_written', 5, 2, 'W', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H'),
+                                             ('type', 'uint8', 'T'), ('data', 'longuint8a', 'D')]),
+    _event('gattc_remote_procedure_complete', 6, 6, 'RPC', [('conn_handle', 'uint8', 'C'),
+                                                            ('error', 'uint16', 'E')]),
+    _event('gattc_data_received', 6, 9, 'D', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H'),
+                                              ('type', 'uint8', 'T'), ('data', 'longuint8a', 'D')]),
+    _event('gattc_write_response', 6, 10, 'WRR', [('conn_handle', 'uint8', 'C'), ('attr_handle', 'uint16', 'H'),
+                                                  ('type', 'uint8', 'T')]),
+    # SMP events
+    _event('smp_pairing_requested', 7, 1, 'P', [('conn_handle', 'uint8', 'C'), ('mode', 'uint8', 'M'),
+                                                ('bonding', 'uint8', 'B'), ('keysize', 'uint8', 'K'),
+                                                ('pairprop', 'uint8', 'P')]),
+    _event('smp_pairing_result', 7, 2, 'PR', [('conn_handle', 'uint8', 'C'), ('result', 'uint16', 'R')]),
+    _event('smp_encryption_status', 7, 3, 'ENC', [('conn_handle', 'uint8', 'C'), ('status', 'uint8', 'S')]),
+    _event('smp_passkey_display_requested', 7, 4, 'PKD', [('conn_handle', 'uint8', 'C'),
+                                                          ('passkey', 'uint32', 'P')]),
+    # CYSPP profile events
+    _event('p_cyspp_status', 10, 2, '.CYSPP', [('status', 'uint8', 'S')]),
+    # BR/EDR events
+    _event('bt_connected', 14, 3, 'BTCON', [('conn_handle', 'uint8', 'C'), ('address', 'macaddr', 'A'),
+                                            ('type', 'uint8', 'T')]),
+    _event('bt_disconnected', 14, 4, 'BTDIS', [('conn_handle', 'uint8', 'C'), ('reason', 'uint16', 'R')]),
+]
+
+COMMANDS = {d.name: d for d in API_DEFINITIONS if d.kind == KIND_COMMAND}
+EVENTS = {d.name: d for d in API_DEFINITIONS if d.kind == KIND_EVENT}
+
+# Names used by the samples and the Robot suites
+CMD_PING = 'system_ping'
+CMD_REBOOT = 'system_reboot'
+CMD_FACTORY_RESET = 'system_factory_reset'
+CMD_QUERY_FW = 'system_query_firmware_version'
+CMD_SET_BT_ADDR = 'system_set_bluetooth_address'
+CMD_GET_BT_ADDR = 'system_get_bluetooth_address'
+CMD_SET_TX_POWER = 'system_set_tx_power'
+CMD_GET_TX_POWER = 'system_get_tx_power'
+CMD_SET_SLEEP_PARAMS = 'system_set_sleep_parameters'
+CMD_GET_SLEEP_PARAMS = 'system_get_sleep_parameters'
+CMD_SET_UART_PARAMS = 'system_set_uart_parameters'
+CMD_GET_UART_PARAMS = 'system_get_uart_parameters'
+CMD_GAP_CONNECT = 'gap_connect'
+CMD_GAP_DISCONNECT = 'gap_disconnect'
+CMD_GAP_START_ADV = 'gap_start_adv'
+CMD_GAP_STOP_ADV = 'gap_stop_adv'
+CMD_GAP_START_SCAN = 'gap_start_scan'
+CMD_GAP_STOP_SCAN = 'gap_stop_scan'
+CMD_GAP_SET_ADV_DATA = 'gap_set_adv_data'
+CMD_GAP_SET_ADV_PARAMETERS = 'gap_set_adv_parameters'
+CMD_GAP_GET_ADV_PARAMETERS = 'gap_get_adv_parameters'
+CMD_GAP_GET_CONN_PARAMS = 'gap_get_conn_parameters'
+CMD_GATTS_CREATE_ATTR = 'gatts_create_attr'
+CMD_GATTS_WRITE_HANDLE = 'gatts_write_handle'
+CMD_GATTS_NOTIFY_HANDLE = 'gatts_notify_handle'
+CMD_GATTC_READ_HANDLE = 'gattc_read_handle'
+CMD_GATTC_WRITE_HANDLE = 'gattc_write_handle'
+CMD_P_CYSPP_SET_PARAMETERS = 'p_cyspp_set_parameters'
+EVENT_SYSTEM_BOOT = 'system_boot'
+EVENT_SYSTEM_ERROR = 'system_error'
+EVENT_GAP_ADV_STATE_CHANGED = 'gap_adv_state_changed'
+EVENT_GAP_SCAN_STATE_CHANGED = 'gap_scan_state_changed'
+EVENT_GAP_SCAN_RESULT = 'gap_scan_result'
+EVENT_GAP_CONNECTED = 'gap_connected'
+EVENT_GAP_DISCONNECTED = 'gap_disconnected'
+EVENT_GAP_CONNECTION_UPDATED = 'gap_connection_updated'
+EVENT_GATTS_DATA_WRITTEN = 'gatts_data_written'
+EVENT_GATTC_REMOTE_PROCEDURE_COMPLETE = 'gattc_remote_procedure_complete'
+EVENT_GATTC_DATA_RECEIVED = 'gattc_data_received'
+EVENT_GATTC_WRITE_RESPONSE = 'gattc_write_response'
+EVENT_SMP_PAIRING_REQUESTED = 'smp_pairing_requested'
+EVENT_SMP_PAIRING_RESULT = 'smp_pairing_result'
+EVENT_SMP_ENCRYPTION_STATUS = 'smp_encryption_status'
+EVENT_SMP_PASSKEY_DISPLAY_REQUESTED = 'smp_passkey_display_requested'
+EVENT_P_CYSPP_STATUS = 'p_cyspp_status'
+EVENT_BT_CONNECTED = 'bt_connected'
+EVENT_BT_DISCONNECTED = 'bt_disconnected'
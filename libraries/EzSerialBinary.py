@@ -0,0 +1,295 @@
+"""
+EZ-Serial binary mode packet codec.
+
+A binary packet is a 4 byte header, the payload and a checksum:
+
+    byte 0      type (0xC0 command or response, 0x80 event) | length bits 10-8
+    byte 1      length bits 7-0
+    byte 2      group
+    byte 3      ID
+    payload     fields in API order, little endian
+    checksum    8-bit sum of the header and payload, starting at 0x99
+
+BinaryDecoder frames packets out of one receive buffer that is reused for the
+life of the port. Fixed size fields are read with one precompiled struct per
+command and event, and each payload is a namedtuple (no per-instance dict).
+"""
+
+import collections
+import struct
+from EzSerialApi import API_DEFINITIONS, COMMANDS, FIELD_SIZES, KIND_COMMAND
+
+TYPE_COMMAND = 0xC0
+TYPE_EVENT = 0x80
+TYPE_MASK = 0xC0
+LENGTH_HIGH_MASK = 0x07
+HEADER_SIZE = 4
+CHECKSUM_SIZE = 1
+CHECKSUM_SEED = 0x99
+MAX_PAYLOAD_SIZE = 0x7FF
+
+FIELD_FORMATS = {
+    'uint8': 'B',
+    'int8': 'b',
+    'uint16': 'H',
+    'int16': 'h',
+    'uint32': 'I',
+    'macaddr': '6s',
+}
+ARRAY_LENGTH_FORMATS = {
+    'uint8a': 'B',
+    'longuint8a': 'H',
+}
+
+RESULT_FIELD = ('result', 'uint16', 'R')
+RECEIVE_BUFFER_SIZE = 4096
+
+
+class Packet:
+    """A decoded response or event.
+    """
+
+    __slots__ = ('kind', 'name', 'group', 'id', 'payload')
+
+    def __init__(self, kind: str, name: str, group: int, id: int, payload):
+        self.kind = kind
+        self.name = name
+        self.group = group
+        self.id = id
+        self.payload = payload
+
+    def __repr__(self):
+        return f'Packet({self.kind} {self.name} {self.payload})'
+
+
+class PacketLayout:
+    """Precompiled decoder of one response or event payload.
+
+    The fixed size fields in front of the first byte array are read with one
+    struct. Byte arrays, and any fields after them, are read one at a time.
+    """
+
+    __slots__ = ('kind', 'name', 'group', 'id', 'payload_class', 'fixed', 'tail')
+
+    def __init__(self, kind: str, name: str, group: int, id: int, fields: list):
+        self.kind = kind
+        self.name = name
+        self.group = group
+        self.id = id
+        self.payload_class = collections.namedtuple(f'{name}_payload', [f[0] for f in fields])
+        formats = []
+        for i, (_, type, _) in enumerate(fields):
+            if type not in FIELD_FORMATS:
+                break
+            formats.append(FIELD_FORMATS[type])
+        else:
+            i = len(fields)
+        self.fixed = struct.Struct('<' + ''.join(formats))
+        self.tail = [(type, struct.Struct('<' + ARRAY_LENGTH_FORMATS.get(type, FIELD_FORMATS.get(type))))
+                     for _, type, _ in fields[i:]]
+
+    def decode(self, data, offset: int, end: int):
+        """Decode a payload.
+
+        Args:
+            data: buffer holding the payload
+            offset (int): start of the payload
+            end (int): end of the payload
+
+        Raises:
+            ValueError: if the payload is shorter than its fields
+
+        Returns:
+            payload_class: the payload
+        """
+        if offset + self.fixed.size > end:
+            raise ValueError(f'{self.name} payload is too short')
+        values = self.fixed.unpack_from(data, offset)
+        if self.tail:
+            values = list(values)
+            offset += self.fixed.size
+            for type, s in self.tail:
+                if offset + s.size > end:
+                    raise ValueError(f'{self.name} payload is too short')
+                value, = s.unpack_from(data, offset)
+                offset += s.size
+                if type in ARRAY_LENGTH_FORMATS:
+                    if offset + value > end:
+                        raise ValueError(f'{self.name} payload is too short')
+                    value = bytes(data[offset:offset + value])
+                    offset += len(value)
+                values.append(value)
+        return tuple.__new__(self.payload_class, values)
+
+
+def layout_key(type: int, group: int, id: int) -> int:
+    """Key of a packet in LAYOUTS."""
+    return type << 16 | group << 8 | id
+
+
+def _build_layouts() -> dict:
+    layouts = {}
+    for d in API_DEFINITIONS:
+        if d.kind == KIND_COMMAND:
+            layouts[layout_key(TYPE_COMMAND, d.group, d.id)] = PacketLayout(
+                'rsp', d.name, d.group, d.id, [RESULT_FIELD] + d.returns)
+        else:
+            layouts[layout_key(TYPE_EVENT, d.group, d.id)] = PacketLayout(
+                'evt', d.name, d.group, d.id, d.params)
+    return layouts
+
+
+LAYOUTS = _build_layouts()
+
+
+def checksum(data) -> int:
+    return (CHECKSUM_SEED + sum(data)) & 0xFF
+
+
+def encode_fields(fields: list, values: dict) -> bytes:
+    """Encode fields in binary mode.
+
+    Args:
+        fields (list): ApiField of the packet
+        values (dict): field values by name. Missing fields are 0 or empty.
+
+    Returns:
+        bytes: the payload
+    """
+    out = bytearray()
+    for name, type, _ in fields:
+        value = values.get(name)
+        if type in ARRAY_LENGTH_FORMATS:
+            value = bytes(value or b'')
+            out += struct.pack('<' + ARRAY_LENGTH_FORMATS[type], len(value)) + value
+        elif type == 'macaddr':
+            out += bytes(value or bytes(FIELD_SIZES[type]))
+        else:
+            out += struct.pack('<' + FIELD_FORMATS[type], value or 0)
+    return bytes(out)
+
+
+def encode_packet(type: int, group: int, id: int, payload: bytes) -> bytes:
+    """Frame a payload as a binary packet.
+
+    Raises:
+        ValueError: if the payload is too long
+    """
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f'Payload of {len(payload)} bytes is too long')
+    packet = bytes([type | len(payload) >> 8, len(payload) & 0xFF, group, id]) + payload
+    return packet + bytes([checksum(packet)])
+
+
+def encode_command(name: str, **kwargs) -> bytes:
+    """Encode a command in binary mode.
+
+    Args:
+        name (str): command name, for example system_ping
+        kwargs: command parameters
+
+    Returns:
+        bytes: the packet
+    """
+    d = COMMANDS[name]
+    return encode_packet(TYPE_COMMAND, d.group, d.id, encode_fields(d.params, kwargs))
+
+
+class BinaryDecoder:
+    """Frames and decodes binary packets from received data.
+    """
+
+    def __init__(self, verify_checksum: bool = True, size: int = RECEIVE_BUFFER_SIZE):
+        """Create a decoder.
+
+        Args:
+            verify_checksum (bool, optional): drop packets with a bad checksum. Defaults to True.
+            size (int, optional): initial receive buffer size. Defaults to RECEIVE_BUFFER_SIZE.
+        """
+        self.verify_checksum = verify_checksum
+        self.buffer = bytearray(size)
+        self.start = 0
+        self.end = 0
+        self.packets = 0
+        self.unknown = 0
+        self.errors = 0
+
+    def reset(self):
+        """Drop any partly received packet."""
+        self.start = 0
+        self.end = 0
+
+    def _append(self, data):
+        n = len(data)
+        if self.end + n > len(self.buffer):
+            # Move the partial packet to the front, growing the buffer only if it still does not fit
+            pending = self.end - self.start
+            if pending + n > len(self.buffer):
+                self.buffer.extend(bytes(pending + n - len(self.buffer)))
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+            self.start = 0
+            self.end = pending
+        self.buffer[self.end:self.end + n] = data
+        self.end += n
+
+    def feed(self, data) -> list:
+        """Add received data and decode the packets it completes.
+
+        Args:
+            data: bytes-like received data
+
+        Returns:
+            list: Packet for each complete packet. Unknown packets have a payload of
+            the raw bytes.
+        """
+        self._append(data)
+        packets = []
+        buf = self.buffer
+        view = memoryview(buf)
+        start = self.start
+        end = self.end
+        layouts = LAYOUTS
+        try:
+            while end - start >= HEADER_SIZE:
+                b0 = buf[start]
+                type = b0 & TYPE_MASK
+                if type != TYPE_COMMAND and type != TYPE_EVENT:
+                    # Not a packet start, resynchronize on the next byte
+                    self.errors += 1
+                    start += 1
+                    continue
+                length = (b0 & LENGTH_HIGH_MASK) << 8 | buf[start + 1]
+                total = HEADER_SIZE + length + CHECKSUM_SIZE
+                if end - start < total:
+                    break
+                payload_start = start + HEADER_SIZE
+                payload_end = payload_start + length
+                if self.verify_checksum and \
+                        (CHECKSUM_SEED + sum(view[start:payload_end])) & 0xFF != buf[payload_end]:
+                    self.errors += 1
+                    start += 1
+                    continue
+                group = buf[start + 2]
+                id = buf[start + 3]
+                layout = layouts.get(type << 16 | group << 8 | id)
+                if layout is None:
+                    self.unknown += 1
+                    kind = 'rsp' if type == TYPE_COMMAND else 'evt'
+                    packets.append(Packet(kind, None, group, id, bytes(view[payload_start:payload_end])))
+                else:
+                    try:
+                        payload = layout.decode(buf, payload_start, payload_end)
+                    except ValueError:
+                        self.errors += 1
+                        start += total
+                        continue
+                    packets.append(Packet(layout.kind, layout.name, group, id, payload))
+                start += total
+        finally:
+            view.release()
+        if start == end:
+            start = end = 0
+        self.start = start
+        self.end = end
+        self.packets += len(packets)
+        return packets
@@ -0,0 +1,268 @@
+"""
+Dispatch of EZ-Serial responses and events.
+
+Decoded packets are queued by type, so waiting for one event is a lookup of
+its queue instead of a scan through everything received, and a flood of one
+event (scan results, notifications) does not delay the others. Queues are
+bounded: when one is full its oldest packet is dropped and counted.
+
+Callbacks can subscribe to an event, optionally only to payloads with given
+field values or that pass a predicate:
+
+    dispatcher.subscribe(EVENT_GAP_SCAN_RESULT, on_scan, address=peer)
+    packet = dispatcher.wait_event(EVENT_P_CYSPP_STATUS, 10, status=0x35)
+"""
+
+import asyncio
+import collections
+import logging
+import threading
+import time
+
+DEFAULT_QUEUE_SIZE = 256
+
+
+def _matches(payload, predicate, fields: dict) -> bool:
+    for name, value in fields.items():
+        if getattr(payload, name, None) != value:
+            return False
+    return predicate is None or predicate(payload)
+
+
+class Subscription:
+    """A callback subscribed to an event.
+    """
+
+    __slots__ = ('event', 'callback', 'predicate', 'fields', 'consume')
+
+    def __init__(self, event: str, callback, predicate=None, fields: dict = None, consume: bool = False):
+        self.event = event
+        self.callback = callback
+        self.predicate = predicate
+        self.fields = fields or {}
+        self.consume = consume
+
+    def matches(self, payload) -> bool:
+        return _matches(payload, self.predicate, self.fields)
+
+
+class EventDispatcher:
+    """Queues packets by type and calls subscribed callbacks.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """Create a dispatcher.
+
+        Args:
+            queue_size (int, optional): most packets queued for each response and event
+            type. Defaults to DEFAULT_QUEUE_SIZE.
+        """
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.conditions = {}
+        self.subscriptions = collections.defaultdict(list)
+        self.overflows = collections.Counter()
+        self.reader = None
+        self.stop_event = threading.Event()
+
+    def _condition(self, key) -> threading.Condition:
+        condition = self.conditions.get(key)
+        if condition is None:
+            condition = self.conditions[key] = threading.Condition(self.lock)
+        return condition
+
+    def subscribe(self, event: str, callback, predicate=None, consume: bool = False, **fields) -> Subscription:
+        """Call a function for each matching event. Callbacks run on the thread
+        that dispatches, so they must not block.
+
+        Args:
+            event (str): event name, for example EVENT_GAP_SCAN_RESULT
+            callback: called with the Packet
+            predicate (optional): called with the payload, the event matches if it returns True.
+            Defaults to None.
+            consume (bool, optional): do not queue events that match. Defaults to False.
+            fields: payload field values the event must have
+
+        Returns:
+            Subscription: to unsubscribe with
+        """
+        subscription = Subscription(event, callback, predicate, fields, consume)
+        with self.lock:
+            self.subscriptions[event] = self.subscriptions[event] + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self.lock:
+            subscriptions = [s for s in self.subscriptions[subscription.event] if s is not subscription]
+            self.subscriptions[subscription.event] = subscriptions
+
+    def dispatch(self, packet):
+        """Queue a decoded packet and call the callbacks subscribed to it."""
+        if packet.kind == 'evt':
+            consumed = False
+            # Subscription lists are replaced, never changed, so no lock is needed to read them
+            for s in self.subscriptions.get(packet.name, ()):
+                if s.matches(packet.payload):
+                    consumed |= s.consume
+                    try:
+                        s.callback(packet)
+                    except Exception as e:
+                        logging.error(f'{packet.name} callback failed: {e}')
+            if consumed:
+                return
+        key = (packet.kind, packet.name)
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                queue = self.queues[key] = collections.deque()
+            if len(queue) >= self.queue_size:
+                queue.popleft()
+                self.overflows[packet.name] += 1
+            queue.append(packet)
+            self._notify(key)
+
+    def _notify(self, key):
+        condition = self.conditions.get(key)
+        if condition is not None:
+            condition.notify_all()
+
+    def dispatch_all(self, packets: list):
+        for packet in packets:
+            self.dispatch(packet)
+
+    def _pop(self, key, predicate, fields: dict):
+        """Take the first matching packet from a queue, dropping those before it."""
+        queue = self.queues.get(key)
+        while queue:
+            packet = queue.popleft()
+            if _matches(packet.payload, predicate, fields):
+                return packet
+        return None
+
+    def _wait(self, key, timeout: float, predicate, fields: dict):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            condition = self._condition(key)
+            while True:
+                packet = self._pop(key, predicate, fields)
+                if packet is not None:
+                    return packet
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                condition.wait(remaining)
+
+    def wait_event(self, event: str, timeout: float = None, predicate=None, **fields):
+        """Wait for an event. Queued events of the same type that do not match are
+        dropped, events of other types stay queued.
+
+        Args:
+            event (str): event name
+            timeout (float, optional): seconds to wait, None to wait forever. Defaults to None.
+            predicate (optional): called with the payload, the event matches if it returns True.
+            Defaults to None.
+            fields: payload field values the event must have
+
+        Returns:
+            Packet: the event, or None on timeout
+        """
+        return self._wait(('evt', event), timeout, predicate, fields)
+
+    def wait_response(self, command: str, timeout: float = None):
+        """Wait for the response to a command.
+
+        Returns:
+            Packet: the response, or None on timeout
+        """
+        return self._wait(('rsp', command), timeout, None, {})
+
+    def pending(self, event: str) -> int:
+        """Number of queued events of a type."""
+        with self.lock:
+            return len(self.queues.get(('evt', event), ()))
+
+    def clear(self, name: str = None):
+        """Drop the queued responses and events, or only those with a name."""
+        with self.lock:
+            for key, queue in self.queues.items():
+                if name is None or key[1] == name:
+                    queue.clear()
+
+    def start(self, read, decoder):
+        """Read, decode and dispatch on a thread until stop() is called.
+
+        Args:
+            read: returns received data, or empty data if none arrived before its timeout
+            decoder: BinaryDecoder or TextDecoder
+        """
+        self.stop_event.clear()
+        self.reader = threading.Thread(target=self._read, args=(read, decoder), daemon=True)
+        self.reader.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.reader:
+            self.reader.join()
+            self.reader = None
+
+    def _read(self, read, decoder):
+        while not self.stop_event.is_set():
+            try:
+                data = read()
+            except Exception as e:
+                logging.error(f'Read failed: {e}')
+                return
+            if data:
+                self.dispatch_all(decoder.feed(data))
+
+
+class AsyncEventDispatcher(EventDispatcher):
+    """EventDispatcher for asyncio. Packets must be dispatched on the event loop,
+    and the waits are coroutines.
+    """
+
+    def __init__(self, queue_size: int = DEFAULT_QUEUE_SIZE):
+        super().__init__(queue_size)
+        self.waiters = collections.defaultdict(list)
+
+    def _notify(self, key):
+        for future in self.waiters.pop(key, ()):
+            if not future.done():
+                future.set_result(None)
+
+    async def _wait(self, key, timeout: float, predicate, fields: dict):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while True:
+            # Only the event loop thread dispatches, so the lock is never contended
+            with self.lock:
+                packet = self._pop(key, predicate, fields)
+            if packet is not None:
+                return packet
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                return None
+            future = loop.create_future()
+            waiters = self.waiters[key]
+            waiters.append(future)
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                if future in waiters:
+                    waiters.remove(future)
+
+    async def wait_event(self, event: str, timeout: float = None, predicate=None, **fields):
+        """Wait for an event, see EventDispatcher.wait_event()."""
+        return await self._wait(('evt', event), timeout, predicate, fields)
+
+    async def wait_response(self, command: str, timeout: float = None):
+        """Wait for the response to a command, see EventDispatcher.wait_response()."""
+        return await self._wait(('rsp', command), timeout, None, {})
+
+    async def events(self, event: str, predicate=None, **fields):
+        """Iterate over the matching events as they arrive."""
+        while True:
+            yield await self._wait(('evt', event), None, predicate, fields)
@@ -0,0 +1,252 @@
+"""
+Simulated IF820 EZ-Serial module on a pseudo terminal.
+
+Used to test and benchmark the EZ-Serial ports without hardware. The module
+answers every command in the API definitions with its response, in text or
+binary mode. Response fields are zero, except that each gatts_create_attr
+returns the next attribute handle. Chosen commands can be made to fail with a
+result code, or to get no response. Every command received is recorded by name,
+with its parameters decoded by field name. Commands and parameters that are not
+in the API definitions are recorded as unknown. Events can be sent at any time.
+POSIX only.
+
+Timing model: when a baud rate is given, each command is received and each
+response sent at the UART speed. Commands execute one at a time with a fixed
+processing time, and every response is delayed by a round-trip latency, which
+overlaps between commands.
+"""
+
+import collections
+import os
+import select
+import threading
+import time
+import tty
+from EzSerialApi import COMMANDS, EVENTS, EzSerialApiMode
+from EzSerialBinary import (CHECKSUM_SIZE, HEADER_SIZE, LENGTH_HIGH_MASK, RESULT_FIELD, TYPE_COMMAND,
+                            TYPE_EVENT, TYPE_MASK, PacketLayout, encode_fields, encode_packet)
+from EzSerialText import LINE_END, PARSERS, encode_line
+
+# Start, data and stop bits per UART byte
+UART_BITS_PER_BYTE = 10
+FIRST_ATTR_HANDLE = 0x0014
+
+_BINARY_COMMANDS = {(d.group, d.id): (d, PacketLayout('cmd', d.name, d.group, d.id, d.params))
+                    for d in COMMANDS.values()}
+_TEXT_COMMANDS = {d.text.upper(): (d, {p.key: (p.name, PARSERS[p.type]) for p in d.params})
+                  for d in COMMANDS.values()}
+
+
+class EzSerialFakeModule:
+    """Simulated EZ-Serial module.
+    """
+
+    POLL_INTERVAL_SECONDS = 0.1
+
+    def __init__(self, api_mode: EzSerialApiMode = EzSerialApiMode.TEXT, latency: float = 0.0,
+                 processing_time: float = 0.0, baudrate: int = None, results: dict = None):
+        """Create a module.
+
+        Args:
+            api_mode (EzSerialApiMode, optional): API format of the module. Defaults to TEXT.
+            latency (float, optional): round-trip latency in seconds. Defaults to 0.0.
+            processing_time (float, optional): time to execute each command in seconds. Defaults to 0.0.
+            baudrate (int, optional): model the UART bandwidth at this baud rate. Defaults to None,
+            which does not limit bandwidth.
+            results (dict, optional): result code to respond with, by command name, or None
+            to not respond. Other commands succeed. Defaults to None.
+        """
+        self.api_mode = api_mode
+        self.latency = latency
+        self.processing_time = processing_time
+        self.baudrate = baudrate
+        self.results = dict(results or {})
+        self.port_name = None
+        self.commands = []
+        self.command_params = []
+        self.unknown = []
+        self.next_handle = FIRST_ATTR_HANDLE
+        self._master = None
+        self._slave = None
+        self._responses = collections.deque()
+        self._responses_ready = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self) -> str:
+        """Start the module.
+
+        Returns:
+            str: name of the port to open
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port_name = os.ttyname(self._slave)
+        self._running = True
+        self._threads = [threading.Thread(target=self._rx_thread, daemon=True),
+                         threading.Thread(target=self._tx_thread, daemon=True)]
+        for t in self._threads:
+            t.start()
+        return self.port_name
+
+    def stop(self):
+        """Stop the module."""
+        self._running = False
+        with self._responses_ready:
+            self._responses_ready.notify()
+        for t in self._threads:
+            t.join()
+        for fd in (self._slave, self._master):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def boot(self):
+        """Send the boot event, as the module does after a reset."""
+        self.event('system_boot')
+
+    def event(self, name: str, count: int = 1, **values):
+        """Send an event. Fields not given are zero.
+
+        Args:
+            name (str): event name
+            count (int, optional): times to send it. Defaults to 1.
+        """
+        if self.api_mode == EzSerialApiMode.BINARY:
+            d = EVENTS[name]
+            event = encode_packet(TYPE_EVENT, d.group, d.id, encode_fields(d.params, values))
+        else:
+            event = encode_line('E', name, **values)
+        now = time.monotonic()
+        with self._responses_ready:
+            self._responses.extend([(now, event)] * count)
+            self._responses_ready.notify()
+
+    def _wire_time(self, length: int) -> float:
+        return length * UART_BITS_PER_BYTE / self.baudrate if self.baudrate else 0.0
+
+    def _respond(self, definition, params: dict) -> bytes:
+        """Execute a command and build its response.
+
+        Args:
+            definition (ApiDefinition): the command
+            params (dict): its parameters, by field name
+
+        Returns:
+            bytes: the response, or None to not respond
+        """
+        self.commands.append(definition.name)
+        self.command_params.append(params)
+        result = self.results.get(definition.name, 0)
+        if result is None:
+            return None
+        values = {'result': result}
+        if definition.name == 'gatts_create_attr' and not result:
+            values.update(handle=self.next_handle, valid=1)
+            self.next_handle += 1
+        if self.api_mode == EzSerialApiMode.BINARY:
+            return encode_packet(TYPE_COMMAND, definition.group, definition.id,
+                                 encode_fields([RESULT_FIELD] + definition.returns, values))
+        return encode_line('R', definition.name, **values)
+
+    def _commands(self, buf: bytearray):
+        """Take the complete commands from the received data.
+
+        Returns:
+            list: (definition, parameters, length on the wire) of each known command
+        """
+        commands = []
+        if self.api_mode == EzSerialApiMode.BINARY:
+            while len(buf) >= HEADER_SIZE:
+                if buf[0] & TYPE_MASK != TYPE_COMMAND:
+                    del buf[:1]
+                    continue
+                end = HEADER_SIZE + ((buf[0] & LENGTH_HIGH_MASK) << 8 | buf[1]) + CHECKSUM_SIZE
+                if len(buf) < end:
+                    break
+                packet = bytes(buf[:end])
+                del buf[:end]
+                command = _BINARY_COMMANDS.get((packet[2], packet[3]))
+                if command is None:
+                    self.unknown.append(packet)
+                    continue
+                definition, layout = command
+                try:
+                    params = layout.decode(packet, HEADER_SIZE, end - CHECKSUM_SIZE)._asdict()
+                except ValueError:
+                    self.unknown.append(packet)
+                    continue
+                commands.append((definition, params, end))
+        else:
+            while True:
+                end = buf.find(b'\n')
+                if end < 0:
+                    break
+                line = buf[:end].decode('ascii', 'replace').strip()
+                del buf[:end + 1]
+                name, *items = line.split(',')
+                command = _TEXT_COMMANDS.get(name.upper())
+                if command is None:
+                    if line:
+                        self.unknown.append(line)
+                    continue
+                definition, fields = command
+                params = {}
+                for item in items:
+                    key, _, value = item.partition('=')
+                    try:
+                        field, parse = fields[key]
+                        params[field] = parse(value)
+                    except (KeyError, ValueError):
+                        self.unknown.append(f'{name},{item}')
+                commands.append((definition, params, len(line) + len(LINE_END)))
+        return commands
+
+    def _rx_thread(self):
+        buf = bytearray()
+        rx_done = exec_done = tx_done = 0.0
+        while self._running:
+            try:
+                if not select.select([self._master], [], [], self.POLL_INTERVAL_SECONDS)[0]:
+                    continue
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            now = time.monotonic()
+            buf += data
+            for definition, params, length in self._commands(buf):
+                rx_done = max(rx_done, now) + self._wire_time(length)
+                response = self._respond(definition, params)
+                exec_done = max(exec_done, rx_done) + self.processing_time
+                if response is None:
+                    continue
+                tx_done = max(tx_done, exec_done + self.latency) + self._wire_time(len(response))
+                with self._responses_ready:
+                    self._responses.append((tx_done, response))
+                    self._responses_ready.notify()
+
+    def _tx_thread(self):
+        while True:
+            with self._responses_ready:
+                while self._running and not self._responses:
+                    self._responses_ready.wait()
+                if not self._running:
+                    return
+                due, response = self._responses.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                os.write(self._master, response)
+            except OSError:
+                return
@@ -0,0 +1,257 @@
+"""
+EZ-Serial text mode codec.
+
+Commands are the text name followed by key=value parameters, with numbers and
+byte arrays in hex and Bluetooth addresses MSB first:
+
+    /C,A=00A050123456,T=0
+    SAD,D=020106
+
+Responses and events are one line each. Responses carry the result code ahead
+of the fields:
+
+    @R,0013,/PING,0000,R=0012D687,F=3A14
+    @E,002F,BOOT,E=0104100F,S=03150000,P=0103,H=3C,C=01,A=00A050123456
+
+Commands are formatted field by field from their definitions. This takes a
+few microseconds, against milliseconds for the UART round trip, so it is not
+optimized further. Each response and event has a precompiled decoder. Lines
+are split once and the fields decoded by key into the same payload classes as
+binary mode, so code using payloads does not depend on the API mode. Fields
+missing from a line are None.
+
+This is the text mode codec of SyncEzSerialPort and AsyncEzSerialPort.
+common_lib's EzSerialPort has its own parser and does not use it.
+"""
+
+import functools
+from EzSerialApi import API_DEFINITIONS, COMMANDS, EVENTS, KIND_COMMAND
+from EzSerialBinary import LAYOUTS, Packet, RECEIVE_BUFFER_SIZE, TYPE_COMMAND, TYPE_EVENT, layout_key
+
+LINE_END = '\r\n'
+_hex = functools.partial(int, base=16)
+
+
+def _signed(bits: int):
+    sign = 1 << (bits - 1)
+
+    def parse(value: str) -> int:
+        n = int(value, 16)
+        # Negative values can be a minus sign or two's complement
+        return n - (sign << 1) if n >= sign else n
+    return parse
+
+
+def _parse_macaddr(value: str) -> bytes:
+    return bytes.fromhex(value)[::-1]
+
+
+PARSERS = {
+    'uint8': _hex,
+    'uint16': _hex,
+    'uint32': _hex,
+    'int8': _signed(8),
+    'int16': _signed(16),
+    'macaddr': _parse_macaddr,
+    'uint8a': bytes.fromhex,
+    'longuint8a': bytes.fromhex,
+}
+
+FORMATTERS = {
+    'uint8': '{:X}'.format,
+    'uint16': '{:X}'.format,
+    'uint32': '{:X}'.format,
+    'int8': lambda v: f'{v & 0xFF:X}',
+    'int16': lambda v: f'{v & 0xFFFF:X}',
+    'macaddr': lambda v: bytes(v)[::-1].hex().upper(),
+    'uint8a': lambda v: bytes(v).hex().upper(),
+    'longuint8a': lambda v: bytes(v).hex().upper(),
+}
+
+
+class TextCommand:
+    """Encoder of one command.
+    """
+
+    __slots__ = ('name', 'prefix', 'fields')
+
+    def __init__(self, definition):
+        self.name = definition.name
+        self.prefix = definition.text
+        self.fields = [(p.name, f',{p.key}=', FORMATTERS[p.type]) for p in definition.params]
+
+    def encode(self, kwargs: dict) -> bytes:
+        """Encode the command. Parameters that are not given are left out, so the
+        module uses their defaults.
+        """
+        parts = [self.prefix]
+        for name, key, formatter in self.fields:
+            value = kwargs.get(name)
+            if value is not None:
+                parts.append(key)
+                parts.append(formatter(value))
+        parts.append(LINE_END)
+        return ''.join(parts).encode('ascii')
+
+
+class TextLayout:
+    """Precompiled decoder of one response or event line.
+    """
+
+    __slots__ = ('kind', 'name', 'group', 'id', 'payload_class', 'fields', 'count', 'response')
+
+    def __init__(self, binary_layout, fields: list, response: bool):
+        self.kind = binary_layout.kind
+        self.name = binary_layout.name
+        self.group = binary_layout.group
+        self.id = binary_layout.id
+        self.payload_class = binary_layout.payload_class
+        self.response = response
+        # Position in the payload and parser of each field, by key
+        offset = 1 if response else 0
+        self.fields = {f.key: (i + offset, PARSERS[f.type]) for i, f in enumerate(fields)}
+        self.count = len(fields) + offset
+
+    def decode(self, items: list):
+        """Decode the fields of a line.
+
+        Args:
+            items (list): the comma separated items after the name
+        """
+        values = [None] * self.count
+        if items:
+            if self.response:
+                values[0] = int(items[0], 16)
+                items = items[1:]
+            for item in items:
+                key, _, value = item.partition('=')
+                field = self.fields.get(key)
+                if field is not None:
+                    index, parse = field
+                    values[index] = parse(value)
+        return tuple.__new__(self.payload_class, values)
+
+
+def _build() -> tuple:
+    commands = {}
+    layouts = {}
+    for d in API_DEFINITIONS:
+        if d.kind == KIND_COMMAND:
+            binary = LAYOUTS[layout_key(TYPE_COMMAND, d.group, d.id)]
+            commands[d.name] = TextCommand(d)
+            layouts[('R', d.text.upper())] = TextLayout(binary, d.returns, True)
+        else:
+            binary = LAYOUTS[layout_key(TYPE_EVENT, d.group, d.id)]
+            layouts[('E', d.text.upper())] = TextLayout(binary, d.params, False)
+    return commands, layouts
+
+
+TEXT_COMMANDS, TEXT_LAYOUTS = _build()
+
+
+def encode_command(name: str, **kwargs) -> bytes:
+    """Encode a command in text mode.
+
+    Args:
+        name (str): command name, for example system_ping
+        kwargs: command parameters
+
+    Returns:
+        bytes: the command line
+    """
+    return TEXT_COMMANDS[name].encode(kwargs)
+
+
+def encode_line(kind: str, name: str, **kwargs) -> bytes:
+    """Encode a response or event line as the module sends it.
+
+    Args:
+        kind (str): 'R' for a response, 'E' for an event
+        name (str): command or event name
+        kwargs: field values. The result code of a response is its result field,
+        0 if not given.
+
+    Returns:
+        bytes: the line
+    """
+    if kind == 'R':
+        d = COMMANDS[name]
+        fields = d.returns
+        text = f',{d.text},{kwargs.get("result") or 0:04X}'
+    else:
+        d = EVENTS[name]
+        fields = d.params
+        text = f',{d.text}'
+    for f in fields:
+        if kwargs.get(f.name) is not None:
+            text += f',{f.key}={FORMATTERS[f.type](kwargs[f.name])}'
+    return f'@{kind},{len(text) - 1:04X}{text}{LINE_END}'.encode('ascii')
+
+
+def decode_line(line: str):
+    """Decode a response or event line.
+
+    Returns:
+        Packet: the response or event, or None if the line is not one. Unknown
+        responses and events have a payload of the field text.
+    """
+    # @R,<length>,<name>,<fields>
+    items = line.split(',')
+    if len(items) < 3 or items[0] not in ('@R', '@E'):
+        return None
+    kind = items[0][1]
+    layout = TEXT_LAYOUTS.get((kind, items[2].upper()))
+    if layout is None:
+        return Packet('rsp' if kind == 'R' else 'evt', None, None, None, ','.join(items[3:]))
+    return Packet(layout.kind, layout.name, layout.group, layout.id, layout.decode(items[3:]))
+
+
+class TextDecoder:
+    """Splits received data into lines and decodes them.
+    """
+
+    def __init__(self, size: int = RECEIVE_BUFFER_SIZE):
+        self.buffer = bytearray()
+        self.size = size
+        self.packets = 0
+        self.errors = 0
+
+    def reset(self):
+        """Drop any partly received line."""
+        self.buffer.clear()
+
+    def feed(self, data) -> list:
+        """Add received data and decode the lines it completes.
+
+        Args:
+            data: bytes-like received data
+
+        Returns:
+            list: Packet for each response and event. Other lines, such as echoed
+            commands, are skipped.
+        """
+        buf = self.buffer
+        buf += data
+        end = buf.rfind(b'\n')
+        if end < 0:
+            if len(buf) > self.size:
+                # No line end in a full buffer, this is not text mode data
+                self.errors += 1
+                buf.clear()
+            return []
+        text = buf[:end].decode('ascii', 'replace')
+        del buf[:end + 1]
+        packets = []
+        for line in text.split('\n'):
+            if not line.startswith('@'):
+                continue
+            try:
+                packet = decode_line(line.rstrip('\r'))
+            except ValueError:
+                packet = None
+            if packet is None:
+                self.errors += 1
+            else:
+                packets.append(packet)
+        self.packets += len(packets)
+        return packets
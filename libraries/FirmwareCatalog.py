@@ -0,0 +1,268 @@
+"""
+Index of the firmware releases shipped in files/.
+
+Each release directory is named after the version and variant, for example
+"v1.4.16.16_ext-ant_int-lpo", and holds the firmware in several formats, the
+minidriver and the download preset. The index is cached on disk and only
+rebuilt when a release file is added, removed or changed, so resolving a
+variant does not hash the files again on each run.
+
+A PyInstaller onefile build extracts the files to a new directory, with new
+modification times, every time it runs. For files inside such a bundle the
+cache is keyed and stamped on the executable instead.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+from FirmwareImage import CACHE_DIR, file_sha256
+
+CATALOG_FILE_VERSION = 2
+RELEASE_DIR = re.compile(r'^v(?P<version>\d+(?:\.\d+)*)_(?P<variant>.+)$')
+RELEASE_DATE = re.compile(r'^(?P<date>\d{8})_')
+FORMAT_MINIDRIVER = 'minidriver'
+FORMAT_HEX = 'hex'
+FORMAT_HCD = 'hcd'
+FORMAT_OTA = 'ota'
+FORMAT_CGS = 'cgs'
+FORMAT_BTP = 'btp'
+FIRMWARE_FORMATS = (FORMAT_HEX, FORMAT_HCD)
+
+
+def file_format(name: str) -> str:
+    """Get the catalog format of a release file, or None for unknown files."""
+    name = name.lower()
+    if name.startswith('minidriver'):
+        return FORMAT_MINIDRIVER
+    if name.endswith('.ota.bin'):
+        return FORMAT_OTA
+    ext = os.path.splitext(name)[1][1:]
+    if ext in (FORMAT_HEX, FORMAT_HCD, FORMAT_CGS, FORMAT_BTP):
+        return ext
+    return None
+
+
+def normalize_variant(variant: str) -> str:
+    """Normalize a variant name, for example "ext-ant_int-lpo" -> "ext-ant-int-lpo"."""
+    return variant.strip().lower().replace('_', '-')
+
+
+class FirmwareRelease:
+    """One firmware release directory.
+    """
+
+    def __init__(self, variant: str, version: str, date: str, directory: str, files: dict):
+        """Create a release.
+
+        Args:
+            variant (str): normalized variant name, for example "ext-ant-int-lpo"
+            version (str): version string, for example "1.4.16.16"
+            date (str): build date (YYYYMMDD) from the file names, or ''
+            directory (str): release directory
+            files (dict): format -> {'name', 'size', 'sha256'}
+        """
+        self.variant = variant
+        self.version = version
+        self.date = date
+        self.directory = directory
+        self.files = files
+
+    def __repr__(self):
+        return f'FirmwareRelease({self.variant}, v{self.version}, {self.date}, {sorted(self.files)})'
+
+    @property
+    def version_key(self) -> tuple:
+        """Version as a tuple of integers, for sorting."""
+        return tuple(int(v) for v in self.version.split('.'))
+
+    def path(self, fmt: str) -> str:
+        """Get the path of a release file.
+
+        Args:
+            fmt (str): file format, for example FORMAT_HEX
+
+        Returns:
+            str: file path, or None if the release has no file in that format
+        """
+        f = self.files.get(fmt)
+        return os.path.join(self.directory, f['name']) if f else None
+
+    @property
+    def minidriver(self) -> str:
+        """Minidriver file path."""
+        return self.path(FORMAT_MINIDRIVER)
+
+    @property
+    def preset(self) -> str:
+        """Download preset (.btp) file path."""
+        return self.path(FORMAT_BTP)
+
+    def firmware(self, fmt: str = FORMAT_HEX) -> str:
+        """Firmware file path in the given format, falling back to any downloadable format."""
+        for f in (fmt,) + FIRMWARE_FORMATS:
+            path = self.path(f)
+            if path:
+                return path
+        return None
+
+    def to_dict(self) -> dict:
+        """Serialize the release. The directory is stored by name only, as the
+        catalog root can move."""
+        return {'variant': self.variant, 'version': self.version, 'date': self.date,
+                'directory': os.path.basename(self.directory), 'files': self.files}
+
+    @staticmethod
+    def from_dict(d: dict, root: str = '') -> 'FirmwareRelease':
+        return FirmwareRelease(d['variant'], d['version'], d['date'],
+                               os.path.join(root, d['directory']), d['files'])
+
+
+class FirmwareCatalog:
+    """Index of the firmware releases under a directory.
+    """
+
+    def __init__(self, root: str, cache_dir: str = CACHE_DIR):
+        """Load the catalog from the disk cache, or scan the directory if the cache is stale.
+
+        Args:
+            root (str): directory holding the release directories
+            cache_dir (str, optional): directory for the index file, None to disable it.
+        """
+        self.root = os.path.abspath(root)
+        self.bundle = self._bundle()
+        self.cache_file = None
+        if cache_dir:
+            key = hashlib.sha1((self.bundle or self.root).encode()).hexdigest()[:12]
+            self.cache_file = os.path.join(cache_dir, f'catalog-{key}.json')
+        self.releases = []
+        stamps = self._file_stamps()
+        if not self._load(stamps):
+            self._scan()
+            self._save(stamps)
+
+    def _bundle(self) -> str:
+        """Get the PyInstaller executable the root was extracted from, or None."""
+        bundle_dir = getattr(sys, '_MEIPASS', None)
+        if not getattr(sys, 'frozen', False) or not bundle_dir:
+            return None
+        if os.path.commonpath([self.root, os.path.abspath(bundle_dir)]) != os.path.abspath(bundle_dir):
+            return None
+        return os.path.abspath(sys.executable)
+
+    def _file_stamps(self) -> dict:
+        """Size and modification time of each release file, by path relative to
+        the root, or of the executable for files in a bundle.
+        """
+        stamps = {}
+        try:
+            if self.bundle:
+                st = os.stat(self.bundle)
+                stamps[os.path.basename(self.bundle)] = [st.st_size, st.st_mtime_ns]
+                return stamps
+            for entry in os.scandir(self.root):
+                if not entry.is_dir() or not RELEASE_DIR.match(entry.name):
+                    continue
+                for f in os.scandir(entry.path):
+                    if f.is_file() and file_format(f.name):
+                        st = f.stat()
+                        stamps[f'{entry.name}/{f.name}'] = [st.st_size, st.st_mtime_ns]
+        except OSError as e:
+            logging.warning(f'Unable to read firmware directory {self.root}: {e}')
+        return stamps
+
+    def _load(self, stamps: dict) -> bool:
+        if not self.cache_file:
+            return False
+        try:
+            with open(self.cache_file, 'r') as f:
+                d = json.load(f)
+            if d['version'] != CATALOG_FILE_VERSION or d['stamps'] != stamps:
+                return False
+            self.releases = [FirmwareRelease.from_dict(r, self.root) for r in d['releases']]
+            return True
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'Ignoring firmware catalog {self.cache_file}: {e}')
+            return False
+
+    def _save(self, stamps: dict):
+        if not self.cache_file:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp = f'{self.cache_file}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'version': CATALOG_FILE_VERSION, 'stamps': stamps,
+                           'releases': [r.to_dict() for r in self.releases]}, f, indent=1)
+            os.replace(tmp, self.cache_file)
+        except OSError as e:
+            logging.warning(f'Unable to write firmware catalog: {e}')
+
+    def _scan(self):
+        logging.debug(f'Scanning {self.root}')
+        self.releases = []
+        if not os.path.isdir(self.root):
+            return
+        for d in sorted(os.listdir(self.root)):
+            m = RELEASE_DIR.match(d)
+            directory = os.path.join(self.root, d)
+            if not m or not os.path.isdir(directory):
+                continue
+            files = {}
+            date = ''
+            for name in sorted(os.listdir(directory)):
+                fmt = file_format(name)
+                if not fmt or fmt in files:
+                    continue
+                path = os.path.join(directory, name)
+                files[fmt] = {'name': name, 'size': os.path.getsize(path),
+                              'sha256': file_sha256(path)}
+                dm = RELEASE_DATE.match(name)
+                if dm and not date:
+                    date = dm.group('date')
+            self.releases.append(FirmwareRelease(normalize_variant(m.group('variant')),
+                                                 m.group('version'), date, directory, files))
+        self.releases.sort(key=lambda r: (r.variant, r.version_key))
+
+    @property
+    def variants(self) -> list:
+        """Sorted list of variant names."""
+        return sorted({r.variant for r in self.releases})
+
+    def find(self, variant: str = None, version: str = None) -> list:
+        """Find releases, newest first.
+
+        Args:
+            variant (str, optional): variant name. Defaults to any variant.
+            version (str, optional): version, with or without a leading "v". Defaults to any version.
+
+        Returns:
+            list: matching releases
+        """
+        if variant:
+            variant = normalize_variant(variant)
+        if version:
+            version = version.lstrip('vV')
+        releases = [r for r in self.releases
+                    if (not variant or r.variant == variant) and (not version or r.version == version)]
+        return sorted(releases, key=lambda r: (r.version_key, r.date), reverse=True)
+
+    def resolve(self, variant: str = None, version: str = None) -> FirmwareRelease:
+        """Resolve a variant and/or version to a single release, the newest if
+        several versions match.
+
+        Raises:
+            ValueError: no release matches, or the query matches several variants
+        """
+        releases = self.find(variant, version)
+        if not releases:
+            raise ValueError(f'No firmware found for variant {variant or "any"}, version {version or "any"}. '
+                             f'Available variants: {", ".join(self.variants) or "none"}')
+        variants = {r.variant for r in releases}
+        if len(variants) > 1:
+            raise ValueError(f'Several variants match, specify one of: {", ".join(sorted(variants))}')
+        return releases[0]
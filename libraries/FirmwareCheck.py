@@ -0,0 +1,133 @@
+"""
+Check whether a module already runs the firmware it is about to be programmed with.
+
+The application version is queried over the PUART with CMD_QUERY_FW and
+compared with the version in the firmware file name. That is the only check
+made on the module itself. The configuration area cannot be read back from
+the application, so the optional configuration check only looks at the flash
+record this host saved, keyed by Bluetooth address, the last time it
+programmed the module. A module programmed elsewhere, or with a different
+configuration of the same version, passes the version check.
+
+Can be imported as a Robot Framework library.
+"""
+
+import logging
+import os
+import re
+from FirmwareImage import load_image
+from FlashRecord import FlashRecord
+
+FIRMWARE_VERSION = re.compile(r'v(\d+)\.(\d+)\.(\d+)\.(\d+)')
+VERSION = re.compile(r'v?(\d+)\.(\d+)\.(\d+)\.(\d+)$')
+
+
+def _version(m) -> int:
+    version = 0
+    for part in m.groups():
+        version = (version << 8) | (int(part) & 0xFF)
+    return version
+
+
+def firmware_version(firmware: str) -> int:
+    """Get the application version from a firmware file name.
+
+    Args:
+        firmware (str): firmware file, for example "..._v1.4.16.16_download.hex"
+
+    Returns:
+        int: version as reported by CMD_QUERY_FW, for example 0x01041010
+    """
+    m = FIRMWARE_VERSION.search(os.path.basename(firmware))
+    if not m:
+        raise ValueError(f'No version in firmware file name {firmware}')
+    return _version(m)
+
+
+def parse_version(text: str) -> int:
+    """Parse an application version such as "1.4.16.16" or "v1.4.16.16".
+
+    Returns:
+        int: version as reported by CMD_QUERY_FW, for example 0x01041010
+    """
+    m = VERSION.match(text.strip())
+    if not m:
+        raise ValueError(f'Invalid firmware version {text}, expected X.Y.Z.W')
+    return _version(m)
+
+
+def query_firmware_version(board) -> int:
+    """Query the application version of a board.
+
+    Returns:
+        int: application version, or None if the module did not respond
+    """
+    try:
+        err, res = board.p_uart.send_and_wait(board.p_uart.CMD_QUERY_FW)
+    except Exception as e:
+        logging.debug(f'Query firmware version failed: {e}')
+        return None
+    if err != 0:
+        return None
+    return res.payload.app
+
+
+def query_bt_address(board) -> str:
+    """Query the Bluetooth address of a board.
+
+    Returns:
+        str: address as a hex string, or None if the module did not respond
+    """
+    try:
+        err, res = board.p_uart.send_and_wait(board.p_uart.CMD_GET_BT_ADDR)
+    except Exception as e:
+        logging.debug(f'Query Bluetooth address failed: {e}')
+        return None
+    if err != 0:
+        return None
+    return bytes(res.payload.address).hex()
+
+
+def is_firmware_current(board, firmware: str, check_config: bool = False) -> bool:
+    """Check if a board already runs a firmware file.
+
+    Args:
+        board (If820Board): board with an open PUART
+        firmware (str): firmware file
+        check_config (bool, optional): also require a flash record showing the
+        module was last programmed with this exact file. Defaults to False.
+
+    Returns:
+        bool: True if programming can be skipped
+    """
+    expected = firmware_version(firmware)
+    version = query_firmware_version(board)
+    if version is None:
+        logging.info('No response to firmware version query')
+        return False
+    if version != expected:
+        logging.info(
+            f'Firmware version 0x{version:08x} does not match 0x{expected:08x}')
+        return False
+    if check_config:
+        address = query_bt_address(board)
+        record = FlashRecord.load(address) if address else None
+        if not record or record.image_sha256 != load_image(firmware).sha256:
+            logging.info('Configuration does not match the last programmed firmware')
+            return False
+    logging.info(f'Firmware 0x{version:08x} is current')
+    return True
+
+
+def record_firmware(board, firmware: str):
+    """Record that a board was programmed with a firmware file.
+
+    Args:
+        board (If820Board): board running the new firmware, with an open PUART
+        firmware (str): firmware file
+    """
+    address = query_bt_address(board)
+    if not address:
+        logging.warning('Unable to record firmware, no Bluetooth address')
+        return
+    FlashRecord(address, load_image(firmware).sha256).save()
@@ -0,0 +1,262 @@
+"""
+Parsed firmware images and a persistent image cache.
+
+Intel HEX (.hex) and HCI command (.hcd) files are parsed into a compact list of
+contiguous (address, data) segments. Parsed images are kept in memory for the
+life of the process and stored on disk between runs, so each file is only
+parsed once.
+"""
+
+import bisect
+import collections
+import hashlib
+import logging
+import os
+import struct
+import threading
+from FirmwareReader import FirmwareReader
+
+CACHE_DIR = os.environ.get('IF820_CACHE_DIR', os.path.join(
+    os.path.expanduser('~'), '.cache', 'if820'))
+IMAGE_CACHE_DIR = os.path.join(CACHE_DIR, 'images')
+IMAGE_FILE_MAGIC = b'IF820IMG'
+# Version 2: later data wins where merged segments overlap
+IMAGE_FILE_VERSION = 2
+IMAGE_FILE_HEADER = struct.Struct('<8sHBIII')
+IMAGE_FILE_SEGMENT = struct.Struct('<II')
+IMAGE_CACHE_MAX_DISK_ENTRIES = 32
+IMAGE_CACHE_MAX_MEMORY_ENTRIES = 8
+IMAGE_CACHE_MAX_STAT_ENTRIES = 64
+
+
+class FirmwareImage:
+    """A firmware image as a sorted list of contiguous (address, data) segments.
+    """
+
+    def __init__(self, segments: list, launch_address: int = None, record_count: int = 0, sha256: str = ''):
+        """Create an image.
+
+        Args:
+            segments (list): list of (address, bytes) tuples
+            launch_address (int, optional): address to launch after download. Defaults to None.
+            record_count (int, optional): number of data records in the source file. Defaults to 0.
+            sha256 (str, optional): SHA-256 of the source file. Defaults to ''.
+        """
+        self.segments = sorted(segments, key=lambda s: s[0])
+        self.launch_address = launch_address
+        self.record_count = record_count
+        self.sha256 = sha256
+
+    @property
+    def size(self) -> int:
+        """Total number of data bytes in the image."""
+        return sum(len(data) for _, data in self.segments)
+
+    def __repr__(self):
+        return f'FirmwareImage(segments={len(self.segments)}, size={self.size}, sha256={self.sha256[:12]})'
+
+    @staticmethod
+    def parse(path: str, sha256: str = '') -> 'FirmwareImage':
+        """Parse a .hex or .hcd file.
+
+        Args:
+            path (str): file path
+            sha256 (str, optional): SHA-256 of the file, if already known. Defaults to ''.
+
+        Returns:
+            FirmwareImage: parsed image
+        """
+        reader = FirmwareReader(path)
+        segments = merge_segments(list(reader))
+        return FirmwareImage(segments, reader.launch_address, reader.record_count, sha256)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the image to the compact cache file format."""
+        has_launch = self.launch_address is not None
+        parts = [IMAGE_FILE_HEADER.pack(IMAGE_FILE_MAGIC, IMAGE_FILE_VERSION, has_launch,
+                                        self.launch_address if has_launch else 0,
+                                        self.record_count, len(self.segments))]
+        for address, data in self.segments:
+            parts.append(IMAGE_FILE_SEGMENT.pack(address, len(data)))
+            parts.append(bytes(data))
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(data: bytes, sha256: str = '') -> 'FirmwareImage':
+        """Deserialize an image from the compact cache file format."""
+        magic, version, has_launch, launch_address, record_count, count = IMAGE_FILE_HEADER.unpack_from(
+            data)
+        if magic != IMAGE_FILE_MAGIC or version != IMAGE_FILE_VERSION:
+            raise ValueError('Invalid image cache file')
+        offset = IMAGE_FILE_HEADER.size
+        segments = []
+        for _ in range(count):
+            address, length = IMAGE_FILE_SEGMENT.unpack_from(data, offset)
+            offset += IMAGE_FILE_SEGMENT.size
+            segments.append((address, data[offset:offset + length]))
+            offset += length
+        return FirmwareImage(segments, launch_address if has_launch else None, record_count, sha256)
+
+
+def merge_segments(segments: list) -> list:
+    """Merge adjacent and overlapping (address, data) segments.
+    Where segments overlap, later data wins.
+
+    Args:
+        segments (list): list of (address, bytes) tuples in file order
+
+    Returns:
+        list: sorted list of non-overlapping (address, bytes) tuples
+    """
+    if not segments:
+        return []
+    # Find the merged spans, then copy the data in file order so later data wins
+    spans = []
+    for address, data in sorted(segments, key=lambda s: s[0]):
+        end = address + len(data)
+        if spans and address <= spans[-1][1]:
+            spans[-1][1] = max(spans[-1][1], end)
+        else:
+            spans.append([address, end])
+    starts = [start for start, _ in spans]
+    buffers = [bytearray(end - start) for start, end in spans]
+    for address, data in segments:
+        i = bisect.bisect_right(starts, address) - 1
+        offset = address - starts[i]
+        buffers[i][offset:offset + len(data)] = data
+    return [(start, bytes(buf)) for start, buf in zip(starts, buffers)]
+
+
+def file_sha256(path: str) -> str:
+    """Return the SHA-256 hex digest of a file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ImageCache:
+    """Cache of parsed firmware images.
+
+    Images are looked up by file path, modification time and size first, which
+    avoids hashing files that have not changed. Otherwise they are keyed by the
+    SHA-256 of the file contents, in memory and on disk. The least recently
+    used entries are evicted when a limit is reached, from the file index too.
+    """
+
+    def __init__(self, cache_dir: str = IMAGE_CACHE_DIR,
+                 max_disk_entries: int = IMAGE_CACHE_MAX_DISK_ENTRIES,
+                 max_memory_entries: int = IMAGE_CACHE_MAX_MEMORY_ENTRIES,
+                 max_stat_entries: int = IMAGE_CACHE_MAX_STAT_ENTRIES):
+        """Create an image cache.
+
+        Args:
+            cache_dir (str, optional): directory for cache files, None to disable the disk cache.
+            max_disk_entries (int, optional): maximum number of cache files to keep.
+            max_memory_entries (int, optional): maximum number of images to keep in memory.
+            max_stat_entries (int, optional): maximum number of files to remember the hash of.
+        """
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        self.max_memory_entries = max_memory_entries
+        self.max_stat_entries = max_stat_entries
+        self._images = collections.OrderedDict()
+        # path: (mtime, size, sha256), one entry per file however often it changes
+        self._stat_index = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, path: str) -> FirmwareImage:
+        """Load a firmware image, parsing the file only if it is not cached.
+
+        Args:
+            path (str): .hex or .hcd file path
+
+        Returns:
+            FirmwareImage: parsed image
+        """
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        with self._lock:
+            entry = self._stat_index.get(path)
+            if entry and entry[:2] == (st.st_mtime_ns, st.st_size):
+                sha256 = entry[2]
+                self._stat_index.move_to_end(path)
+            else:
+                sha256 = file_sha256(path)
+                self._stat_index[path] = (st.st_mtime_ns, st.st_size, sha256)
+                self._stat_index.move_to_end(path)
+                while len(self._stat_index) > self.max_stat_entries:
+                    self._stat_index.popitem(last=False)
+            image = self._images.get(sha256)
+            if image is not None:
+                self._images.move_to_end(sha256)
+                return image
+            image = self._load_from_disk(sha256)
+            if image is None:
+                logging.debug(f'Parsing {path}')
+                image = FirmwareImage.parse(path, sha256)
+                self._save_to_disk(image)
+            self._images[sha256] = image
+            while len(self._images) > self.max_memory_entries:
+                self._images.popitem(last=False)
+            return image
+
+    def clear(self):
+        """Clear the in-memory cache."""
+        with self._lock:
+            self._images.clear()
+            self._stat_index.clear()
+
+    def _entry_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, f'{sha256}.img')
+
+    def _load_from_disk(self, sha256: str) -> FirmwareImage:
+        if not self.cache_dir:
+            return None
+        entry = self._entry_path(sha256)
+        try:
+            with open(entry, 'rb') as f:
+                image = FirmwareImage.from_bytes(f.read(), sha256)
+            # Update the access time used for eviction
+            os.utime(entry)
+            return image
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logging.warning(f'Ignoring image cache entry {entry}: {e}')
+            return None
+
+    def _save_to_disk(self, image: FirmwareImage):
+        if not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry = self._entry_path(image.sha256)
+            tmp = f'{entry}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(image.to_bytes())
+            os.replace(tmp, entry)
+            self._evict()
+        except OSError as e:
+            logging.warning(f'Unable to write image cache: {e}')
+
+    def _evict(self):
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if name.endswith('.img')]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for entry in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+
+
+image_cache = ImageCache()
+
+
+def load_image(path: str) -> FirmwareImage:
+    """Load a firmware image through the process-wide image cache."""
+    return image_cache.load(path)
@@ -0,0 +1,124 @@
+"""
+Streaming readers for Intel HEX (.hex) and HCI command (.hcd) firmware files.
+
+The file is read one record at a time and consecutive records are coalesced
+into contiguous (address, memoryview) segments of bounded size, so memory use
+does not grow with the file. Segments can be fed straight into a write loop,
+or merged into a FirmwareImage.
+"""
+
+import struct
+
+HCI_VSC_WRITE_RAM = 0xFC4C
+HCI_VSC_LAUNCH_RAM = 0xFC4E
+HCD_HEADER = struct.Struct('<HB')
+HCD_ADDRESS = struct.Struct('<I')
+HEX_EXTENDED_ADDRESS = struct.Struct('>H')
+HEX_START_ADDRESS = struct.Struct('>I')
+HEX_RECORD_DATA = 0x00
+HEX_RECORD_EOF = 0x01
+HEX_RECORD_EXTENDED_SEGMENT_ADDRESS = 0x02
+HEX_RECORD_START_SEGMENT_ADDRESS = 0x03
+HEX_RECORD_EXTENDED_LINEAR_ADDRESS = 0x04
+HEX_RECORD_START_LINEAR_ADDRESS = 0x05
+# Largest segment yielded, matching the flash sector size
+MAX_SEGMENT_SIZE = 4096
+
+
+class FirmwareReader:
+    """Iterate over the contiguous data segments of a .hex or .hcd file.
+
+    The launch address and the number of data records are available once the
+    file has been read to the end.
+    """
+
+    def __init__(self, path: str, max_segment_size: int = MAX_SEGMENT_SIZE):
+        """Create a reader.
+
+        Args:
+            path (str): .hex or .hcd file path
+            max_segment_size (int, optional): largest segment to yield. Defaults to MAX_SEGMENT_SIZE.
+        """
+        self.path = path
+        self.max_segment_size = max_segment_size
+        self.launch_address = None
+        self.record_count = 0
+
+    def __iter__(self):
+        """Yield (address, memoryview) segments in file order.
+
+        Raises:
+            ValueError: the file is malformed
+        """
+        self.launch_address = None
+        self.record_count = 0
+        if self.path.lower().endswith('.hcd'):
+            records = self._hcd_records()
+        else:
+            records = self._hex_records()
+        start = None
+        buf = bytearray()
+        for address, data in records:
+            if buf and (address != start + len(buf) or len(buf) + len(data) > self.max_segment_size):
+                yield start, memoryview(bytes(buf))
+                buf.clear()
+            if not buf:
+                start = address
+            buf += data
+        if buf:
+            yield start, memoryview(bytes(buf))
+
+    def _hex_records(self):
+        base = 0
+        with open(self.path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    if line[0] != ':':
+                        raise ValueError('missing start code')
+                    record = bytes.fromhex(line[1:])
+                    if len(record) < 5 or len(record) != record[0] + 5:
+                        raise ValueError('bad record length')
+                    if sum(record) & 0xFF:
+                        raise ValueError('bad checksum')
+                except (ValueError, IndexError) as e:
+                    raise ValueError(f'{self.path}:{line_number}: {e}')
+                record_type = record[3]
+                data = record[4:-1]
+                if record_type == HEX_RECORD_DATA:
+                    self.record_count += 1
+                    yield base + ((record[1] << 8) | record[2]), data
+                elif record_type == HEX_RECORD_EOF:
+                    return
+                elif record_type == HEX_RECORD_EXTENDED_LINEAR_ADDRESS:
+                    base = HEX_EXTENDED_ADDRESS.unpack(data)[0] << 16
+                elif record_type == HEX_RECORD_EXTENDED_SEGMENT_ADDRESS:
+                    base = HEX_EXTENDED_ADDRESS.unpack(data)[0] << 4
+                elif record_type == HEX_RECORD_START_LINEAR_ADDRESS:
+                    self.launch_address, = HEX_START_ADDRESS.unpack(data)
+                elif record_type != HEX_RECORD_START_SEGMENT_ADDRESS:
+                    raise ValueError(
+                        f'{self.path}:{line_number}: unsupported record type {record_type}')
+
+    def _hcd_records(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                header = f.read(HCD_HEADER.size)
+                if not header:
+                    return
+                if len(header) != HCD_HEADER.size:
+                    raise ValueError(f'{self.path}: truncated HCD command')
+                opcode, length = HCD_HEADER.unpack(header)
+                params = f.read(length)
+                if len(params) != length:
+                    raise ValueError(f'{self.path}: truncated HCD command')
+                if opcode == HCI_VSC_WRITE_RAM:
+                    self.record_count += 1
+                    yield HCD_ADDRESS.unpack_from(params)[0], params[HCD_ADDRESS.size:]
+                elif opcode == HCI_VSC_LAUNCH_RAM:
+                    self.launch_address, = HCD_ADDRESS.unpack_from(params)
+                else:
+                    raise ValueError(
+                        f'{self.path}: unsupported HCD command {hex(opcode)}')
@@ -0,0 +1,76 @@
+"""
+Records of the firmware last written to each board.
+
+A record lists the CRC-32 of every flash region written, so the next download
+to the same board can skip the regions that have not changed.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from FirmwareImage import CACHE_DIR
+
+FLASH_RECORD_DIR = os.path.join(CACHE_DIR, 'boards')
+
+
+class FlashRecord:
+    """Firmware last written to a board.
+    """
+
+    def __init__(self, board_id: str, image_sha256: str = '', regions: list = None, timestamp: float = 0):
+        """Create a record.
+
+        Args:
+            board_id (str): board identifier, for example the probe ID
+            image_sha256 (str, optional): SHA-256 of the firmware file. Defaults to ''.
+            regions (list, optional): list of (address, length, crc32) tuples. Defaults to None.
+            timestamp (float, optional): time the firmware was written. Defaults to 0.
+        """
+        self.board_id = board_id
+        self.image_sha256 = image_sha256
+        self.regions = [tuple(r) for r in regions] if regions else []
+        self.timestamp = timestamp
+
+    @staticmethod
+    def _path(board_id: str, record_dir: str) -> str:
+        name = re.sub(r'[^\w.-]', '_', board_id)
+        return os.path.join(record_dir, f'{name}.json')
+
+    @staticmethod
+    def load(board_id: str, record_dir: str = FLASH_RECORD_DIR) -> 'FlashRecord':
+        """Load the record for a board.
+
+        Returns:
+            FlashRecord: record, or None if the board has no record
+        """
+        try:
+            with open(FlashRecord._path(board_id, record_dir), 'r') as f:
+                d = json.load(f)
+            return FlashRecord(board_id, d['image_sha256'], d['regions'], d['timestamp'])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f'Ignoring flash record for {board_id}: {e}')
+            return None
+
+    def save(self, record_dir: str = FLASH_RECORD_DIR):
+        """Save the record."""
+        self.timestamp = time.time()
+        try:
+            os.makedirs(record_dir, exist_ok=True)
+            with open(FlashRecord._path(self.board_id, record_dir), 'w') as f:
+                json.dump({'image_sha256': self.image_sha256,
+                           'regions': self.regions,
+                           'timestamp': self.timestamp}, f)
+        except OSError as e:
+            logging.warning(f'Unable to save flash record: {e}')
+
+    @staticmethod
+    def delete(board_id: str, record_dir: str = FLASH_RECORD_DIR):
+        """Delete the record for a board, for example after a chip erase."""
+        try:
+            os.remove(FlashRecord._path(board_id, record_dir))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,308 @@
+"""
+Continuous flashing station.
+
+Boards are picked up as they are attached, queued and flashed by a pool of
+workers. After flashing, each board is started and checked over the PUART:
+the application version must match the firmware and the Bluetooth address
+must be readable. Every result is appended to a JSON lines file. A board is
+flashed once per attach; unplug it and attach the next one.
+
+Enumerating the boards opens every debug probe, so it only runs while no
+worker is using its probe. New workers wait while it runs.
+"""
+
+import contextlib
+import json
+import logging
+import queue
+import threading
+import time
+from BoardDiscovery import BoardDiscovery
+from FirmwareCheck import firmware_version, query_bt_address, query_firmware_version
+from FirmwareImage import load_image
+from FlashRecord import FlashRecord
+from HciDownloader import flash_board, flash_board_common_lib, PROGRAMMER_COMMON_LIB, PROGRAMMER_HCI
+
+STATE_QUEUED = 'queued'
+STATE_FLASHING = 'flashing'
+STATE_CHECKING = 'checking'
+STATE_PASSED = 'passed'
+STATE_FAILED = 'failed'
+
+RESULT_PASS = 'PASS'
+RESULT_FAIL = 'FAIL'
+
+# Bytes per second of UART traffic for each bit per second of baud rate
+UART_BYTES_PER_BAUD = 1 / 10
+
+
+class ProbeLock:
+    """Lets any number of workers use their probes at the same time, and board
+    enumeration run only while no probe is in use. Once enumeration is waiting,
+    workers wait for it to finish before using a probe.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.users = 0
+        self._enumerating = False
+
+    @contextlib.contextmanager
+    def use(self):
+        """Use a probe."""
+        with self._condition:
+            self._condition.wait_for(lambda: not self._enumerating)
+            self.users += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.users -= 1
+                self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def enumerate(self):
+        """Enumerate the probes, once no probe is in use."""
+        with self._condition:
+            self._enumerating = True
+            self._condition.wait_for(lambda: not self.users)
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._enumerating = False
+                self._condition.notify_all()
+
+
+class StationBoard:
+    """State of one attached board.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self.probe_id = board.probe.id
+        self.state = STATE_QUEUED
+        self.attached = time.time()
+        self.started = None
+        self.seconds = None
+        self.bt_address = None
+        self.error = ''
+
+    def to_dict(self) -> dict:
+        return {'probe_id': self.probe_id, 'state': self.state, 'attached': self.attached,
+                'seconds': self.seconds, 'bt_address': self.bt_address, 'error': self.error}
+
+
+class FlashStation:
+    """Watches for boards and flashes each one as it is attached.
+    """
+
+    def __init__(self, minidriver: str, firmware: str, workers: int = 1, results_file: str = None,
+                 poll_interval: float = 2.0, check: bool = True, expected_version: int = None,
+                 programmer: str = PROGRAMMER_COMMON_LIB, **options):
+        """Create a station.
+
+        Args:
+            minidriver (str): minidriver .hex file
+            firmware (str): firmware .hex or .hcd file
+            workers (int, optional): boards to flash at the same time. Defaults to 1.
+            results_file (str, optional): JSON lines file to append each result to. Defaults to None.
+            poll_interval (float, optional): seconds between checks for attached boards. Defaults to 2.0.
+            check (bool, optional): start each board after flashing and check its version and
+            Bluetooth address. Defaults to True.
+            expected_version (int, optional): application version the boards must report after
+            flashing. Defaults to the version in the firmware file name.
+            programmer (str, optional): PROGRAMMER_COMMON_LIB or PROGRAMMER_HCI. Defaults to
+            PROGRAMMER_COMMON_LIB.
+            options: passed to flash_board() or flash_board_common_lib()
+
+        Raises:
+            ValueError: if checking and the firmware file name has no version and none is given
+        """
+        self.minidriver = minidriver
+        self.firmware = firmware
+        if check and expected_version is None:
+            expected_version = firmware_version(firmware)
+        self.expected_version = expected_version
+        self.programmer = programmer
+        self.workers = workers
+        self.results_file = results_file
+        self.poll_interval = poll_interval
+        self.check = check
+        self.options = options
+        self.discovery = BoardDiscovery()
+        self.probes = ProbeLock()
+        self.boards = {}
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.started = None
+        self.passed = 0
+        self.failed = 0
+        self.flash_seconds = 0.0
+
+    @staticmethod
+    def usb_workers(max_workers: int, usb_bandwidth: int, baudrate: int) -> int:
+        """Number of boards that can be flashed at once without exceeding the USB bandwidth.
+
+        Args:
+            max_workers (int): most boards to flash at once
+            usb_bandwidth (int): USB bytes per second available for HCI traffic
+            baudrate (int): HCI baud rate while writing
+
+        Returns:
+            int: number of workers, at least 1
+        """
+        per_board = baudrate * UART_BYTES_PER_BAUD
+        return max(1, min(max_workers, int(usb_bandwidth // per_board)))
+
+    def start(self):
+        """Start watching for boards and the workers."""
+        self.started = time.time()
+        self.threads = [threading.Thread(target=self._watch, daemon=True)]
+        self.threads += [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        for t in self.threads:
+            t.start()
+        logging.info(f'Station started with {self.workers} worker(s), '
+                     f'flashing {self.firmware}')
+
+    def stop(self):
+        """Stop after the boards being flashed are done."""
+        self.stop_event.set()
+        for _ in range(self.workers):
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+
+    def _discover(self) -> list:
+        """Get the connected boards, enumerating while no probe is in use if the ports changed.
+        The boards are always enumerated then, so none is left to be resolved by a worker."""
+        if not self.discovery.ports_changed():
+            return self.discovery.get_connected_boards()
+        with self.probes.enumerate():
+            return self.discovery.get_connected_boards(refresh=True)
+
+    def _watch(self):
+        while not self.stop_event.is_set():
+            try:
+                boards = {b.probe.id: b for b in self._discover()}
+            except Exception as e:
+                logging.error(f'Board discovery failed: {e}')
+                boards = None
+            if boards is not None:
+                self._update(boards)
+            self.stop_event.wait(self.poll_interval)
+
+    def _update(self, boards: dict):
+        with self.lock:
+            for probe_id in list(self.boards):
+                status = self.boards[probe_id]
+                if probe_id not in boards and status.state not in (STATE_FLASHING, STATE_CHECKING):
+                    logging.info(f'[{probe_id}] Removed')
+                    del self.boards[probe_id]
+            for probe_id, board in boards.items():
+                if probe_id not in self.boards:
+                    logging.info(f'[{probe_id}] Attached, queued for flashing')
+                    status = StationBoard(board)
+                    self.boards[probe_id] = status
+                    self.queue.put(status)
+
+    def _work(self):
+        while True:
+            status = self.queue.get()
+            if status is None:
+                return
+            with self.probes.use():
+                with self.lock:
+                    if self.boards.get(status.probe_id) is not status:
+                        # Removed while queued
+                        continue
+                    status.state = STATE_FLASHING
+                    status.started = time.monotonic()
+                self._flash(status)
+
+    def _flash(self, status: StationBoard):
+        result = {'time': time.time(), 'probe_id': status.probe_id,
+                  'firmware': self.firmware, 'result': RESULT_FAIL}
+        try:
+            logging.info(f'[{status.probe_id}] Flashing...')
+            if self.programmer == PROGRAMMER_HCI:
+                downloader = flash_board(status.board, self.minidriver, self.firmware, **self.options)
+                result['timing'] = downloader.timing.to_dict()
+            else:
+                flash_board_common_lib(status.board, self.minidriver, self.firmware, **self.options)
+            if self.check:
+                status.state = STATE_CHECKING
+                result.update(self._check(status.board))
+            result['result'] = RESULT_PASS
+        except Exception as e:
+            status.error = str(e)
+            result['error'] = status.error
+            logging.error(f'[{status.probe_id}] Failed: {e}')
+        status.seconds = round(time.monotonic() - status.started, 1)
+        status.bt_address = result.get('bt_address')
+        result['seconds'] = status.seconds
+        with self.lock:
+            if result['result'] == RESULT_PASS:
+                status.state = STATE_PASSED
+                self.passed += 1
+                self.flash_seconds += status.seconds
+                logging.info(f'[{status.probe_id}] Passed in {status.seconds}s')
+            else:
+                status.state = STATE_FAILED
+                self.failed += 1
+        self._save_result(result)
+
+    def _check(self, board) -> dict:
+        """Start the new firmware and check its version and Bluetooth address.
+
+        Returns:
+            dict: firmware version and Bluetooth address
+        """
+        board.open_and_init_board(True)
+        try:
+            version = query_firmware_version(board)
+            if version is None:
+                raise RuntimeError('No response to CMD_QUERY_FW')
+            if version != self.expected_version:
+                raise RuntimeError(
+                    f'Firmware version 0x{version:08x} does not match 0x{self.expected_version:08x}')
+            address = query_bt_address(board)
+            if not address:
+                raise RuntimeError('No response to CMD_GET_BT_ADDR')
+            FlashRecord(address, load_image(self.firmware).sha256).save()
+        finally:
+            board.close_ports_and_reset(False)
+        return {'fw_version': f'0x{version:08x}', 'bt_address': address}
+
+    def _save_result(self, result: dict):
+        if not self.results_file:
+            return
+        with self.lock:
+            try:
+                with open(self.results_file, 'a') as f:
+                    f.write(json.dumps(result) + '\n')
+            except OSError as e:
+                logging.error(f'Unable to save result: {e}')
+
+    def status(self) -> dict:
+        """Station and board status."""
+        with self.lock:
+            return {'firmware': self.firmware,
+                    'started': self.started,
+                    'workers': self.workers,
+                    'boards': [b.to_dict() for b in self.boards.values()]}
+
+    def metrics(self) -> dict:
+        """Station counters."""
+        with self.lock:
+            states = [b.state for b in self.boards.values()]
+            uptime = time.time() - self.started if self.started else 0.0
+            return {'uptime_seconds': round(uptime, 1),
+                    'boards_passed': self.passed,
+                    'boards_failed': self.failed,
+                    'boards_queued': states.count(STATE_QUEUED),
+                    'boards_active': states.count(STATE_FLASHING) + states.count(STATE_CHECKING),
+                    'units_per_hour': round(self.passed * 3600 / uptime, 1) if uptime else 0.0,
+                    'average_seconds': round(self.flash_seconds / self.passed, 1) if self.passed else 0.0}
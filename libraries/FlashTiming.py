@@ -0,0 +1,88 @@
+"""
+Per-phase timing of a firmware download.
+
+Each phase records its elapsed time and the HCI bytes and commands sent while
+it ran, so downloads can be compared between stations and firmware builds.
+"""
+
+import contextlib
+import time
+
+PHASE_HCI_MODE = 'hci_mode'
+PHASE_PROBE = 'probe'
+PHASE_MINIDRIVER = 'minidriver'
+PHASE_REBAUD = 'rebaud'
+PHASE_CHIP_ERASE = 'chip_erase'
+PHASE_COMPARE = 'compare'
+PHASE_WRITE = 'write'
+PHASE_VERIFY = 'verify'
+PHASE_LAUNCH = 'launch'
+PHASE_RESET = 'reset'
+
+
+class FlashPhase:
+    """Totals for one phase.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.bytes = 0
+        self.commands = 0
+        self.count = 0
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'seconds': round(self.seconds, 4), 'bytes': self.bytes,
+                'commands': self.commands, 'count': self.count}
+
+
+class FlashTiming:
+    """Phase timers for one download. A phase that runs more than once is
+    accumulated into a single entry.
+    """
+
+    def __init__(self, counters=None):
+        """Create the timers.
+
+        Args:
+            counters (callable, optional): returns the current (bytes, commands) totals
+            of the link. Defaults to None, which counts nothing.
+        """
+        self.counters = counters or (lambda: (0, 0))
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time a phase. The phase is recorded even if it raises.
+
+        Args:
+            name (str): phase name, for example PHASE_WRITE
+        """
+        bytes_start, commands_start = self.counters()
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            bytes_end, commands_end = self.counters()
+            p = self.phases.setdefault(name, FlashPhase(name))
+            p.seconds += elapsed
+            p.bytes += bytes_end - bytes_start
+            p.commands += commands_end - commands_start
+            p.count += 1
+
+    @property
+    def total(self) -> float:
+        """Total time of all phases in seconds."""
+        return sum(p.seconds for p in self.phases.values())
+
+    def to_dict(self) -> dict:
+        return {'total': round(self.total, 4),
+                'phases': [p.to_dict() for p in self.phases.values()]}
+
+    def __str__(self):
+        lines = [f"{'Phase':<12} {'Time (s)':>9} {'Bytes':>9} {'Commands':>9}"]
+        for p in self.phases.values():
+            lines.append(f'{p.name:<12} {p.seconds:>9.3f} {p.bytes:>9} {p.commands:>9}')
+        lines.append(f"{'total':<12} {self.total:>9.3f}")
+        return '\n'.join(lines)
@@ -0,0 +1,778 @@
+"""
+Download firmware to the IF820 (CYW20820) over the HCI UART.
+
+The ROM bootloader accepts the minidriver at the default HCI baud rate. Once
+the minidriver is running, the link is switched to a faster baud rate and the
+firmware is written to serial flash with vendor specific Write RAM commands.
+"""
+
+import collections
+import logging
+import struct
+import time
+from BtpPreset import BtpPreset
+from ConfigData import config_image
+from FirmwareImage import FirmwareImage, load_image
+from FlashRecord import FlashRecord
+from FlashTiming import (FlashTiming, PHASE_CHIP_ERASE, PHASE_COMPARE, PHASE_HCI_MODE, PHASE_LAUNCH,
+                         PHASE_MINIDRIVER, PHASE_PROBE, PHASE_REBAUD, PHASE_RESET, PHASE_VERIFY, PHASE_WRITE)
+from HciWritePlan import WritePlan, compile_write_plan, DEFAULT_MAX_WRITE_SIZE, HCI_MAX_WRITE_SIZE
+
+LOG_MODULE_HCI_PORT = 'hci_port'
+
+HCI_COMMAND_PKT = 0x01
+HCI_EVENT_PKT = 0x04
+HCI_EVENT_COMMAND_COMPLETE = 0x0E
+HCI_EVENT_COMMAND_STATUS = 0x0F
+HCI_COMMAND_HEADER = struct.Struct('<BHB')
+# Num_HCI_Command_Packets, opcode, status
+HCI_COMMAND_COMPLETE = struct.Struct('<BHB')
+# Status, Num_HCI_Command_Packets, opcode
+HCI_COMMAND_STATUS = struct.Struct('<BBH')
+HCI_ADDRESS = struct.Struct('<I')
+HCI_BAUDRATE = struct.Struct('<HI')
+HCI_READ_RAM = struct.Struct('<IB')
+# Experimental: the minidriver is assumed to answer 0xFCCC with the CRC-32
+# (zlib.crc32) of a memory range. This is not confirmed on hardware.
+HCI_VERIFY_CRC = struct.Struct('<II')
+HCI_CRC = struct.Struct('<I')
+
+HCI_RESET = 0x0C03
+HCI_VSC_UPDATE_BAUDRATE = 0xFC18
+HCI_VSC_DOWNLOAD_MINIDRIVER = 0xFC2E
+HCI_VSC_WRITE_RAM = 0xFC4C
+HCI_VSC_READ_RAM = 0xFC4D
+HCI_VSC_LAUNCH_RAM = 0xFC4E
+HCI_VSC_VERIFY_CRC = 0xFCCC
+HCI_VSC_CHIP_ERASE = 0xFFCE
+HCI_CHIP_ERASE_KEY = 0xFCBEEEEF
+HCI_LAUNCH_ADDRESS_DEFAULT = 0xFFFFFFFF
+HCI_STATUS_SUCCESS = 0
+HCI_STATUS_UNKNOWN_COMMAND = 0x01
+
+VERIFY_NONE = 'none'
+VERIFY_CRC = 'crc'
+VERIFY_READBACK = 'readback'
+VERIFY_MODES = (VERIFY_NONE, VERIFY_CRC, VERIFY_READBACK)
+# How skip_unchanged finds unchanged flash sectors: on the target, or from the
+# record of the last download to the board
+SKIP_TARGET = 'target'
+SKIP_RECORD = 'record'
+SKIP_UNCHANGED_MODES = (SKIP_TARGET, SKIP_RECORD)
+# Programmers: If820Board.flash_firmware() from common_lib, or HciDownloader
+PROGRAMMER_COMMON_LIB = 'common_lib'
+PROGRAMMER_HCI = 'hci'
+PROGRAMMERS = (PROGRAMMER_COMMON_LIB, PROGRAMMER_HCI)
+
+
+class HciError(Exception):
+    """Error while communicating with the HCI download target."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class HciDownloader:
+    """HCI firmware downloader for the IF820.
+    """
+
+    HCI_DEFAULT_BAUDRATE = 115200
+    HCI_FLASH_FIRMWARE_BAUDRATE = 3000000
+    COMMAND_TIMEOUT_SECONDS = 1
+    DRAIN_TIMEOUT_SECONDS = 0.05
+    MAX_RETRIES = 3
+    CHIP_ERASE_TIMEOUT_SECONDS = 60
+    POST_RESET_DELAY_SECONDS = 0.1
+    PROBE_TIMEOUT_SECONDS = 0.2
+    MINIDRIVER_SIGNATURE_SIZE = 64
+
+    def __init__(self, port_name: str, max_write_size: int = None, preset: BtpPreset = None,
+                 window: int = 1, verify: str = None):
+        """Create a downloader.
+        Download settings are taken from the preset when one is given.
+
+        Args:
+            port_name (str): HCI UART port name
+            max_write_size (int, optional): maximum data bytes per Write RAM command.
+            Defaults to the preset value or DEFAULT_MAX_WRITE_SIZE.
+            preset (BtpPreset, optional): download preset. Defaults to None.
+            window (int, optional): number of writes to keep in flight. 1 waits for each
+            write to complete before sending the next one. Defaults to 1.
+            verify (str, optional): one of VERIFY_MODES. Defaults to VERIFY_READBACK if the preset
+            asks for verification, otherwise VERIFY_NONE. VERIFY_CRC is experimental, and is the
+            only mode that uses the CRC command, also to find unchanged sectors.
+        """
+        if window < 1:
+            raise ValueError(f'Invalid window {window}')
+        if verify is not None and verify not in VERIFY_MODES:
+            raise ValueError(f'Invalid verify mode {verify}')
+        self.port_name = port_name
+        self.window = window
+        self.retransmits = 0
+        self.preset = preset
+        self.baudrate = self.HCI_FLASH_FIRMWARE_BAUDRATE
+        self.max_write_size = DEFAULT_MAX_WRITE_SIZE
+        self.verify = VERIFY_NONE
+        self.verify_time = 0.0
+        self.post_reset_delay = self.POST_RESET_DELAY_SECONDS
+        self.sector_size = BtpPreset.DEFAULT_PAGE_SIZE
+        self.sectors_total = 0
+        # Addresses of the sectors found unchanged by the last changed_sectors()
+        self.unchanged_sectors = []
+        # Set once a CRC matched or a CRC mismatch was confirmed by reading back
+        self.crc_trusted = False
+        self.erase_time = 0.0
+        if preset:
+            self.sector_size = preset.page_size
+            self.baudrate = preset.minidriver_rebaud_rate
+            self.max_write_size = preset.max_write_size
+            self.verify = VERIFY_READBACK if preset.verify else VERIFY_NONE
+            self.post_reset_delay = preset.post_reset_delay_ms / 1000
+        if max_write_size:
+            self.max_write_size = max_write_size
+        if verify:
+            self.verify = verify
+        # CRCs are only used when asked for, and cleared once the minidriver
+        # turns out not to support the CRC command as assumed
+        self.crc_supported = self.verify == VERIFY_CRC
+        if self.crc_supported:
+            logging.warning('CRC verify is experimental: the minidriver is assumed to answer '
+                            f'{hex(HCI_VSC_VERIFY_CRC)} with a CRC-32')
+        self.port = None
+        # Commands the controller can take, from the last Command Complete or Status
+        self.credits = 1
+        self.commands_sent = 0
+        self.bytes_sent = 0
+        self.timing = FlashTiming(lambda: (self.bytes_sent, self.commands_sent))
+        self.plan = None
+        # Baud rate of a minidriver left running by an earlier download, or None
+        self.minidriver_baudrate = None
+        self.logger = logging.getLogger(LOG_MODULE_HCI_PORT)
+
+    def open(self, baudrate: int = HCI_DEFAULT_BAUDRATE):
+        """Open the HCI port.
+
+        Args:
+            baudrate (int, optional): baud rate. Defaults to HCI_DEFAULT_BAUDRATE.
+        """
+        import serial
+        self.port = serial.Serial(self.port_name, baudrate,
+                                  timeout=self.COMMAND_TIMEOUT_SECONDS)
+        self.port.reset_input_buffer()
+        # A controller takes one command until it reports otherwise
+        self.credits = 1
+
+    def close(self):
+        """Close the HCI port."""
+        if self.port:
+            self.port.close()
+            self.port = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_command(self, opcode: int, params: bytes = b''):
+        packet = HCI_COMMAND_HEADER.pack(
+            HCI_COMMAND_PKT, opcode, len(params)) + bytes(params)
+        self.logger.debug(f'TX: {packet.hex()}')
+        self.port.write(packet)
+        self.commands_sent += 1
+        self.bytes_sent += len(packet)
+
+    def _read_event(self, timeout: float) -> tuple:
+        """Read one HCI event.
+
+        Returns:
+            tuple: (event code, parameters)
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.port.timeout = max(deadline - time.monotonic(), 0)
+            pkt_type = self.port.read(1)
+            if not pkt_type:
+                raise HciError('Timeout waiting for HCI event')
+            if pkt_type[0] != HCI_EVENT_PKT:
+                self.logger.debug(f'Ignoring byte {pkt_type.hex()}')
+                continue
+            header = self.port.read(2)
+            params = self.port.read(header[1]) if len(header) == 2 else b''
+            if len(header) != 2 or len(params) != header[1]:
+                raise HciError('Timeout reading HCI event')
+            self.logger.debug(f'RX: {(pkt_type + header + params).hex()}')
+            return header[0], params
+
+    def _read_command_complete(self, timeout: float) -> tuple:
+        """Read the next Command Complete event, or a failed Command Status event.
+        The number of commands the controller can take is kept in credits.
+
+        Returns:
+            tuple: (opcode, status, return parameters)
+        """
+        while True:
+            code, params = self._read_event(timeout)
+            if code == HCI_EVENT_COMMAND_COMPLETE:
+                self.credits, opcode, status = HCI_COMMAND_COMPLETE.unpack_from(params)
+                return opcode, status, params[HCI_COMMAND_COMPLETE.size:]
+            if code == HCI_EVENT_COMMAND_STATUS:
+                status, self.credits, opcode = HCI_COMMAND_STATUS.unpack_from(params)
+                if status != HCI_STATUS_SUCCESS:
+                    return opcode, status, b''
+
+    def _wait_command_complete(self, opcode: int, timeout: float) -> bytes:
+        while True:
+            rsp_opcode, status, data = self._read_command_complete(timeout)
+            if rsp_opcode != opcode:
+                continue
+            if status != HCI_STATUS_SUCCESS:
+                raise HciError(
+                    f'Command {hex(opcode)} failed with status {hex(status)}', status)
+            return data
+
+    def _drain(self):
+        """Discard input until the target has been quiet for a short time."""
+        self.port.timeout = self.DRAIN_TIMEOUT_SECONDS
+        while self.port.read(256):
+            pass
+
+    def send_command(self, opcode: int, params: bytes = b'', timeout: float = COMMAND_TIMEOUT_SECONDS) -> bytes:
+        """Send an HCI command and wait for it to complete.
+
+        Args:
+            opcode (int): command opcode
+            params (bytes, optional): command parameters. Defaults to b''.
+            timeout (float, optional): time to wait for Command Complete.
+
+        Returns:
+            bytes: return parameters after the status byte
+        """
+        self._write_command(opcode, params)
+        return self._wait_command_complete(opcode, timeout)
+
+    def reset(self):
+        """Send HCI Reset."""
+        self.send_command(HCI_RESET)
+
+    def set_baudrate(self, baudrate: int):
+        """Switch the target and the host port to a new baud rate."""
+        self.send_command(HCI_VSC_UPDATE_BAUDRATE,
+                          HCI_BAUDRATE.pack(0, baudrate))
+        self.port.baudrate = baudrate
+        self.port.reset_input_buffer()
+
+    def write_ram(self, address: int, data: bytes):
+        """Write data to the target memory map."""
+        self.send_command(HCI_VSC_WRITE_RAM,
+                          HCI_ADDRESS.pack(address) + bytes(data))
+
+    def read_ram(self, address: int, length: int) -> bytes:
+        """Read data from the target memory map."""
+        data = self.send_command(
+            HCI_VSC_READ_RAM, HCI_READ_RAM.pack(address, length))
+        if len(data) != length:
+            raise HciError(
+                f'Read {hex(address)} returned {len(data)} of {length} bytes')
+        return data
+
+    def launch_ram(self, address: int = HCI_LAUNCH_ADDRESS_DEFAULT):
+        """Start execution at an address."""
+        self.send_command(HCI_VSC_LAUNCH_RAM, HCI_ADDRESS.pack(address))
+
+    def chip_erase(self):
+        """Erase the whole serial flash. The time it took is kept in erase_time."""
+        logging.info('Chip erase...')
+        start = time.monotonic()
+        self.send_command(HCI_VSC_CHIP_ERASE, HCI_ADDRESS.pack(HCI_CHIP_ERASE_KEY),
+                          self.CHIP_ERASE_TIMEOUT_SECONDS)
+        self.erase_time = time.monotonic() - start
+        logging.info(f'Chip erase took {self.erase_time:.1f}s')
+
+    def write_plan(self, plan: WritePlan, progress=None):
+        """Execute a write plan, keeping up to window writes in flight, and no
+        more than the controller reported it can take in its last Command
+        Complete (Num_HCI_Command_Packets).
+        Completions arrive in the order the writes were sent, so each one is
+        matched to the oldest outstanding write. Failed writes are sent again.
+        Writes are taken from the plan as they are sent, so the plan can also
+        be a generator such as iter_writes(FirmwareReader(path)).
+
+        Args:
+            plan (WritePlan): plan to write, or any iterable of (address, data) writes
+            progress (callable, optional): called with (bytes written, total bytes), where
+            total is 0 if the plan size is not known. Defaults to None.
+        """
+        total = plan.size if isinstance(plan, WritePlan) else 0
+        written = 0
+        writes = enumerate(plan)
+        # Entries are (sequence number, address, data, retries)
+        retries = collections.deque()
+        in_flight = collections.deque()
+        while True:
+            while len(in_flight) < self._write_limit(in_flight):
+                if retries:
+                    entry = retries.popleft()
+                else:
+                    seq, write = next(writes, (None, None))
+                    if write is None:
+                        break
+                    entry = (seq, write[0], write[1], 0)
+                self._write_command(HCI_VSC_WRITE_RAM,
+                                    HCI_ADDRESS.pack(entry[1]) + bytes(entry[2]))
+                in_flight.append(entry)
+            if not in_flight:
+                break
+            try:
+                opcode, status, _ = self._read_command_complete(
+                    self.COMMAND_TIMEOUT_SECONDS)
+            except HciError:
+                # A write or its completion was lost. Writes can be repeated
+                # safely, so send everything that is outstanding again.
+                self._drain()
+                logging.warning(
+                    f'Timeout on write {in_flight[0][0]}, resending {len(in_flight)} writes')
+                for entry in reversed(in_flight):
+                    retries.appendleft(self._retry_entry(entry))
+                in_flight.clear()
+                self.credits = 1
+                continue
+            if opcode != HCI_VSC_WRITE_RAM:
+                continue
+            entry = in_flight.popleft()
+            if status != HCI_STATUS_SUCCESS:
+                logging.warning(
+                    f'Write {entry[0]} to {hex(entry[1])} failed with status {hex(status)}, resending')
+                retries.appendleft(self._retry_entry(entry))
+                continue
+            written += len(entry[2])
+            if progress:
+                progress(written, total)
+
+    def _write_limit(self, in_flight) -> int:
+        """Most writes to keep in flight. With none in flight one write is sent
+        anyway, since no completion is outstanding to report new credits."""
+        return max(min(self.window, self.credits), 0 if in_flight else 1)
+
+    def _retry_entry(self, entry: tuple) -> tuple:
+        seq, address, data, retries = entry
+        if retries >= self.MAX_RETRIES:
+            raise HciError(
+                f'Write {seq} to {hex(address)} failed after {retries} retries')
+        self.retransmits += 1
+        return seq, address, data, retries + 1
+
+    def read_crc(self, address: int, length: int) -> int:
+        """Ask the minidriver for the CRC-32 of a memory range."""
+        data = self.send_command(
+            HCI_VSC_VERIFY_CRC, HCI_VERIFY_CRC.pack(address, length))
+        return HCI_CRC.unpack_from(data)[0]
+
+    def crc_unsupported(self, error: HciError) -> bool:
+        """Check if a failed read_crc() means the minidriver has no CRC command.
+        It either rejects the command or does not answer it at all.
+        """
+        if error.status is None:
+            # Drop a late answer so it is not taken for the next command's
+            self._drain()
+        elif error.status != HCI_STATUS_UNKNOWN_COMMAND:
+            return False
+        self.crc_supported = False
+        return True
+
+    def _read_back_matches(self, address: int, data: bytes) -> bool:
+        for offset in range(0, len(data), HCI_MAX_WRITE_SIZE):
+            chunk = data[offset:offset + HCI_MAX_WRITE_SIZE]
+            if self.read_ram(address + offset, len(chunk)) != chunk:
+                return False
+        return True
+
+    def crc_matches(self, address: int, data: bytes, crc: int) -> bool:
+        """Check a flash region against the image by CRC.
+
+        Until a CRC has matched, a mismatch may only mean that the minidriver
+        computes something else, so the region is read back. If it holds the
+        data, CRCs are not used for the rest of the session.
+
+        Args:
+            address (int): region address
+            data (bytes): expected data
+            crc (int): CRC-32 of the data
+
+        Returns:
+            bool: True if the target holds the data, or None if CRCs cannot be used
+        """
+        if not self.crc_supported:
+            return None
+        try:
+            if self.read_crc(address, len(data)) == crc:
+                self.crc_trusted = True
+                return True
+        except HciError as e:
+            if not self.crc_unsupported(e):
+                raise
+            logging.info(f'CRC not supported ({e}), reading back')
+            return None
+        if self.crc_trusted:
+            return False
+        if self._read_back_matches(address, data):
+            logging.warning(f'CRC mismatch at {hex(address)} on data that reads back correctly, '
+                            'not using CRCs')
+            self.crc_supported = False
+            return True
+        self.crc_trusted = True
+        return False
+
+    def region_matches(self, address: int, data: bytes, crc: int) -> bool:
+        """Check a flash region against the image, by CRC if enabled and the
+        minidriver supports it, otherwise by reading it back.
+
+        Args:
+            address (int): region address
+            data (bytes): expected data
+            crc (int): CRC-32 of the data
+
+        Returns:
+            bool: True if the target holds the data
+        """
+        matches = self.crc_matches(address, data, crc)
+        if matches is None:
+            return self._read_back_matches(address, data)
+        return matches
+
+    def _verify_readback(self, address: int, expected: bytes):
+        for offset in range(0, len(expected), HCI_MAX_WRITE_SIZE):
+            chunk = expected[offset:offset + HCI_MAX_WRITE_SIZE]
+            if self.read_ram(address + offset, len(chunk)) != chunk:
+                raise HciError(f'Verify failed at {hex(address + offset)}')
+
+    def verify_plan(self, plan: WritePlan, mode: str = VERIFY_READBACK):
+        """Check that everything written by a plan is in the target.
+
+        In CRC mode, the minidriver computes the CRC-32 of each written region
+        and only regions that do not match the precomputed value are read back.
+        If the minidriver rejects or does not answer the CRC command, or its
+        CRCs turn out not to be CRC-32s, all data is read back.
+
+        Args:
+            plan (WritePlan): plan that was written
+            mode (str, optional): VERIFY_CRC or VERIFY_READBACK. Defaults to VERIFY_READBACK.
+        """
+        start = time.monotonic()
+        mismatched = 0
+        regions = plan.regions()
+        for address, data, crc in regions:
+            if mode == VERIFY_CRC:
+                matches = self.crc_matches(address, data, crc)
+                if matches:
+                    continue
+                if matches is None:
+                    mode = VERIFY_READBACK
+                else:
+                    mismatched += 1
+                    logging.warning(
+                        f'CRC mismatch at {hex(address)}, reading back {len(data)} bytes')
+            self._verify_readback(address, data)
+        self.verify_time = time.monotonic() - start
+        logging.info(
+            f'Verified {len(regions)} regions ({mode}, {mismatched} read back) in {self.verify_time:.2f}s')
+
+    def download_minidriver(self, minidriver: FirmwareImage):
+        """Load and start the minidriver from the ROM bootloader."""
+        logging.info('Download minidriver...')
+        self.reset()
+        self.send_command(HCI_VSC_DOWNLOAD_MINIDRIVER)
+        self.write_plan(compile_write_plan(minidriver, self.max_write_size))
+        self.launch_ram(minidriver.launch_address if minidriver.launch_address is not None
+                        else HCI_LAUNCH_ADDRESS_DEFAULT)
+        time.sleep(self.post_reset_delay)
+
+    def minidriver_resident(self, minidriver: FirmwareImage, baudrate: int) -> bool:
+        """Check if the minidriver is still running at the given baud rate.
+
+        The first bytes of the minidriver are read back from RAM at that baud
+        rate. The ROM bootloader only talks at the default baud rate, so it
+        cannot answer. On success the port is left open at the new baud rate.
+
+        Args:
+            minidriver (FirmwareImage): minidriver image
+            baudrate (int): baud rate the minidriver was switched to
+
+        Returns:
+            bool: True if the minidriver download and rebaud can be skipped
+        """
+        if not minidriver.segments:
+            return False
+        address, data = minidriver.segments[0]
+        signature = bytes(data[:self.MINIDRIVER_SIGNATURE_SIZE])
+        self.open(baudrate)
+        try:
+            self._write_command(HCI_VSC_READ_RAM, HCI_READ_RAM.pack(
+                address, len(signature)))
+            if self._wait_command_complete(HCI_VSC_READ_RAM, self.PROBE_TIMEOUT_SECONDS) == signature:
+                return True
+        except HciError as e:
+            logging.debug(f'Minidriver probe failed: {e}')
+        self.close()
+        return False
+
+    def changed_sectors(self, image: FirmwareImage, mode: str = SKIP_TARGET, record_id: str = None) -> list:
+        """Find the flash sectors that differ from the image.
+
+        In SKIP_TARGET mode each sector the image covers is checked on the
+        target, by CRC in VERIFY_CRC mode, otherwise by reading it back. In
+        SKIP_RECORD mode the record of the firmware last written to the board
+        is used instead. When the record lists no changes, the sectors are
+        still checked on the target. Without a record every sector is changed.
+        The addresses of the other sectors are kept in unchanged_sectors.
+
+        Args:
+            image (FirmwareImage): image to write
+            mode (str, optional): one of SKIP_UNCHANGED_MODES. Defaults to SKIP_TARGET.
+            record_id (str, optional): board identifier of the flash record. Defaults to None.
+
+        Returns:
+            list: (address, data, crc32) of the changed sectors
+        """
+        regions = compile_write_plan(
+            image, self.max_write_size).regions(self.sector_size)
+        changed = None
+        if mode == SKIP_RECORD:
+            record = FlashRecord.load(record_id) if record_id else None
+            known = set(record.regions) if record else set()
+            changed = [r for r in regions
+                       if (r[0], len(r[1]), r[2]) not in known]
+            if not changed:
+                logging.info('No sectors changed since the flash record, checking the target')
+                changed = None
+        if changed is None:
+            changed = [r for r in regions if not self.region_matches(*r)]
+        changed_addresses = {r[0] for r in changed}
+        self.sectors_total = len(regions)
+        self.unchanged_sectors = [r[0] for r in regions if r[0] not in changed_addresses]
+        logging.info(
+            f'{len(changed)} of {len(regions)} sectors changed')
+        return changed
+
+    def save_record(self, image: FirmwareImage, record_id: str):
+        """Record the sectors of an image as written to a board."""
+        regions = compile_write_plan(
+            image, self.max_write_size).regions(self.sector_size)
+        FlashRecord(record_id, image.sha256,
+                    [(address, len(data), crc) for address, data, crc in regions]).save()
+
+    def program_firmware(self, minidriver: str, firmware: str = None,
+                         baudrate: int = None,
+                         chip_erase: bool = False, progress=None,
+                         skip_unchanged: str = None, dry_run: bool = False, record_id: str = None,
+                         config: dict = None, hci_mode=None):
+        """Program firmware. The target must be in HCI download mode, or still
+        run the minidriver from an earlier call on this downloader.
+
+        Args:
+            minidriver (str): minidriver .hex file
+            firmware (str, optional): firmware .hex or .hcd file. None to only erase. Defaults to None.
+            baudrate (int, optional): baud rate for the download. Defaults to the preset value
+            or HCI_FLASH_FIRMWARE_BAUDRATE.
+            chip_erase (bool, optional): erase the whole flash first. Defaults to False.
+            progress (callable, optional): called with (bytes written, total bytes). Defaults to None.
+            skip_unchanged (str, optional): one of SKIP_UNCHANGED_MODES to skip the download when
+            the image is already on the board. When any sector differs, the chip is erased and the
+            whole image written, since the minidriver cannot erase single sectors. Defaults to None.
+            dry_run (bool, optional): only report what would be erased and written, and the
+            unchanged sectors. Defaults to False.
+            record_id (str, optional): board identifier for the flash record, needed by
+            SKIP_RECORD. Defaults to None.
+            config (dict, optional): per-unit settings for ConfigData.config_image() to patch
+            into the firmware. The chip is erased and the whole image written, as the config
+            records share sectors with the rest of the image, so this is no faster than a full
+            download. No flash record is kept since the image matches no file. Defaults to None.
+            hci_mode (callable, optional): puts the target back into HCI download mode when the
+            minidriver left running by an earlier call no longer answers. Defaults to None.
+        """
+        if config and (skip_unchanged or not firmware):
+            raise ValueError('Config update needs firmware and cannot be combined with skip unchanged')
+        if skip_unchanged and chip_erase:
+            raise ValueError('Skip unchanged cannot be combined with chip erase')
+        if skip_unchanged and skip_unchanged not in SKIP_UNCHANGED_MODES:
+            raise ValueError(f'Invalid skip unchanged mode {skip_unchanged}')
+        if skip_unchanged and not firmware:
+            raise ValueError('Skip unchanged needs firmware')
+        if skip_unchanged == SKIP_RECORD and not record_id:
+            raise ValueError('Skip unchanged record mode needs a record_id')
+        if dry_run and not firmware:
+            raise ValueError('Dry run needs firmware')
+        baudrate = baudrate or self.baudrate
+        minidriver_image = load_image(minidriver)
+        image = load_image(firmware) if firmware else None
+        if config:
+            image = config_image(image, **config)
+            # The settings share sectors with the rest of the image, and the
+            # minidriver can only erase the whole chip
+            chip_erase = True
+            logging.info(f'Config update: {", ".join(f"{k}={v}" for k, v in config.items())}')
+        start = time.monotonic()
+        self.commands_sent = 0
+        self.bytes_sent = 0
+        self.retransmits = 0
+        resident = False
+        if self.minidriver_baudrate == baudrate != self.HCI_DEFAULT_BAUDRATE:
+            with self.timing.phase(PHASE_PROBE):
+                resident = self.minidriver_resident(minidriver_image, baudrate)
+            if not resident:
+                logging.info('Minidriver not responding')
+                if hci_mode:
+                    hci_mode()
+        if not resident:
+            self.open(self.HCI_DEFAULT_BAUDRATE)
+        try:
+            if resident:
+                logging.info('Minidriver already running, skipping download')
+            else:
+                self.minidriver_baudrate = None
+                with self.timing.phase(PHASE_MINIDRIVER):
+                    self.download_minidriver(minidriver_image)
+                if baudrate != self.HCI_DEFAULT_BAUDRATE:
+                    with self.timing.phase(PHASE_REBAUD):
+                        self.set_baudrate(baudrate)
+                self.minidriver_baudrate = baudrate
+            changed = None
+            if skip_unchanged:
+                with self.timing.phase(PHASE_COMPARE):
+                    changed = self.changed_sectors(image, skip_unchanged, record_id)
+                # Changed sectors must be erased before they are written, and
+                # the minidriver can only erase the whole chip
+                chip_erase = bool(changed)
+            if image:
+                self.plan = compile_write_plan(
+                    image, self.max_write_size, chip_erase)
+            if dry_run:
+                if changed is not None:
+                    logging.info(
+                        f'Dry run: {len(self.unchanged_sectors)} of {self.sectors_total} sectors unchanged: '
+                        f'{", ".join(hex(a) for a in self.unchanged_sectors) or "none"}')
+                if changed == []:
+                    logging.info('Dry run: image unchanged, would skip the download')
+                else:
+                    logging.info(f'Dry run: would {"chip erase and " if chip_erase else ""}write '
+                                 f'{self.plan.size} bytes in {self.plan.commands} commands')
+                with self.timing.phase(PHASE_LAUNCH):
+                    self.launch_ram()
+                self.minidriver_baudrate = None
+                return
+            if chip_erase:
+                with self.timing.phase(PHASE_CHIP_ERASE):
+                    self.chip_erase()
+                if record_id:
+                    FlashRecord.delete(record_id)
+            if image and changed == []:
+                logging.info('Image unchanged, skipping the download')
+            elif image:
+                logging.info(
+                    f'Writing {self.plan.size} bytes in {self.plan.commands} commands '
+                    f'({self.plan.source_commands} in source file)...')
+                with self.timing.phase(PHASE_WRITE):
+                    self.write_plan(self.plan, progress)
+                if self.verify != VERIFY_NONE:
+                    with self.timing.phase(PHASE_VERIFY):
+                        self.verify_plan(self.plan, self.verify)
+                if record_id and not config:
+                    self.save_record(image, record_id)
+            if image:
+                with self.timing.phase(PHASE_LAUNCH):
+                    self.launch_ram(self.plan.launch_address if self.plan.launch_address is not None
+                                    else HCI_LAUNCH_ADDRESS_DEFAULT)
+                self.minidriver_baudrate = None
+        finally:
+            self.close()
+        logging.info(
+            f'Done in {time.monotonic() - start:.1f}s '
+            f'({self.commands_sent} HCI commands, {self.retransmits} retransmits)')
+        logging.debug(f'Timing:\n{self.timing}')
+
+
+def reset_board(board):
+    """Reset the module through the debug probe, which also takes it out of HCI download mode."""
+    board.probe.open()
+    try:
+        board.probe.reset_target()
+    finally:
+        board.probe.close()
+
+
+def flash_board_common_lib(board, minidriver: str, firmware: str = None, chip_erase: bool = False):
+    """Program an If820Board with the qualified common_lib HciProgrammer.
+
+    Args:
+        board (If820Board): board to flash
+        minidriver (str): minidriver .hex file
+        firmware (str, optional): firmware .hex or .hcd file. None to only erase. Defaults to None.
+        chip_erase (bool, optional): erase the whole flash first. Defaults to False.
+    """
+    try:
+        board.flash_firmware(minidriver, firmware, chip_erase)
+    except Exception:
+        board.cancel_flash_firmware()
+        raise
+
+
+def flash_board(board, minidriver: str, firmware: str = None, chip_erase: bool = False,
+                progress=None, preset: BtpPreset = None, window: int = 1,
+                verify: str = None, skip_unchanged: str = None, dry_run: bool = False,
+                config: dict = None, retries: int = 1) -> HciDownloader:
+    """Put an If820Board into HCI download mode, program it with HciDownloader
+    and reset it. A download that fails is retried, reusing the minidriver if
+    it is still running.
+
+    Args:
+        board (If820Board): board to flash
+        minidriver (str): minidriver .hex file
+        firmware (str, optional): firmware .hex or .hcd file. None to only erase. Defaults to None.
+        chip_erase (bool, optional): erase the whole flash first. Defaults to False.
+        progress (callable, optional): called with (bytes written, total bytes). Defaults to None.
+        preset (BtpPreset, optional): download preset. Defaults to None.
+        window (int, optional): number of writes to keep in flight. Defaults to 1.
+        verify (str, optional): one of VERIFY_MODES. Defaults to the preset setting.
+        skip_unchanged (str, optional): one of SKIP_UNCHANGED_MODES to skip the download when
+        the image is already on the board. Defaults to None.
+        dry_run (bool, optional): only report what would be erased and written. Defaults to False.
+        config (dict, optional): per-unit settings to patch into the firmware. Defaults to None.
+        retries (int, optional): times to retry a download that failed. Defaults to 1.
+
+    Returns:
+        HciDownloader: downloader used, for its statistics and timing
+    """
+    downloader = HciDownloader(board.hci_port_name, preset=preset,
+                               window=window, verify=verify)
+
+    def enter_hci_mode():
+        with downloader.timing.phase(PHASE_HCI_MODE):
+            res = board.enter_hci_download_mode(board.hci_port_name)
+        if res < 0:
+            raise HciError(f'Board {board.probe.id} failed to enter HCI download mode [{res}]')
+
+    enter_hci_mode()
+    attempt = 0
+    try:
+        while True:
+            try:
+                downloader.program_firmware(minidriver, firmware, chip_erase=chip_erase, progress=progress,
+                                            skip_unchanged=skip_unchanged, dry_run=dry_run,
+                                            record_id=board.probe.id, config=config,
+                                            hci_mode=enter_hci_mode)
+                break
+            except HciError as e:
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                logging.warning(f'[{board.probe.id}] {e}, retry {attempt} of {retries}')
+                if downloader.minidriver_baudrate is None:
+                    # Failed before the minidriver was running, start again from the ROM bootloader
+                    enter_hci_mode()
+    except Exception:
+        board.cancel_flash_firmware()
+        raise
+    with downloader.timing.phase(PHASE_RESET):
+        reset_board(board)
+    return downloader
@@ -0,0 +1,312 @@
+"""
+Simulated IF820 (CYW20820) HCI download target on a pseudo terminal.
+
+Used to test and benchmark HciDownloader without hardware. The target follows
+the download protocol through its states: the ROM bootloader accepts the
+minidriver in RAM, the minidriver writes, reads, CRCs and erases serial flash,
+and launching the firmware hands the UART over to the application. The
+target keeps a copy of everything written. Serial flash behaves as NOR: a
+write can only clear bits, so writing bytes that were not erased leaves the
+AND of the old and new data, as on the real part. POSIX only.
+
+Timing model: when a baud rate is given, each command is received and each
+event sent at the UART speed. Commands execute one at a time with a fixed
+processing time plus the chip erase time, and every response is delayed by a
+round-trip latency, which overlaps between commands. The ROM bootloader only
+listens at the default baud rate and the minidriver at the rate it was
+switched to; commands sent at any other rate are lost.
+
+The target buffers a fixed number of commands and reports it in every Command
+Complete as Num_HCI_Command_Packets. A command that arrives while the buffer
+is full is lost, as when a real controller's command buffer overruns.
+"""
+
+import collections
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+import zlib
+from HciDownloader import (HCI_ADDRESS, HCI_BAUDRATE, HCI_COMMAND_HEADER, HCI_CRC, HCI_EVENT_COMMAND_COMPLETE,
+                           HCI_EVENT_PKT, HCI_READ_RAM, HCI_RESET, HCI_STATUS_SUCCESS, HCI_STATUS_UNKNOWN_COMMAND,
+                           HCI_VERIFY_CRC, HCI_VSC_CHIP_ERASE, HCI_VSC_DOWNLOAD_MINIDRIVER, HCI_VSC_LAUNCH_RAM,
+                           HCI_VSC_READ_RAM, HCI_VSC_UPDATE_BAUDRATE, HCI_VSC_VERIFY_CRC, HCI_VSC_WRITE_RAM,
+                           HciDownloader)
+
+HCI_STATUS_HARDWARE_FAILURE = 0x03
+HCI_STATUS_COMMAND_DISALLOWED = 0x0C
+HCI_COMMAND_COMPLETE_HEADER = struct.Struct('<BBBBHB')
+PAGE_SIZE = 4096
+ERASED_PAGE = b'\xff' * PAGE_SIZE
+# Serial flash is mapped from here, RAM is below
+FLASH_BASE = 0x500000
+FLASH_SIZE = 0x100000
+# Start, data and stop bits per UART byte
+UART_BITS_PER_BYTE = 10
+
+STATE_ROM = 'rom'
+STATE_DOWNLOAD = 'download'
+STATE_MINIDRIVER = 'minidriver'
+STATE_APP = 'app'
+
+TERMIOS_BAUDRATES = {getattr(termios, name): int(name[1:]) for name in dir(termios)
+                     if name.startswith('B') and name[1:].isdigit()}
+
+
+class HciFakeTarget:
+    """Simulated HCI download target.
+    """
+
+    POLL_INTERVAL_SECONDS = 0.1
+
+    def __init__(self, latency: float = 0.0, processing_time: float = 0.0,
+                 error_rate: float = 0.0, seed: int = 0, crc: bool = True,
+                 baudrate: int = None, chip_erase_time: float = 0.0,
+                 credits: int = 1):
+        """Create a target.
+
+        Args:
+            latency (float, optional): round-trip latency in seconds. Defaults to 0.0.
+            processing_time (float, optional): time to execute each command in seconds. Defaults to 0.0.
+            error_rate (float, optional): fraction of writes that fail and must be resent. Defaults to 0.0.
+            seed (int, optional): random seed for error injection. Defaults to 0.
+            crc (bool, optional): the minidriver supports the CRC verify command. Defaults to True.
+            baudrate (int, optional): model the UART bandwidth, starting at this baud rate.
+            Defaults to None, which does not limit bandwidth or check the host baud rate.
+            chip_erase_time (float, optional): time to erase the whole flash in seconds. Defaults to 0.0.
+            credits (int, optional): commands the target can hold without a Command Complete
+            sent. Defaults to 1.
+        """
+        if credits < 1:
+            raise ValueError(f'Invalid credits {credits}')
+        self.latency = latency
+        self.processing_time = processing_time
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.crc = crc
+        self.initial_baudrate = baudrate
+        self.baudrate = baudrate
+        self.chip_erase_time = chip_erase_time
+        self.credits = credits
+        self.port_name = None
+        self.state = STATE_ROM
+        self.pages = {}
+        self.commands = collections.Counter()
+        self.errors = 0
+        self.lost = 0
+        self.overruns = 0
+        # Flash writes that tried to set bits which were not erased
+        self.corrupted_writes = 0
+        self._master = None
+        self._slave = None
+        self._responses = collections.deque()
+        self._responses_ready = threading.Condition()
+        self._running = False
+        self._threads = []
+
+    def start(self) -> str:
+        """Start the target.
+
+        Returns:
+            str: name of the port to open with HciDownloader
+        """
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._master)
+        tty.setraw(self._slave)
+        self.port_name = os.ttyname(self._slave)
+        self._running = True
+        self._threads = [threading.Thread(target=self._rx_thread, daemon=True),
+                         threading.Thread(target=self._tx_thread, daemon=True)]
+        for t in self._threads:
+            t.start()
+        return self.port_name
+
+    def stop(self):
+        """Stop the target."""
+        self._running = False
+        with self._responses_ready:
+            self._responses_ready.notify()
+        for t in self._threads:
+            t.join()
+        for fd in (self._slave, self._master):
+            if fd is not None:
+                os.close(fd)
+        self._master = self._slave = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def reset(self):
+        """Reset into the ROM bootloader, as the probe does to enter HCI download mode.
+        RAM is cleared, flash is kept."""
+        for page in [p for p in self.pages if p * PAGE_SIZE < FLASH_BASE]:
+            del self.pages[page]
+        self.state = STATE_ROM
+        self.baudrate = self.initial_baudrate
+
+    def read(self, address: int, length: int) -> bytes:
+        """Read target memory. Unwritten memory reads as erased."""
+        data = bytearray()
+        while length:
+            page, offset = divmod(address, PAGE_SIZE)
+            n = min(length, PAGE_SIZE - offset)
+            data += self.pages.get(page, ERASED_PAGE)[offset:offset + n]
+            address += n
+            length -= n
+        return bytes(data)
+
+    def write(self, address: int, data: bytes):
+        """Write target memory. Flash bytes get the AND of the old and new data."""
+        data = memoryview(data)
+        corrupted = False
+        while data:
+            page, offset = divmod(address, PAGE_SIZE)
+            n = min(len(data), PAGE_SIZE - offset)
+            buf = self.pages.setdefault(page, bytearray(ERASED_PAGE))
+            if FLASH_BASE <= address < FLASH_BASE + FLASH_SIZE:
+                new = (int.from_bytes(buf[offset:offset + n], 'little') &
+                       int.from_bytes(data[:n], 'little')).to_bytes(n, 'little')
+                corrupted = corrupted or new != data[:n]
+                buf[offset:offset + n] = new
+            else:
+                buf[offset:offset + n] = data[:n]
+            address += n
+            data = data[n:]
+        if corrupted:
+            self.corrupted_writes += 1
+
+    def _host_baudrate(self) -> int:
+        """Baud rate the host has set on its end of the pseudo terminal."""
+        try:
+            return TERMIOS_BAUDRATES.get(termios.tcgetattr(self._slave)[5])
+        except termios.error:
+            return None
+
+    def _wire_time(self, length: int) -> float:
+        return length * UART_BITS_PER_BYTE / self.baudrate if self.baudrate else 0.0
+
+    def _execute(self, opcode: int, params: bytes) -> tuple:
+        """Execute a command.
+
+        Returns:
+            tuple: (status, return parameters, busy time), or None if the target does not respond
+        """
+        self.commands[opcode] += 1
+        if self.state == STATE_APP:
+            # The application owns the UART. A reset stands in for the probe
+            # putting the chip back into HCI download mode.
+            if opcode == HCI_RESET:
+                self.reset()
+            return None
+        minidriver = self.state == STATE_MINIDRIVER
+        busy = 0.0
+        if opcode == HCI_RESET:
+            pass
+        elif opcode == HCI_VSC_DOWNLOAD_MINIDRIVER:
+            if not minidriver:
+                self.state = STATE_DOWNLOAD
+        elif opcode == HCI_VSC_WRITE_RAM:
+            address, = HCI_ADDRESS.unpack_from(params)
+            data = params[HCI_ADDRESS.size:]
+            if self.state == STATE_ROM or (address >= FLASH_BASE and not minidriver):
+                return HCI_STATUS_COMMAND_DISALLOWED, b'', busy
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.errors += 1
+                return HCI_STATUS_HARDWARE_FAILURE, b'', busy
+            self.write(address, data)
+        elif opcode == HCI_VSC_READ_RAM:
+            address, length = HCI_READ_RAM.unpack_from(params)
+            return HCI_STATUS_SUCCESS, self.read(address, length), busy
+        elif opcode == HCI_VSC_LAUNCH_RAM:
+            address, = HCI_ADDRESS.unpack_from(params)
+            # Code in RAM is a (new) minidriver, anything else boots the application
+            self.state = STATE_MINIDRIVER if address < FLASH_BASE else STATE_APP
+        elif opcode == HCI_VSC_UPDATE_BAUDRATE:
+            _, baudrate = HCI_BAUDRATE.unpack_from(params)
+            if self.baudrate:
+                self.baudrate = baudrate
+        elif minidriver and opcode == HCI_VSC_VERIFY_CRC and self.crc:
+            address, length = HCI_VERIFY_CRC.unpack_from(params)
+            return HCI_STATUS_SUCCESS, HCI_CRC.pack(zlib.crc32(self.read(address, length))), busy
+        elif minidriver and opcode == HCI_VSC_CHIP_ERASE:
+            for page in [p for p in self.pages if p * PAGE_SIZE >= FLASH_BASE]:
+                del self.pages[page]
+            busy = self.chip_erase_time
+        else:
+            return HCI_STATUS_UNKNOWN_COMMAND, b'', busy
+        return HCI_STATUS_SUCCESS, b'', busy
+
+    def _rx_thread(self):
+        buf = bytearray()
+        rx_done = exec_done = tx_done = 0.0
+        # When the Command Complete of each buffered command is sent
+        buffered = collections.deque()
+        while self._running:
+            try:
+                if not select.select([self._master], [], [], self.POLL_INTERVAL_SECONDS)[0]:
+                    continue
+                data = os.read(self._master, 4096)
+            except OSError:
+                return
+            if not data:
+                return
+            now = time.monotonic()
+            buf += data
+            while len(buf) >= HCI_COMMAND_HEADER.size:
+                _, opcode, length = HCI_COMMAND_HEADER.unpack_from(buf)
+                end = HCI_COMMAND_HEADER.size + length
+                if len(buf) < end:
+                    break
+                params = bytes(buf[HCI_COMMAND_HEADER.size:end])
+                del buf[:end]
+                if self.baudrate and self._host_baudrate() not in (None, self.baudrate):
+                    # Sent at the wrong baud rate, the target only sees noise
+                    self.lost += 1
+                    continue
+                while buffered and buffered[0] <= now:
+                    buffered.popleft()
+                if len(buffered) >= self.credits:
+                    # More commands than the host was given credits for
+                    self.overruns += 1
+                    continue
+                rx_done = max(rx_done, now) + self._wire_time(end)
+                baudrate = self.baudrate
+                result = self._execute(opcode, params)
+                if result is None:
+                    continue
+                status, ret, busy = result
+                exec_done = max(exec_done, rx_done) + self.processing_time + busy
+                event = HCI_COMMAND_COMPLETE_HEADER.pack(
+                    HCI_EVENT_PKT, HCI_EVENT_COMMAND_COMPLETE,
+                    HCI_COMMAND_COMPLETE_HEADER.size - 3 + len(ret), self.credits, opcode, status) + ret
+                # A baud rate change takes effect after its Command Complete
+                wire = len(event) * UART_BITS_PER_BYTE / baudrate if baudrate else 0.0
+                tx_done = max(tx_done, exec_done + self.latency) + wire
+                buffered.append(tx_done)
+                with self._responses_ready:
+                    self._responses.append((tx_done, event))
+                    self._responses_ready.notify()
+
+    def _tx_thread(self):
+        while True:
+            with self._responses_ready:
+                while self._running and not self._responses:
+                    self._responses_ready.wait()
+                if not self._running:
+                    return
+                due, event = self._responses.popleft()
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                os.write(self._master, event)
+            except OSError:
+                return
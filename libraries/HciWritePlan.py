@@ -0,0 +1,148 @@
+"""
+Compile firmware images into a minimal list of HCI Write RAM commands.
+"""
+
+import functools
+import re
+import zlib
+from FirmwareImage import FirmwareImage
+
+# HCI command parameters are limited to 255 bytes, 4 of which are the address
+HCI_MAX_WRITE_SIZE = 251
+DEFAULT_MAX_WRITE_SIZE = 240
+# Bytes on the wire for each Write RAM command, besides the data:
+# packet type (1), opcode (2), length (1) and address (4)
+HCI_WRITE_OVERHEAD = 8
+# Size of the regions checked by CRC verification
+VERIFY_REGION_SIZE = 4096
+ERASED_RUN = re.compile(rb'\xff{%d,}' % (HCI_WRITE_OVERHEAD + 1))
+
+
+class WritePlan:
+    """Ordered list of (address, data) writes compiled from a firmware image.
+    A plan does not depend on the target and can be reused for any number of downloads.
+    """
+
+    def __init__(self, writes: list, max_write_size: int, source_commands: int, launch_address: int = None):
+        """Create a write plan.
+
+        Args:
+            writes (list): list of (address, memoryview) tuples
+            max_write_size (int): maximum data bytes per write
+            source_commands (int): number of write commands in the source file
+            launch_address (int, optional): address to launch after download. Defaults to None.
+        """
+        self.writes = writes
+        self.max_write_size = max_write_size
+        self.source_commands = source_commands
+        self.launch_address = launch_address
+        self._regions = {}
+
+    @property
+    def commands(self) -> int:
+        """Number of Write RAM commands in the plan."""
+        return len(self.writes)
+
+    @property
+    def size(self) -> int:
+        """Number of data bytes written by the plan."""
+        return sum(len(data) for _, data in self.writes)
+
+    def regions(self, region_size: int = VERIFY_REGION_SIZE) -> list:
+        """Split the written data into regions of contiguous writes, each with its CRC-32.
+        Regions end on region_size boundaries. The result is computed once per plan.
+
+        Args:
+            region_size (int, optional): region size and alignment. Defaults to VERIFY_REGION_SIZE.
+
+        Returns:
+            list: list of (address, data, crc32) tuples
+        """
+        if region_size not in self._regions:
+            spans = []
+            for address, data in self.writes:
+                if spans and spans[-1][0] + len(spans[-1][1]) == address:
+                    spans[-1][1].extend(data)
+                else:
+                    spans.append((address, bytearray(data)))
+            regions = []
+            for address, data in spans:
+                offset = 0
+                while offset < len(data):
+                    end = min(len(data), offset + region_size -
+                              (address + offset) % region_size)
+                    chunk = bytes(data[offset:end])
+                    regions.append((address + offset, chunk, zlib.crc32(chunk)))
+                    offset = end
+            self._regions[region_size] = regions
+        return self._regions[region_size]
+
+    def __iter__(self):
+        return iter(self.writes)
+
+    def __len__(self):
+        return len(self.writes)
+
+    def __repr__(self):
+        return (f'WritePlan(commands={self.commands}, source_commands={self.source_commands}, '
+                f'size={self.size}, max_write_size={self.max_write_size})')
+
+
+def _data_spans(data: bytes, skip_erased: bool) -> list:
+    """Return (offset, end) spans of data to write.
+    When skip_erased is set, runs of erased bytes that are longer than the
+    overhead of starting a new write are left out.
+    """
+    if not skip_erased:
+        return [(0, len(data))]
+    spans = []
+    start = 0
+    for run in ERASED_RUN.finditer(data):
+        if run.start() > start:
+            spans.append((start, run.start()))
+        start = run.end()
+    if start < len(data):
+        spans.append((start, len(data)))
+    return spans
+
+
+def iter_writes(segments, max_write_size: int = DEFAULT_MAX_WRITE_SIZE, erased: bool = False):
+    """Split (address, data) segments into writes of at most max_write_size bytes.
+    Segments can come from any iterable, including a FirmwareReader, so a file
+    can be written without building an image first.
+
+    Args:
+        segments (iterable): (address, bytes-like) segments
+        max_write_size (int, optional): maximum data bytes per write. Defaults to DEFAULT_MAX_WRITE_SIZE.
+        erased (bool, optional): the target was just erased, so all-0xFF data is skipped. Defaults to False.
+
+    Yields:
+        tuple: (address, memoryview) writes
+    """
+    if not 0 < max_write_size <= HCI_MAX_WRITE_SIZE:
+        raise ValueError(f'Invalid max write size {max_write_size}')
+    for address, data in segments:
+        view = memoryview(data)
+        for start, end in _data_spans(view, erased):
+            for offset in range(start, end, max_write_size):
+                chunk_end = min(offset + max_write_size, end)
+                yield address + offset, view[offset:chunk_end]
+
+
+@functools.lru_cache(maxsize=16)
+def compile_write_plan(image: FirmwareImage, max_write_size: int = DEFAULT_MAX_WRITE_SIZE,
+                       erased: bool = False) -> WritePlan:
+    """Compile an image into the fewest writes of at most max_write_size bytes.
+    Adjacent and overlapping records are already merged into segments when the
+    image is parsed. Plans are cached per image and settings.
+
+    Args:
+        image (FirmwareImage): image to compile
+        max_write_size (int, optional): maximum data bytes per write. Defaults to DEFAULT_MAX_WRITE_SIZE.
+        erased (bool, optional): the target was just erased, so all-0xFF data is skipped. Defaults to False.
+
+    Returns:
+        WritePlan: compiled plan
+    """
+    writes = list(iter_writes(image.segments, max_write_size, erased))
+    return WritePlan(writes, max_write_size, image.record_count, image.launch_address)
@@ -0,0 +1,190 @@
+"""
+Blocking interface to EZ-Serial, built on the in-tree codecs and dispatcher.
+
+Received data is decoded and dispatched on a reader thread, so responses and
+events are waited for by type instead of by scanning everything received:
+
+    with SyncEzSerialPort() as port:
+        port.open(board.puart_port_name)
+        err, rsp = port.send_and_wait(CMD_GET_BT_ADDR)
+
+Commands can be pipelined as with AsyncEzSerialPort:
+
+    with port.batch(stop_on_error=True) as batch:
+        attr = batch.add(CMD_GATTS_CREATE_ATTR, type=..., perm=..., length=..., data=...)
+        batch.add(CMD_GAP_START_ADV, mode=...)
+    if not batch.ok:
+        ...
+    handle = batch.response(attr).payload.handle
+"""
+
+import logging
+import serial
+from AsyncEzSerialPort import BATCH_WINDOW, DEFAULT_BAUDRATE, DEFAULT_TIMEOUT, TIMEOUT_ERROR, READ_SIZE
+from AsyncEzSerialPort import CommandBatch as AsyncCommandBatch
+from EzSerialApi import EzSerialApiMode
+from EzSerialDispatcher import DEFAULT_QUEUE_SIZE, EventDispatcher
+import EzSerialBinary
+import EzSerialText
+
+# Seconds a read waits for data, and so the longest the reader thread takes to stop
+READ_TIMEOUT = 0.1
+
+
+class CommandBatch(AsyncCommandBatch):
+    """Commands to send pipelined when the with block ends.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.results = self.port.send_batch(self.commands, self.stop_on_error, self.timeout, self.window)
+
+
+class SyncEzSerialPort:
+    """EZ-Serial over a serial port, blocking.
+    """
+
+    def __init__(self, api_mode: EzSerialApiMode = EzSerialApiMode.TEXT, queue_size: int = DEFAULT_QUEUE_SIZE):
+        """Create a port.
+
+        Args:
+            api_mode (EzSerialApiMode, optional): API format of the module. Defaults to TEXT.
+            queue_size (int, optional): most packets queued for each response and event type.
+            Defaults to DEFAULT_QUEUE_SIZE.
+        """
+        self.dispatcher = EventDispatcher(queue_size)
+        self.serial = None
+        self.set_api_format(api_mode)
+
+    def set_api_format(self, api_mode: EzSerialApiMode):
+        """Set the API format the module uses."""
+        self.api_mode = api_mode
+        self.codec = EzSerialBinary if api_mode == EzSerialApiMode.BINARY else EzSerialText
+        self.decoder = EzSerialBinary.BinaryDecoder() if api_mode == EzSerialApiMode.BINARY \
+            else EzSerialText.TextDecoder()
+
+    def feed(self, data: bytes) -> list:
+        """Decode received data with the current API format, for the reader thread."""
+        return self.decoder.feed(data)
+
+    def open(self, port_name: str, baudrate: int = DEFAULT_BAUDRATE, rtscts: bool = True):
+        """Open the serial port and start receiving."""
+        self.serial = serial.Serial(port_name, baudrate, rtscts=rtscts, timeout=READ_TIMEOUT)
+        try:
+            self.dispatcher.start(self._read, self)
+        except BaseException:
+            self.serial.close()
+            self.serial = None
+            raise
+
+    def _read(self) -> bytes:
+        return self.serial.read(min(max(1, self.serial.in_waiting), READ_SIZE))
+
+    def close(self):
+        if self.serial is None:
+            return
+        self.dispatcher.stop()
+        self.serial.close()
+        self.serial = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def send(self, data: bytes):
+        """Write data."""
+        self.serial.write(data)
+
+    def send_command(self, command: str, **kwargs):
+        """Send a command without waiting for its response."""
+        self.send(self.codec.encode_command(command, **kwargs))
+
+    def send_and_wait(self, command: str, apiformat: EzSerialApiMode = None,
+                      response_timeout: float = DEFAULT_TIMEOUT, **kwargs) -> tuple:
+        """Send a command and wait for its response.
+
+        Args:
+            command (str): command name, for example CMD_PING
+            apiformat (EzSerialApiMode, optional): API format to switch to after sending, for
+            commands that change it. Defaults to None.
+            response_timeout (float, optional): seconds to wait. Not named timeout, which is
+            a parameter of gap_start_scan. Defaults to DEFAULT_TIMEOUT.
+            kwargs: command parameters
+
+        Returns:
+            tuple: (error, response packet)
+        """
+        self.dispatcher.clear(command)
+        self.send_command(command, **kwargs)
+        if apiformat is not None:
+            self.set_api_format(apiformat)
+        packet = self.dispatcher.wait_response(command, response_timeout)
+        if packet is None:
+            return TIMEOUT_ERROR, None
+        return packet.payload.result, packet
+
+    def send_batch(self, commands: list, stop_on_error: bool = False, timeout: float = DEFAULT_TIMEOUT,
+                   window: int = BATCH_WINDOW) -> list:
+        """Send commands pipelined and wait for their responses.
+
+        Args:
+            commands (list): (command, parameters dict) tuples
+            stop_on_error (bool, optional): send no more commands after one fails. Up to
+            window - 1 commands after it have already been sent, and the module still runs
+            them; their results are returned too. Defaults to False.
+            timeout (float, optional): seconds to wait for each response. A timeout always
+            stops the batch. Defaults to DEFAULT_TIMEOUT.
+            window (int, optional): most commands waiting for a response. Defaults to BATCH_WINDOW.
+
+        Returns:
+            list: (error, response packet) for each command sent, in order
+        """
+        for command, _ in commands:
+            self.dispatcher.clear(command)
+        results = []
+        sent = 0
+        stop = False
+        while len(results) < len(commands) and not (stop and len(results) == sent):
+            if not stop and sent < len(commands) and sent - len(results) < window:
+                # Send all the window allows in one write
+                end = min(len(commands), len(results) + window)
+                self.send(b''.join(self.codec.encode_command(command, **kwargs)
+                                   for command, kwargs in commands[sent:end]))
+                sent = end
+            command, _ = commands[len(results)]
+            packet = self.dispatcher.wait_response(command, timeout)
+            if packet is None:
+                logging.error(f'No response to {command}')
+                results.append((TIMEOUT_ERROR, None))
+                # Responses to the other commands sent are not waited for
+                break
+            results.append((packet.payload.result, packet))
+            if packet.payload.result and stop_on_error:
+                stop = True
+        return results
+
+    def batch(self, stop_on_error: bool = False, timeout: float = DEFAULT_TIMEOUT,
+              window: int = BATCH_WINDOW) -> CommandBatch:
+        """Collect commands in a with block and send them pipelined when it ends,
+        see send_batch(). The results are in the batch's results."""
+        return CommandBatch(self, stop_on_error, timeout, window)
+
+    def wait_event(self, event: str, timeout: float = DEFAULT_TIMEOUT, predicate=None, **fields) -> tuple:
+        """Wait for an event, see EventDispatcher.wait_event().
+
+        Returns:
+            tuple: (error, event packet)
+        """
+        packet = self.dispatcher.wait_event(event, timeout, predicate, **fields)
+        if packet is None:
+            return TIMEOUT_ERROR, None
+        return 0, packet
+
+    def subscribe(self, event: str, callback, predicate=None, consume: bool = False, **fields):
+        """Call a function for each matching event, see EventDispatcher.subscribe()."""
+        return self.dispatcher.subscribe(event, callback, predicate, consume, **fields)
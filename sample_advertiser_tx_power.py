@@ -10,7 +10,8 @@ import logging
 import time
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
+from BoardDiscovery import BoardDiscovery
 import EzSerialPort as ez_port
 
 
@@ -51,7 +52,7 @@ if __name__ == '__main__':
     tx_power = args.tx_power
 
     # IF820
-    if820_board_p = If820Board.get_board()
+    if820_board_p = BoardDiscovery().get_board()
     logging.info(f'Port Name: {if820_board_p.puart_port_name}')
     if820_board_p.open_and_init_board()
     if820_board_p.p_uart.set_api_format(API_FORMAT)
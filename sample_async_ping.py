@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import logging
+import sys
+sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
+
+"""
+Hardware Setup
+This sample requires the following hardware:
+-One or more IF820 connected to PC via USB
+-Jumpers on PUART_TXD, PUART_RXD, PUART_CTS, PUART_RTS must be installed.
+
+Pings every attached board at the same time from one thread.
+"""
+
+
+async def ping_board(board, count: int):
+    from AsyncEzSerialPort import AsyncIf820Board
+    from EzSerialApi import CMD_GET_BT_ADDR, CMD_PING
+    async with AsyncIf820Board(board) as b:
+        err, rsp = await b.p_uart.send_and_wait(CMD_GET_BT_ADDR)
+        if err:
+            logging.error(f'[{board.probe.id}] CMD_GET_BT_ADDR failed: {err}')
+            return
+        address = bytes(rsp.payload.address)[::-1].hex(':')
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for _ in range(count):
+            err, rsp = await b.p_uart.send_and_wait(CMD_PING)
+            if err:
+                logging.error(f'[{board.probe.id}] CMD_PING failed: {err}')
+                return
+        elapsed = loop.time() - start
+        logging.info(f'[{board.probe.id}] {address}: {count} pings, {elapsed / count * 1000:.1f} ms each')
+
+
+async def main(boards: list, count: int):
+    await asyncio.gather(*[ping_board(b, count) for b in boards])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=100,
+                        help="pings to send to each board")
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
+    args, unknown = parser.parse_known_args()
+    from BoardDiscovery import BoardDiscovery
+    if args.debug:
+        logging.info("Debugging mode enabled")
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    boards = BoardDiscovery().get_connected_boards()
+    if len(boards) == 0:
+        logging.error("No boards found")
+        exit(1)
+    asyncio.run(main(boards, args.count))
@@ -4,7 +4,6 @@ import argparse
 import logging
 import sys
 sys.path.append('./common_lib/libraries')
-from BT900SerialPort import BT900SerialPort
 
 """
 Hardware Setup
@@ -20,6 +19,7 @@ if __name__ == '__main__':
                         help="Enable verbose debug messages")
     logging.basicConfig(format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
     args, unknown = parser.parse_known_args()
+    from BT900SerialPort import BT900SerialPort
     if args.debug:
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
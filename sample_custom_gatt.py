@@ -17,8 +17,10 @@ import time
 import threading
 import sys
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 import EzSerialPort as ez_port
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 
 API_FORMAT = ez_port.EzSerialApiMode.TEXT.value
 ADV_MODE = ez_port.GapAdvertMode.NA.value
@@ -169,7 +171,7 @@ if __name__ == '__main__':
 
     low_power = args.low_power
 
-    boards = If820Board.get_connected_boards()
+    boards = BoardDiscovery().get_connected_boards()
     if len(boards) < 2:
         logging.critical(
             "Two IF820 boards required for this sample.")
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""The custom GATT batch sample sets up the same peripheral as sample_custom_gatt.py,
+advertising a custom payload and the BT SIG GATT Battery Service
+(https://www.bluetooth.com/specifications/specs/battery-service/), but sends the
+bring-up commands as one pipelined batch with the in-tree SyncEzSerialPort.
+The handles of the created attributes are read from the batch by the index
+add() returned for each command.
+Every 5 seconds, the peripheral will change the battery level and notify it.
+Connect to it with any central, for example a phone app.
+To run this sample you need one IF820 DVK board.
+"""
+
+import argparse
+import logging
+import sys
+import time
+sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
+from BoardDiscovery import BoardDiscovery
+from EzSerialApi import (CMD_GAP_SET_ADV_DATA, CMD_GAP_SET_ADV_PARAMETERS, CMD_GAP_START_ADV, CMD_GAP_STOP_ADV,
+                         CMD_GATTS_CREATE_ATTR, CMD_GATTS_NOTIFY_HANDLE, CMD_GATTS_WRITE_HANDLE,
+                         EVENT_GAP_CONNECTED, EVENT_SYSTEM_BOOT, EzSerialApiMode)
+from SyncEzSerialPort import SyncEzSerialPort
+
+API_FORMAT = EzSerialApiMode.TEXT
+BAUDRATE = 115200
+BOOT_TIMEOUT = 5
+ADV_PARAMETERS = dict(mode=0,  # NA
+                      type=3,  # Undirected low duty cycle
+                      channels=7,  # All
+                      high_interval=0x40,
+                      high_duration=0,
+                      low_interval=0x40,
+                      low_duration=0,
+                      flags=0x0F,  # All
+                      directAddr=[0, 0, 0, 0, 0, 0],
+                      directAddrType=0)  # Public
+ADV_DATA = [0x02, 0x01, 0x06,
+            0x08, 0x08, 0x62, 0x61, 0x74, 0x74, 0x65, 0x72, 0x79,
+            0x03, 0x02, 0x0f, 0x18]
+ATTR_TYPE_STRUCTURE = 0
+ATTR_TYPE_VALUE = 1
+ATTR_PERM_READ = 0x02
+ATTR_PERM_WRITE_ACK = 0x08
+ATTR_PERM_AUTH_WRITE = 0x20
+DATA_UPDATE_INTERVAL_SECONDS = 5
+
+
+def quit_on_resp_err(resp: int):
+    """Exit the program if the response code is not 0.
+
+    Args:
+        resp (int): response code
+    """
+    if resp != 0:
+        sys.exit(f'Response err: {hex(resp)}')
+
+
+def reset_module(board, port: SyncEzSerialPort):
+    """Reset the module and wait for it to boot.
+
+    Args:
+        board (If820Board): board to reset
+        port (SyncEzSerialPort): open PUART of the board
+    """
+    board.probe.open()
+    try:
+        board.probe.reset_target()
+    finally:
+        board.probe.close()
+    res = port.wait_event(EVENT_SYSTEM_BOOT, BOOT_TIMEOUT)
+    quit_on_resp_err(res[0])
+    logging.info(f'Booted: {res[1]}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--debug', action='store_true',
+                        help="Enable verbose debug messages")
+    logging.basicConfig(
+        format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
+    args, unknown = parser.parse_known_args()
+    if args.debug:
+        logging.info("Debugging mode enabled")
+        logging.getLogger().setLevel(logging.DEBUG)
+
+    boards = BoardDiscovery().get_connected_boards()
+    if len(boards) == 0:
+        logging.critical("No boards found")
+        exit(1)
+    board = boards[0]
+    battery_level = 100
+
+    with SyncEzSerialPort(API_FORMAT) as port:
+        port.open(board.puart_port_name, BAUDRATE)
+        reset_module(board, port)
+
+        logging.info('Configure advertiser...')
+        with port.batch(stop_on_error=True) as batch:
+            batch.add(CMD_GAP_STOP_ADV)
+            batch.add(CMD_GAP_SET_ADV_PARAMETERS, **ADV_PARAMETERS)
+            batch.add(CMD_GAP_SET_ADV_DATA, data=ADV_DATA)
+            # Battery service descriptor
+            batch.add(CMD_GATTS_CREATE_ATTR,
+                      type=ATTR_TYPE_STRUCTURE,
+                      perm=ATTR_PERM_READ,
+                      length=4,
+                      data=bytearray.fromhex('00280F18'))
+            # Battery level characteristic descriptor
+            batch.add(CMD_GATTS_CREATE_ATTR,
+                      type=ATTR_TYPE_STRUCTURE,
+                      perm=ATTR_PERM_READ,
+                      length=7,
+                      data=bytearray.fromhex('0328121800192A'))
+            # Battery level characteristic value
+            battery_level_attr = batch.add(CMD_GATTS_CREATE_ATTR,
+                                           type=ATTR_TYPE_VALUE,
+                                           perm=ATTR_PERM_READ | ATTR_PERM_AUTH_WRITE,
+                                           length=1,
+                                           data=[battery_level])
+            # Battery level Client Characteristic Configuration descriptor
+            batch.add(CMD_GATTS_CREATE_ATTR,
+                      type=ATTR_TYPE_STRUCTURE,
+                      perm=ATTR_PERM_READ | ATTR_PERM_WRITE_ACK,
+                      length=4,
+                      data=bytearray.fromhex('02290000'))
+            batch.add(CMD_GAP_START_ADV, **ADV_PARAMETERS)
+        # A failed command or a timeout stops the batch, and is the last result
+        for res in batch.results:
+            quit_on_resp_err(res[0])
+        battery_level_handle = batch.response(battery_level_attr).payload.handle
+        logging.info(f'Battery level handle: {battery_level_handle}')
+
+        logging.info('Wait for connection...')
+        res = port.wait_event(EVENT_GAP_CONNECTED, timeout=None)
+        logging.info(f'Connected! [{res[1]}]')
+        con_handle = res[1].payload.conn_handle
+
+        while True:
+            time.sleep(DATA_UPDATE_INTERVAL_SECONDS)
+            battery_level -= 1
+            if battery_level < 0:
+                battery_level = 100
+            res = port.send_and_wait(CMD_GATTS_WRITE_HANDLE,
+                                     attr_handle=battery_level_handle,
+                                     data=[battery_level])
+            quit_on_resp_err(res[0])
+            logging.info(f'Changed battery level: {battery_level}')
+            # Notify any connected device subscribed to notifications
+            res = port.send_and_wait(CMD_GATTS_NOTIFY_HANDLE,
+                                     conn_handle=con_handle,
+                                     attr_handle=battery_level_handle,
+                                     data=[battery_level])
+            if res[0] != 0:
+                logging.error(f'Failed to notify battery level {battery_level} [{hex(res[0])}]')
@@ -5,8 +5,7 @@ import logging
 import time
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
-from BT900SerialPort import BT900SerialPort
+sys.path.append('./libraries')
 
 """
 Hardware Setup
@@ -30,6 +29,9 @@ if __name__ == '__main__':
     parser.add_argument('-d', '--debug', action='store_true',
                         help="Enable verbose debug messages")
     args, unknown = parser.parse_known_args()
+    from If820Board import If820Board
+    from BoardDiscovery import BoardDiscovery
+    from BT900SerialPort import BT900SerialPort
     logging.basicConfig(
         format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
     if args.debug:
@@ -43,7 +45,7 @@ if __name__ == '__main__':
         args.connection_c, bt900_central.BT900_DEFAULT_BAUD)
 
     # IF820
-    if820_board_p = If820Board.get_board()
+    if820_board_p = BoardDiscovery().get_board()
     if820_board_p.open_and_init_board()
     if820_board_p.p_uart.set_api_format(API_FORMAT)
 
@@ -5,8 +5,10 @@ import argparse
 import time
 import sys
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 import EzSerialPort as ez_port
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 
 """
 Hardware Setup
@@ -83,7 +85,7 @@ if __name__ == '__main__':
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
-    boards = If820Board.get_connected_boards()
+    boards = BoardDiscovery().get_connected_boards()
     if len(boards) < 2:
         logging.critical(
             "Two IF820 boards required for this sample.")
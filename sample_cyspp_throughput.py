@@ -8,8 +8,10 @@ import threading
 import random
 import string
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 import EzSerialPort as ez_port
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 
 """
 This sample creates a CYSPP (BLE) connection between two IF820 boards and sends data between them.
@@ -175,7 +177,7 @@ if __name__ == '__main__':
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
-    boards = If820Board.get_connected_boards()
+    boards = BoardDiscovery().get_connected_boards()
     if len(boards) < 2:
         logging.critical(
             "Two IF820 boards required for this sample.")
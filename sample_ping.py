@@ -4,7 +4,7 @@ import argparse
 import logging
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
 
 """
 Hardware Setup
@@ -20,11 +20,13 @@ if __name__ == '__main__':
     logging.basicConfig(
         format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
     args, unknown = parser.parse_known_args()
+    from If820Board import If820Board
+    from BoardDiscovery import BoardDiscovery
     if args.debug:
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
-    if820_board_p = If820Board.get_board()
+    if820_board_p = BoardDiscovery().get_board()
     if820_board_p.open_and_init_board()
     logging.info('Sending ping command...')
     res = if820_board_p.p_uart.send_and_wait(if820_board_p.p_uart.CMD_PING)
@@ -5,7 +5,7 @@ import logging
 import time
 import sys
 sys.path.append('./common_lib/libraries')
-from If820Board import If820Board
+sys.path.append('./libraries')
 
 """
 Hardware Setup
@@ -21,11 +21,13 @@ if __name__ == '__main__':
     logging.basicConfig(
         format='%(asctime)s [%(module)s] %(levelname)s: %(message)s', level=logging.INFO)
     args, unknown = parser.parse_known_args()
+    from If820Board import If820Board
+    from BoardDiscovery import BoardDiscovery
     if args.debug:
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
-    board = If820Board.get_board()
+    board = BoardDiscovery().get_board()
     board.open_and_init_board()
     ezp = board.p_uart
 
@@ -5,7 +5,9 @@ import argparse
 import time
 import sys
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 import EzSerialPort as ez_port
 
 API_FORMAT = ez_port.EzSerialApiMode.TEXT.value
@@ -48,7 +50,7 @@ if __name__ == '__main__':
         logging.info("Debugging mode enabled")
         logging.getLogger().setLevel(logging.DEBUG)
 
-    if820_board_p = If820Board.get_board()
+    if820_board_p = BoardDiscovery().get_board()
     if820_board_p.open_and_init_board()
     if820_board_p.p_uart.set_api_format(API_FORMAT)
 
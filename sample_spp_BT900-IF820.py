@@ -5,8 +5,10 @@ import logging
 import time
 import sys
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 from BT900SerialPort import BT900SerialPort
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 import EzSerialPort as ez_port
 
 """
@@ -40,7 +42,7 @@ if __name__ == '__main__':
         args.connection_c, bt900_central.BT900_DEFAULT_BAUD)
 
     # IF820
-    if820_board_p = If820Board.get_board()
+    if820_board_p = BoardDiscovery().get_board()
     if820_board_p.open_and_init_board()
     if820_board_p.p_uart.set_api_format(API_FORMAT)
 
@@ -5,8 +5,10 @@ import logging
 import time
 import sys
 sys.path.append('./common_lib/libraries')
+sys.path.append('./libraries')
 from BT900SerialPort import BT900SerialPort
 from If820Board import If820Board
+from BoardDiscovery import BoardDiscovery
 import EzSerialPort as ez_port
 
 """
@@ -39,7 +41,7 @@ if __name__ == '__main__':
         args.connection_p, bt900_peripheral.BT900_DEFAULT_BAUD)
 
     # IF820
-    if820_board_c = If820Board.get_board()
+    if820_board_c = BoardDiscovery().get_board()
     if820_board_c.open_and_init_board()
     if820_board_c.p_uart.set_api_format(API_FORMAT)
 
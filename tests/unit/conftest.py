@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The libraries are imported by module name, as the tools and Robot suites do
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'libraries'))
@@ -0,0 +1,97 @@
+import asyncio
+import io
+import os
+import select
+import threading
+import pytest
+import serial
+import AsyncEzSerialPort as async_port
+from AsyncEzSerialPort import AsyncEzSerialPort
+from EzSerialApi import CMD_GAP_START_SCAN, CMD_PING
+from EzSerialFakeModule import EzSerialFakeModule
+from EzSerialText import encode_line
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='needs a pseudo terminal')
+
+
+@pytest.fixture
+def module_port():
+    """Pseudo terminal with a module that answers pings."""
+    import tty
+    master, slave = os.openpty()
+    tty.setraw(master)
+    tty.setraw(slave)
+    stop = threading.Event()
+
+    def respond():
+        received = b''
+        while not stop.is_set():
+            if select.select([master], [], [], 0.05)[0]:
+                received += os.read(master, 4096)
+            while b'\r\n' in received:
+                line, received = received.split(b'\r\n', 1)
+                if line == b'/PING':
+                    os.write(master, encode_line('R', 'system_ping', runtime=5))
+
+    thread = threading.Thread(target=respond, daemon=True)
+    thread.start()
+    yield os.ttyname(slave)
+    stop.set()
+    thread.join()
+    os.close(master)
+    os.close(slave)
+
+
+async def ping(port_name: str) -> tuple:
+    async with AsyncEzSerialPort() as port:
+        await port.open(port_name, rtscts=False)
+        err, packet = await port.send_and_wait(CMD_PING)
+        return err, packet, port.reader_thread is not None
+
+
+def test_ping_on_the_event_loop(module_port):
+    err, packet, threaded = asyncio.run(ping(module_port))
+    assert err == 0
+    assert packet.payload.runtime == 5
+    assert not threaded
+
+
+async def start_scan(port_name: str) -> tuple:
+    async with AsyncEzSerialPort() as port:
+        await port.open(port_name, rtscts=False)
+        return await port.send_and_wait(CMD_GAP_START_SCAN, timeout=30)
+
+
+def test_timeout_parameter_is_sent_with_the_command():
+    with EzSerialFakeModule() as module:
+        err, _ = asyncio.run(start_scan(module.port_name))
+    assert err == 0
+    assert module.command_params == [{'timeout': 30}]
+
+
+def test_port_without_file_descriptor_reads_on_a_thread(module_port, monkeypatch):
+    def fileno(self):
+        raise io.UnsupportedOperation('fileno')
+    monkeypatch.setattr(serial.Serial, 'fileno', fileno)
+    err, packet, threaded = asyncio.run(ping(module_port))
+    assert err == 0
+    assert threaded
+
+
+def test_setup_failure_closes_the_port(module_port, monkeypatch):
+    opened = []
+
+    class RecordingSerial(serial.Serial):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            opened.append(self)
+
+    def fail(self):
+        raise OSError('add_reader failed')
+    monkeypatch.setattr(async_port.serial, 'Serial', RecordingSerial)
+    monkeypatch.setattr(AsyncEzSerialPort, '_add_reader', fail)
+    port = AsyncEzSerialPort()
+    with pytest.raises(OSError):
+        asyncio.run(port.open(module_port, rtscts=False))
+    assert port.serial is None
+    assert not opened[0].is_open
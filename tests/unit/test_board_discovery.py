@@ -0,0 +1,64 @@
+import sys
+import threading
+import time
+import types
+import BoardDiscovery
+from BoardDiscovery import CachedBoard
+
+
+class FakeBoard:
+    def __init__(self, probe_id):
+        self.probe = types.SimpleNamespace(id=probe_id)
+        self.puart_port_name = f'{probe_id}-puart'
+        self.hci_port_name = f'{probe_id}-hci'
+        self.is_initialized = False
+
+
+def setup_discovery(tmp_path, monkeypatch):
+    """Discovery with one cached port that exists and a slow fake enumeration."""
+    enumerations = []
+
+    def get_connected_boards():
+        enumerations.append(threading.current_thread())
+        time.sleep(0.1)
+        return [FakeBoard('a'), FakeBoard('b')]
+
+    fingerprint = [[str(tmp_path), 'serial']]
+    monkeypatch.setattr(BoardDiscovery, '_port_fingerprint', lambda: fingerprint)
+    monkeypatch.setitem(sys.modules, 'If820Board', types.SimpleNamespace(
+        If820Board=types.SimpleNamespace(get_connected_boards=get_connected_boards)))
+    monkeypatch.setattr(BoardDiscovery.BoardDiscovery, '_boards', {})
+    monkeypatch.setattr(BoardDiscovery.BoardDiscovery, '_fingerprint', None)
+    discovery = BoardDiscovery.BoardDiscovery(str(tmp_path / 'discovery.json'))
+    discovery._save(fingerprint, [FakeBoard('a'), FakeBoard('b')])
+    return discovery, enumerations
+
+
+def test_cached_board_is_not_initialized_without_enumerating(tmp_path, monkeypatch):
+    discovery, enumerations = setup_discovery(tmp_path, monkeypatch)
+    boards = discovery.get_connected_boards()
+    assert all(isinstance(b, CachedBoard) for b in boards)
+    assert not boards[0].is_initialized
+    assert enumerations == []
+    assert boards[0].puart_port_name == 'a-puart'
+
+
+def test_concurrent_resolves_enumerate_once(tmp_path, monkeypatch):
+    discovery, enumerations = setup_discovery(tmp_path, monkeypatch)
+    boards = discovery.get_connected_boards() * 4
+    threads = [threading.Thread(target=lambda b=b: b.board) for b in boards]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(enumerations) == 1
+    assert [b.board.probe.id for b in boards[:2]] == ['a', 'b']
+
+
+def test_ports_changed_until_enumerated(tmp_path, monkeypatch):
+    discovery, enumerations = setup_discovery(tmp_path, monkeypatch)
+    discovery.get_connected_boards()
+    assert discovery.ports_changed()
+    discovery.get_connected_boards(refresh=True)
+    assert not discovery.ports_changed()
+    assert len(enumerations) == 1
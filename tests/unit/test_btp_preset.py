@@ -0,0 +1,50 @@
+import glob
+import os
+import pytest
+from BtpPreset import BtpPreset
+
+FILES = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'files'))
+
+PRESET = '''DevicePreset "20819A1 Serial Flash (8K pages)"
+{
+    DLWriteVerifyMode = "Write and verify"
+    DLMaxWriteSize = 200
+    MinidriverRebaudRate = 0x2DC6C0
+    DLPostResetDelay_ms = 50
+    DLConfigBD_ADDRBase = "20820A1*****"
+}
+'''
+
+
+def test_parse_values():
+    preset = BtpPreset.parse(PRESET, 'test.btp')
+    assert preset.name == '20819A1 Serial Flash (8K pages)'
+    assert preset.max_write_size == 200
+    assert preset.minidriver_rebaud_rate == 3000000
+    assert preset.post_reset_delay_ms == 50
+    assert preset.get('DLConfigBD_ADDRBase') == '20820A1*****'
+    assert preset.verify
+    assert preset.page_size == 8192
+
+
+def test_defaults():
+    preset = BtpPreset.parse('DevicePreset "Other"\n{\n    DLWriteVerifyMode = "Write only"\n}\n')
+    assert preset.max_write_size == BtpPreset.DEFAULT_MAX_WRITE_SIZE
+    assert preset.minidriver_rebaud_rate == BtpPreset.DEFAULT_MINIDRIVER_REBAUD_RATE
+    assert preset.post_reset_delay_ms == BtpPreset.DEFAULT_POST_RESET_DELAY_MS
+    assert preset.page_size == BtpPreset.DEFAULT_PAGE_SIZE
+    assert not preset.verify
+
+
+def test_no_preset():
+    with pytest.raises(ValueError):
+        BtpPreset.parse('DLMaxWriteSize = 240', 'empty.btp')
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(FILES, '*', '*.btp'))))
+def test_bundled_presets(path):
+    preset = BtpPreset.load(path)
+    assert preset.max_write_size == 240
+    assert preset.minidriver_rebaud_rate == 3000000
+    assert preset.page_size == 4096
+    assert BtpPreset.find(path).path == os.path.abspath(path)
@@ -0,0 +1,84 @@
+import pytest
+from ConfigData import (CONFIG_ENTRY, CONFIG_HEADER, DS_MAGIC, SS_MAGIC, TAG_BD_ADDRESS, TAG_END,
+                        TAG_LOCAL_NAME, config_image, find_entry, find_section, parse_bd_address)
+from FirmwareImage import FirmwareImage
+
+SS_ADDRESS = 0x500000
+DS_ADDRESS = 0x501400
+NAME_LENGTH = 16
+
+
+def section(magic: bytes, entries: list) -> bytes:
+    body = b''.join(CONFIG_ENTRY.pack(tag, len(data)) + data for tag, data in entries)
+    return CONFIG_HEADER.pack(magic, 0, len(body)) + body
+
+
+def make_image() -> FirmwareImage:
+    ss = section(SS_MAGIC, [(0x0001, b'\x11\x22'), (TAG_BD_ADDRESS, bytes(6)), (TAG_END, b'')])
+    ds = section(DS_MAGIC, [(TAG_LOCAL_NAME, b'Base'.ljust(NAME_LENGTH, b'\0')), (TAG_END, b'')])
+    return FirmwareImage([(SS_ADDRESS, ss), (DS_ADDRESS - 4, b'\xaa' * 4 + ds + b'\x55' * 32)],
+                         launch_address=0x500400, record_count=3, sha256='abc')
+
+
+def image_bytes(image: FirmwareImage, address: int, length: int) -> bytes:
+    for start, data in image.segments:
+        if start <= address and address + length <= start + len(data):
+            return bytes(data[address - start:address - start + length])
+    raise AssertionError(f'0x{address:x} not in image')
+
+
+def test_find_entry_follows_entries_from_the_header():
+    image = make_image()
+    ss = find_section(image, SS_MAGIC)
+    assert ss[0] == SS_ADDRESS
+    address, length = find_entry(ss, TAG_BD_ADDRESS)
+    assert address == SS_ADDRESS + CONFIG_HEADER.size + CONFIG_ENTRY.size + 2 + CONFIG_ENTRY.size
+    assert length == 6
+    ds = find_section(image, DS_MAGIC)
+    assert ds[0] == DS_ADDRESS
+    assert find_entry(ds, TAG_LOCAL_NAME) == (DS_ADDRESS + CONFIG_HEADER.size + CONFIG_ENTRY.size, NAME_LENGTH)
+
+
+def test_find_entry_stops_at_end_tag_and_truncated_entries():
+    image = make_image()
+    assert find_entry(find_section(image, SS_MAGIC), 0x1234) is None
+    truncated = CONFIG_HEADER.pack(SS_MAGIC, 0, 0) + CONFIG_ENTRY.pack(TAG_BD_ADDRESS, 6) + bytes(3)
+    assert find_entry((SS_ADDRESS, truncated), TAG_BD_ADDRESS) is None
+
+
+def test_config_image_patches_the_whole_image():
+    image = make_image()
+    patched = config_image(image, local_name='Unit 42', bd_address='00:16:A4:12:34:56')
+    assert patched.size == image.size
+    assert patched.sha256 == ''
+    assert patched.launch_address == image.launch_address
+    address, length = find_entry(find_section(image, DS_MAGIC), TAG_LOCAL_NAME)
+    assert image_bytes(patched, address, length) == b'Unit 42'.ljust(NAME_LENGTH, b'\0')
+    address, length = find_entry(find_section(image, SS_MAGIC), TAG_BD_ADDRESS)
+    assert image_bytes(patched, address, length) == bytes.fromhex('563412A41600')
+    # Data around the entries is kept
+    assert image_bytes(patched, DS_ADDRESS - 4, 4) == b'\xaa' * 4
+    assert image_bytes(patched, SS_ADDRESS, 8) == SS_MAGIC
+    # The base image is not changed
+    assert image_bytes(image, address, length) == bytes(6)
+
+
+def test_config_image_keeps_values_not_given():
+    image = make_image()
+    patched = config_image(image, bd_address='00-16-A4-12-34-56')
+    address, length = find_entry(find_section(image, DS_MAGIC), TAG_LOCAL_NAME)
+    assert image_bytes(patched, address, length) == b'Base'.ljust(NAME_LENGTH, b'\0')
+
+
+def test_config_image_rejects_invalid_settings():
+    image = make_image()
+    with pytest.raises(ValueError):
+        config_image(image, local_name='x' * NAME_LENGTH)
+    with pytest.raises(ValueError):
+        config_image(image, bd_address='00:16:A4:12:34')
+    with pytest.raises(ValueError):
+        config_image(FirmwareImage([(SS_ADDRESS, bytes(64))]), local_name='Unit')
+
+
+def test_parse_bd_address_is_lsb_first():
+    assert parse_bd_address('001122334455') == bytes.fromhex('554433221100')
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import pytest
+from AsyncEzSerialPort import AsyncEzSerialPort, TIMEOUT_ERROR
+from EzSerialApi import EzSerialApiMode
+from EzSerialFakeModule import EzSerialFakeModule, FIRST_ATTR_HANDLE
+from SyncEzSerialPort import SyncEzSerialPort
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='needs a pseudo terminal')
+
+ATTRIBUTES = [('gatts_create_attr', {'type': 0, 'perm': 2, 'length': 2, 'data': bytes([i, 0x28])})
+              for i in range(3)]
+COMMANDS = [('gap_stop_adv', {})] + ATTRIBUTES + [('gap_set_adv_data', {'data': bytes([2, 1, 6])}),
+                                                  ('gap_start_adv', {'mode': 2})]
+
+
+@pytest.fixture(params=list(EzSerialApiMode), ids=lambda m: m.name.lower())
+def api_mode(request):
+    return request.param
+
+
+def sync_batch(module: EzSerialFakeModule, api_mode: EzSerialApiMode, commands: list, **kwargs) -> list:
+    with SyncEzSerialPort(api_mode) as port:
+        port.open(module.port_name, rtscts=False)
+        return port.send_batch(commands, **kwargs)
+
+
+def test_results_are_in_order(api_mode):
+    with EzSerialFakeModule(api_mode, latency=0.002) as module:
+        results = sync_batch(module, api_mode, COMMANDS, window=4)
+    assert module.commands == [command for command, _ in COMMANDS]
+    assert [packet.name for _, packet in results] == module.commands
+    assert [err for err, _ in results] == [0] * len(COMMANDS)
+    handles = [packet.payload.handle for _, packet in results[1:4]]
+    assert handles == [FIRST_ATTR_HANDLE, FIRST_ATTR_HANDLE + 1, FIRST_ATTR_HANDLE + 2]
+
+
+def test_module_decodes_command_parameters(api_mode):
+    with EzSerialFakeModule(api_mode) as module:
+        sync_batch(module, api_mode, COMMANDS)
+    # Binary mode sends every parameter, text mode only those given
+    assert [{field: params[field] for field in expected}
+            for params, (_, expected) in zip(module.command_params, COMMANDS)] == [p for _, p in COMMANDS]
+    assert module.unknown == []
+
+
+def test_timeout_parameter_is_sent_with_the_command(api_mode):
+    with EzSerialFakeModule(api_mode) as module:
+        with SyncEzSerialPort(api_mode) as port:
+            port.open(module.port_name, rtscts=False)
+            err, _ = port.send_and_wait('gap_start_scan', timeout=30)
+    assert err == 0
+    assert module.command_params[0]['timeout'] == 30
+
+
+def test_stop_on_error_returns_the_commands_already_sent():
+    with EzSerialFakeModule(results={'gatts_create_attr': 0x0203}) as module:
+        results = sync_batch(module, EzSerialApiMode.TEXT, COMMANDS, stop_on_error=True, window=3)
+    # window - 1 commands after the failed one were sent before its response arrived
+    assert module.commands == ['gap_stop_adv'] + ['gatts_create_attr'] * 3
+    assert [err for err, _ in results] == [0, 0x0203, 0x0203, 0x0203]
+
+
+def test_errors_do_not_stop_the_batch_by_default():
+    with EzSerialFakeModule(results={'gap_set_adv_data': 0x0203}) as module:
+        results = sync_batch(module, EzSerialApiMode.TEXT, COMMANDS)
+    assert [err for err, _ in results] == [0, 0, 0, 0, 0x0203, 0]
+
+
+def test_timeout_stops_the_batch():
+    with EzSerialFakeModule(results={'gap_set_adv_data': None}) as module:
+        results = sync_batch(module, EzSerialApiMode.TEXT, COMMANDS, timeout=0.1, window=2)
+    assert [err for err, _ in results] == [0, 0, 0, 0, TIMEOUT_ERROR]
+    # The last command was in the window when the response did not arrive
+    assert module.commands == [command for command, _ in COMMANDS]
+
+
+def test_context_manager():
+    with EzSerialFakeModule(results={'gap_start_adv': 0x0101}) as module:
+        with SyncEzSerialPort() as port:
+            port.open(module.port_name, rtscts=False)
+            with port.batch() as batch:
+                indexes = [batch.add(command, **kwargs) for command, kwargs in COMMANDS[:-1]]
+            assert batch.ok
+            assert len(batch.results) == len(COMMANDS) - 1
+            assert batch.response(indexes[2]).payload.handle == FIRST_ATTR_HANDLE + 1
+            with port.batch() as batch:
+                command, kwargs = COMMANDS[-1]
+                batch.add(command, **kwargs)
+            assert not batch.ok
+        assert port.serial is None
+
+
+def test_async_batch_matches_the_blocking_port(api_mode):
+    async def main(port_name: str):
+        async with AsyncEzSerialPort(api_mode) as port:
+            await port.open(port_name, rtscts=False)
+            async with port.batch(stop_on_error=True, window=2) as batch:
+                for command, kwargs in COMMANDS:
+                    batch.add(command, **kwargs)
+            return batch
+
+    with EzSerialFakeModule(api_mode, results={'gatts_create_attr': 0x0203}) as module:
+        batch = asyncio.run(main(module.port_name))
+    assert module.commands == ['gap_stop_adv', 'gatts_create_attr', 'gatts_create_attr']
+    assert [err for err, _ in batch.results] == [0, 0x0203, 0x0203]
+    # Stopped before the last command was sent
+    assert batch.response(len(COMMANDS) - 1) is None
@@ -0,0 +1,123 @@
+import pytest
+from EzSerialApi import API_DEFINITIONS, COMMANDS, EVENTS, KIND_COMMAND
+from EzSerialBinary import (BinaryDecoder, HEADER_SIZE, LAYOUTS, RESULT_FIELD, TYPE_COMMAND, TYPE_EVENT,
+                            encode_command, encode_fields, encode_packet, layout_key)
+
+VALUES = {
+    'uint8': 0xA5,
+    'int8': -100,
+    'uint16': 0xBEEF,
+    'int16': -12345,
+    'uint32': 0xDEADBEEF,
+    'macaddr': bytes.fromhex('563412A41600'),
+    'uint8a': bytes(range(31)),
+    'longuint8a': bytes(range(256)) * 2,
+}
+
+
+def sample_values(fields: list) -> dict:
+    return {name: VALUES[type] for name, type, _ in fields}
+
+
+def event_packet(name: str, **overrides) -> bytes:
+    d = EVENTS[name]
+    values = dict(sample_values(d.params), **overrides)
+    return encode_packet(TYPE_EVENT, d.group, d.id, encode_fields(d.params, values))
+
+
+def response_packet(name: str, result: int = 0) -> bytes:
+    d = COMMANDS[name]
+    fields = [RESULT_FIELD] + d.returns
+    values = dict(sample_values(fields), result=result)
+    return encode_packet(TYPE_COMMAND, d.group, d.id, encode_fields(fields, values))
+
+
+@pytest.mark.parametrize('definition', API_DEFINITIONS, ids=lambda d: d.name)
+def test_round_trip(definition):
+    if definition.kind == KIND_COMMAND:
+        fields = [RESULT_FIELD] + definition.returns
+        type = TYPE_COMMAND
+    else:
+        fields = definition.params
+        type = TYPE_EVENT
+    values = sample_values(fields)
+    packets = BinaryDecoder().feed(encode_packet(type, definition.group, definition.id,
+                                                 encode_fields(fields, values)))
+    assert len(packets) == 1
+    packet = packets[0]
+    assert packet.kind == ('rsp' if type == TYPE_COMMAND else 'evt')
+    assert packet.name == definition.name
+    assert packet.payload._asdict() == values
+
+
+def test_every_definition_has_a_layout():
+    for d in API_DEFINITIONS:
+        type = TYPE_COMMAND if d.kind == KIND_COMMAND else TYPE_EVENT
+        assert LAYOUTS[layout_key(type, d.group, d.id)].name == d.name
+
+
+def test_packets_split_across_reads():
+    stream = event_packet('gap_scan_result') + response_packet('system_ping') + \
+        event_packet('gattc_data_received')
+    decoder = BinaryDecoder(size=16)
+    packets = []
+    for i in range(len(stream)):
+        packets += decoder.feed(stream[i:i + 1])
+    assert [p.name for p in packets] == ['gap_scan_result', 'system_ping', 'gattc_data_received']
+    assert packets[2].payload.data == sample_values(EVENTS['gattc_data_received'].params)['data']
+    assert decoder.errors == 0
+    assert decoder.start == decoder.end == 0
+
+
+def test_resync_after_noise_and_bad_checksum():
+    good = event_packet('system_boot')
+    bad = bytearray(response_packet('system_ping'))
+    bad[-1] ^= 0xFF
+    decoder = BinaryDecoder()
+    assert decoder.feed(b'\x00\x13\x37' + bytes(bad)) == []
+    # A byte of the bad packet can look like a header with a length of up to
+    # 2K, so enough data must follow to fail its checksum too
+    count = 2100 // len(good) + 2
+    packets = decoder.feed(good * count)
+    assert packets and all(p.name == 'system_boot' for p in packets)
+    assert decoder.start == decoder.end == 0
+    assert decoder.errors > 0
+    assert [p.name for p in decoder.feed(good)] == ['system_boot']
+
+
+def test_bad_checksum_kept_without_verification():
+    bad = bytearray(event_packet('system_boot'))
+    bad[-1] ^= 0xFF
+    packets = BinaryDecoder(verify_checksum=False).feed(bytes(bad))
+    assert [p.name for p in packets] == ['system_boot']
+
+
+def test_unknown_packet_has_raw_payload():
+    decoder = BinaryDecoder()
+    packets = decoder.feed(encode_packet(TYPE_EVENT, 0x7F, 0x7F, b'\x01\x02'))
+    assert packets[0].name is None
+    assert packets[0].payload == b'\x01\x02'
+    assert decoder.unknown == 1
+
+
+def test_short_payload_is_skipped():
+    d = EVENTS['system_boot']
+    decoder = BinaryDecoder()
+    packets = decoder.feed(encode_packet(TYPE_EVENT, d.group, d.id, b'\x01') + event_packet('system_boot'))
+    assert [p.name for p in packets] == ['system_boot']
+    assert decoder.errors == 1
+
+
+def test_reset_drops_partial_packet():
+    decoder = BinaryDecoder()
+    packet = event_packet('system_boot')
+    assert decoder.feed(packet[:HEADER_SIZE]) == []
+    decoder.reset()
+    assert [p.name for p in decoder.feed(packet)] == ['system_boot']
+
+
+def test_encode_command_missing_fields_are_zero():
+    d = COMMANDS['system_ping']
+    assert encode_command('system_ping') == encode_packet(TYPE_COMMAND, d.group, d.id, b'')
+    with pytest.raises(ValueError):
+        encode_packet(TYPE_COMMAND, 0, 0, bytes(0x800))
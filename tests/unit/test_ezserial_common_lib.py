@@ -0,0 +1,111 @@
+"""Cross-check of the in-tree EZ-Serial definitions with common_lib's EzSerialPort.
+
+Besides the names, common_lib's port sends each shared command to the simulated
+module and receives each shared event from it, in text and binary mode. The
+module decodes commands and encodes events from the in-tree definitions, so
+binary groups and IDs, text keys and field names must match. Skipped when the
+common_lib submodule is not checked out."""
+
+import os
+import sys
+import pytest
+import EzSerialApi
+from EzSerialApi import COMMANDS, EVENTS, EzSerialApiMode
+from EzSerialFakeModule import EzSerialFakeModule
+
+COMMON_LIB = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'common_lib', 'libraries'))
+
+if not os.path.isdir(COMMON_LIB):
+    pytest.skip('common_lib is not checked out', allow_module_level=True)
+sys.path.append(COMMON_LIB)
+ez_port = pytest.importorskip('EzSerialPort')
+
+NAMES = [name for name in dir(EzSerialApi) if name.startswith(('CMD_', 'EVENT_'))]
+TIMEOUT = 2.0
+# A value of each field type that is not the default
+FIELD_VALUES = {
+    'uint8': 0x5A,
+    'int8': -5,
+    'uint16': 0x1234,
+    'int16': -300,
+    'uint32': 0x12345678,
+    'macaddr': bytes.fromhex('563412A05000'),
+    'uint8a': bytes([2, 1, 6]),
+    'longuint8a': bytes(range(20)),
+}
+
+
+def test_some_names_are_shared():
+    assert any(hasattr(ez_port.EzSerialPort, name) for name in NAMES)
+
+
+@pytest.mark.parametrize('name', NAMES)
+def test_command_and_event_names_match(name):
+    if not hasattr(ez_port.EzSerialPort, name):
+        pytest.skip(f'{name} is not in common_lib')
+    assert getattr(EzSerialApi, name) == getattr(ez_port.EzSerialPort, name)
+
+
+def test_api_modes_match():
+    for mode in EzSerialApi.EzSerialApiMode:
+        assert ez_port.EzSerialApiMode[mode.name].value == mode.value
+
+
+def shared(name: str) -> str:
+    if not hasattr(ez_port.EzSerialPort, name):
+        pytest.skip(f'{name} is not in common_lib')
+    return getattr(ez_port.EzSerialPort, name)
+
+
+def field_values(fields: list) -> dict:
+    return {f.name: FIELD_VALUES[f.type] for f in fields}
+
+
+def as_bytes(value):
+    return bytes(value) if isinstance(value, (bytes, bytearray, list, tuple)) else value
+
+
+@pytest.fixture(params=list(EzSerialApiMode), ids=lambda m: m.name.lower())
+def api_mode(request):
+    if os.name != 'posix':
+        pytest.skip('needs a pseudo terminal')
+    return request.param
+
+
+@pytest.fixture
+def fake(api_mode):
+    with EzSerialFakeModule(api_mode) as fake:
+        yield fake
+
+
+@pytest.fixture
+def port(fake, api_mode):
+    port = ez_port.EzSerialPort()
+    port.open(fake.port_name, port.IF820_DEFAULT_BAUD, False)
+    port.set_api_format(api_mode.value)
+    yield port
+    port.close()
+
+
+@pytest.mark.parametrize('name', [name for name in NAMES if name.startswith('CMD_')])
+def test_commands_are_sent_as_defined(name, fake, port):
+    command = shared(name)
+    definition = COMMANDS[getattr(EzSerialApi, name)]
+    values = field_values(definition.params)
+    # Byte arrays and addresses as lists, as the samples pass them
+    err, _ = port.send_and_wait(command, **{k: list(v) if isinstance(v, bytes) else v for k, v in values.items()})
+    assert err == 0
+    assert fake.commands[-1:] == [definition.name]
+    assert fake.command_params[-1:] == [values]
+    assert fake.unknown == []
+
+
+@pytest.mark.parametrize('name', [name for name in NAMES if name.startswith('EVENT_')])
+def test_events_are_received_as_defined(name, fake, port):
+    event = shared(name)
+    definition = EVENTS[getattr(EzSerialApi, name)]
+    values = field_values(definition.params)
+    fake.event(definition.name, **values)
+    err, packet = port.wait_event(event, TIMEOUT)
+    assert err == 0
+    assert {field: as_bytes(getattr(packet.payload, field)) for field in values} == values
@@ -0,0 +1,112 @@
+import asyncio
+import collections
+import threading
+import time
+from EzSerialBinary import Packet
+from EzSerialDispatcher import AsyncEventDispatcher, EventDispatcher
+from EzSerialText import TextDecoder, encode_line
+
+Scan = collections.namedtuple('Scan', 'address rssi')
+Result = collections.namedtuple('Result', 'result')
+
+
+def scan(address: int, rssi: int = -50) -> Packet:
+    return Packet('evt', 'gap_scan_result', 4, 4, Scan(address, rssi))
+
+
+def boot() -> Packet:
+    return Packet('evt', 'system_boot', 2, 1, ())
+
+
+def test_overflow_drops_oldest_and_counts():
+    dispatcher = EventDispatcher(queue_size=3)
+    dispatcher.dispatch_all([scan(i) for i in range(5)])
+    assert dispatcher.pending('gap_scan_result') == 3
+    assert dispatcher.overflows['gap_scan_result'] == 2
+    assert dispatcher.wait_event('gap_scan_result', 0).payload.address == 2
+
+
+def test_flood_of_one_event_does_not_drop_others():
+    dispatcher = EventDispatcher(queue_size=2)
+    dispatcher.dispatch(boot())
+    dispatcher.dispatch_all([scan(i) for i in range(10)])
+    assert dispatcher.wait_event('system_boot', 0) is not None
+
+
+def test_wait_with_fields_drops_earlier_events_of_the_type_only():
+    dispatcher = EventDispatcher()
+    dispatcher.dispatch_all([scan(1), boot(), scan(2), scan(3)])
+    assert dispatcher.wait_event('gap_scan_result', 0, address=2).payload.address == 2
+    assert dispatcher.pending('gap_scan_result') == 1
+    assert dispatcher.pending('system_boot') == 1
+
+
+def test_wait_with_predicate():
+    dispatcher = EventDispatcher()
+    dispatcher.dispatch_all([scan(1, -90), scan(2, -40)])
+    packet = dispatcher.wait_event('gap_scan_result', 0, lambda p: p.rssi > -60)
+    assert packet.payload.address == 2
+    assert dispatcher.wait_event('gap_scan_result', 0, address=1) is None
+
+
+def test_wait_wakes_on_dispatch_from_another_thread():
+    dispatcher = EventDispatcher()
+    timer = threading.Timer(0.05, dispatcher.dispatch_all, [[scan(1), scan(2)]])
+    timer.start()
+    start = time.monotonic()
+    packet = dispatcher.wait_event('gap_scan_result', 2, address=2)
+    assert packet.payload.address == 2
+    assert time.monotonic() - start < 1
+    timer.join()
+
+
+def test_wait_times_out():
+    dispatcher = EventDispatcher()
+    start = time.monotonic()
+    assert dispatcher.wait_response('system_ping', 0.05) is None
+    assert time.monotonic() - start >= 0.05
+
+
+def test_responses_and_events_are_queued_apart():
+    dispatcher = EventDispatcher()
+    dispatcher.dispatch(Packet('rsp', 'system_ping', 2, 1, Result(0)))
+    assert dispatcher.wait_event('system_ping', 0) is None
+    assert dispatcher.wait_response('system_ping', 0).payload.result == 0
+
+
+def test_subscriptions():
+    dispatcher = EventDispatcher()
+    seen = []
+    consumed = dispatcher.subscribe('gap_scan_result', seen.append, consume=True, address=1)
+    dispatcher.subscribe('gap_scan_result', lambda p: 1 / 0, lambda p: p.rssi < -80)
+    dispatcher.dispatch_all([scan(1), scan(2, -90)])
+    assert [p.payload.address for p in seen] == [1]
+    # The consumed event is not queued, the failing callback does not stop dispatch
+    assert dispatcher.pending('gap_scan_result') == 1
+    dispatcher.unsubscribe(consumed)
+    dispatcher.dispatch(scan(1))
+    assert len(seen) == 1
+    assert dispatcher.pending('gap_scan_result') == 2
+
+
+def test_reader_thread_decodes_and_dispatches():
+    chunks = collections.deque([encode_line('E', 'system_boot', app=0x0104100F)])
+    dispatcher = EventDispatcher()
+    dispatcher.start(lambda: chunks.popleft() if chunks else time.sleep(0.01), TextDecoder())
+    try:
+        assert dispatcher.wait_event('system_boot', 2).payload.app == 0x0104100F
+    finally:
+        dispatcher.stop()
+
+
+def test_async_wait_with_predicate_and_timeout():
+    async def main():
+        dispatcher = AsyncEventDispatcher()
+        loop = asyncio.get_running_loop()
+        loop.call_later(0.02, dispatcher.dispatch_all, [scan(1, -90), scan(2, -40)])
+        packet = await dispatcher.wait_event('gap_scan_result', 1, lambda p: p.rssi > -60)
+        assert packet.payload.address == 2
+        assert await dispatcher.wait_event('gap_scan_result', 0.02) is None
+        assert not dispatcher.waiters['evt', 'gap_scan_result']
+
+    asyncio.run(main())
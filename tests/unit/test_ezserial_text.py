@@ -0,0 +1,80 @@
+import pytest
+from EzSerialApi import API_DEFINITIONS, KIND_COMMAND
+from EzSerialText import TextDecoder, decode_line, encode_command, encode_line
+
+VALUES = {
+    'uint8': 0xA5,
+    'int8': -100,
+    'uint16': 0xBEEF,
+    'int16': -12345,
+    'uint32': 0xDEADBEEF,
+    'macaddr': bytes.fromhex('563412A41600'),
+    'uint8a': bytes(range(31)),
+    'longuint8a': bytes(range(256)),
+}
+
+
+def sample_values(fields: list) -> dict:
+    return {name: VALUES[type] for name, type, _ in fields}
+
+
+@pytest.mark.parametrize('definition', API_DEFINITIONS, ids=lambda d: d.name)
+def test_round_trip(definition):
+    if definition.kind == KIND_COMMAND:
+        values = sample_values(definition.returns)
+        line = encode_line('R', definition.name, result=0x0123, **values)
+        values = dict(result=0x0123, **values)
+    else:
+        values = sample_values(definition.params)
+        line = encode_line('E', definition.name, **values)
+    packets = TextDecoder().feed(line)
+    assert len(packets) == 1
+    assert packets[0].name == definition.name
+    assert packets[0].payload._asdict() == values
+
+
+def test_encode_command():
+    assert encode_command('system_ping') == b'/PING\r\n'
+    line = encode_command('gap_connect', address=bytes.fromhex('563412A41600'), type=0, interval=6)
+    assert line == b'/C,A=0016A4123456,T=0,I=6\r\n'
+
+
+def test_encode_command_leaves_out_missing_parameters():
+    data = bytes([0x02, 0x01, 0x06])
+    assert encode_command('gap_set_adv_data', data=data) == b'SAD,D=020106\r\n'
+    assert encode_command('gap_set_adv_data', data=None) == b'SAD\r\n'
+
+
+def test_negative_values_decode_from_twos_complement_and_minus_sign():
+    line = encode_line('E', 'gap_scan_result', rssi=-40).decode().rstrip()
+    assert decode_line(line).payload.rssi == -40
+    assert decode_line(line.replace('R=D8', 'R=-28')).payload.rssi == -40
+
+
+def test_lines_split_across_reads_and_echo_skipped():
+    stream = b'/PING\r\n' + encode_line('R', 'system_ping', result=0, runtime=0x12D687, fraction=0x3A14) + \
+        encode_line('E', 'system_boot', app=0x0104100F)
+    decoder = TextDecoder()
+    packets = []
+    for i in range(len(stream)):
+        packets += decoder.feed(stream[i:i + 1])
+    assert [p.name for p in packets] == ['system_ping', 'system_boot']
+    assert packets[0].payload.runtime == 0x12D687
+    assert packets[1].payload.stack is None
+    assert decoder.errors == 0
+
+
+def test_bad_and_unknown_lines():
+    decoder = TextDecoder()
+    packets = decoder.feed(b'@E,0004,BOOT,E=XYZ\r\n@E,0008,NOPE,A=1\r\n@R,0002\r\n')
+    assert len(packets) == 1
+    assert packets[0].name is None
+    assert packets[0].payload == 'A=1'
+    assert decoder.errors == 2
+
+
+def test_full_buffer_without_line_end_is_dropped():
+    decoder = TextDecoder(size=64)
+    assert decoder.feed(b'\xc0' * 65) == []
+    assert decoder.errors == 1
+    assert [p.name for p in decoder.feed(encode_line('E', 'system_boot'))] == ['system_boot']
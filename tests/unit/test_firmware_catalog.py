@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+from FirmwareCatalog import FirmwareCatalog
+
+FILES = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'files'))
+
+
+def copy_release(root, name='v1.4.16.16_int-ant'):
+    shutil.copytree(os.path.join(FILES, name), os.path.join(root, name))
+
+
+def test_resolve_bundled_variant(tmp_path):
+    catalog = FirmwareCatalog(FILES, cache_dir=str(tmp_path))
+    release = catalog.resolve('ext_ant_int_lpo')
+    assert release.variant == 'ext-ant-int-lpo'
+    assert release.version == '1.4.16.16'
+    assert os.path.isfile(release.firmware('hcd'))
+    assert os.path.isfile(release.minidriver)
+
+
+def test_cache_is_used_until_a_file_changes(tmp_path, monkeypatch):
+    root = str(tmp_path / 'files')
+    copy_release(root)
+    cache = str(tmp_path / 'cache')
+    FirmwareCatalog(root, cache_dir=cache)
+    scans = []
+    monkeypatch.setattr(FirmwareCatalog, '_scan', lambda self: scans.append(self.root))
+    FirmwareCatalog(root, cache_dir=cache)
+    assert scans == []
+    with open(os.path.join(root, 'v1.4.16.16_int-ant', 'VELA-IF820.btp'), 'a') as f:
+        f.write('\n')
+    FirmwareCatalog(root, cache_dir=cache)
+    assert scans == [root]
+
+
+def test_bundle_cache_survives_a_new_extraction(tmp_path, monkeypatch):
+    executable = tmp_path / 'if820_flasher_cli'
+    executable.write_bytes(b'bundle')
+    cache = str(tmp_path / 'cache')
+    monkeypatch.setattr(sys, 'frozen', True, raising=False)
+    monkeypatch.setattr(sys, 'executable', str(executable))
+    for run in ('_MEI1', '_MEI2'):
+        bundle_dir = tmp_path / run
+        copy_release(str(bundle_dir / 'files'))
+        monkeypatch.setattr(sys, '_MEIPASS', str(bundle_dir), raising=False)
+        catalog = FirmwareCatalog(str(bundle_dir / 'files'), cache_dir=cache)
+        # Paths point into the current extraction, not the one the cache was built from
+        assert catalog.resolve('int-ant').directory == str(bundle_dir / 'files' / 'v1.4.16.16_int-ant')
+        monkeypatch.setattr(FirmwareCatalog, '_scan', lambda self: fail_scan(self.root))
+    assert len(os.listdir(cache)) == 1
+
+
+def fail_scan(root):
+    raise AssertionError(f'{root} was scanned again')
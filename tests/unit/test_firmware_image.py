@@ -0,0 +1,66 @@
+import struct
+import pytest
+from FirmwareImage import FirmwareImage, ImageCache, IMAGE_FILE_VERSION, merge_segments
+
+
+def test_merge_adjacent_segments():
+    assert merge_segments([(0x100, b'\x01\x02'), (0x102, b'\x03')]) == [(0x100, b'\x01\x02\x03')]
+
+
+def test_merge_keeps_gaps():
+    assert merge_segments([(0x200, b'\x02'), (0x100, b'\x01')]) == [(0x100, b'\x01'), (0x200, b'\x02')]
+
+
+def test_later_data_wins_where_segments_overlap():
+    segments = [(0x100, b'\xaa' * 4), (0x102, b'\xbb' * 4)]
+    assert merge_segments(segments) == [(0x100, b'\xaa\xaa\xbb\xbb\xbb\xbb')]
+
+
+def test_later_data_wins_when_it_starts_lower():
+    # File order decides, not address order
+    segments = [(0x102, b'\xbb' * 2), (0x100, b'\xaa' * 4)]
+    assert merge_segments(segments) == [(0x100, b'\xaa' * 4)]
+
+
+def test_contained_segment_overwrites_middle():
+    segments = [(0x100, b'\x00' * 6), (0x102, b'\x11\x11')]
+    assert merge_segments(segments) == [(0x100, b'\x00\x00\x11\x11\x00\x00')]
+
+
+def test_merge_empty():
+    assert merge_segments([]) == []
+
+
+def test_image_cache_round_trip():
+    image = FirmwareImage([(0x500000, b'\x01\x02'), (0x400, b'\x03')], 0x500100, 3, 'abc')
+    copy = FirmwareImage.from_bytes(image.to_bytes(), 'abc')
+    assert copy.segments == [(0x400, b'\x03'), (0x500000, b'\x01\x02')]
+    assert copy.launch_address == 0x500100
+    assert copy.record_count == 3
+
+
+def test_cache_files_of_an_older_version_are_ignored():
+    data = bytearray(FirmwareImage([(0x400, b'\x03')]).to_bytes())
+    data[8:10] = (IMAGE_FILE_VERSION - 1).to_bytes(2, 'little')
+    with pytest.raises(ValueError):
+        FirmwareImage.from_bytes(bytes(data))
+
+
+def hcd_write(address: int, value: int) -> bytes:
+    return struct.pack('<HBIB', 0xFC4C, 5, address, value)
+
+
+def test_file_index_is_bounded(tmp_path):
+    cache = ImageCache(None, max_stat_entries=2)
+    paths = []
+    for i in range(3):
+        path = tmp_path / f'{i}.hcd'
+        path.write_bytes(hcd_write(0x400, i))
+        paths.append(str(path))
+        cache.load(paths[-1])
+    assert list(cache._stat_index) == paths[1:]
+    # A rewritten file replaces its entry
+    with open(paths[2], 'ab') as f:
+        f.write(hcd_write(0x401, 9))
+    assert cache.load(paths[2]).size == 2
+    assert len(cache._stat_index) == 2
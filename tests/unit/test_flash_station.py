@@ -0,0 +1,206 @@
+import http.client
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import types
+import pytest
+import FlashStation
+from FlashStation import FlashStation as Station, ProbeLock, STATE_PASSED
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+import if820_flasher_station  # noqa: E402
+
+FLASH_SECONDS = 0.2
+
+
+class FakeBoard:
+    def __init__(self, probe_id):
+        self.probe = types.SimpleNamespace(id=probe_id)
+        self.hci_port_name = f'{probe_id}-hci'
+
+
+class FakeDiscovery:
+    """Boards attached by the test. Enumeration records how many probes were in use."""
+
+    def __init__(self, station):
+        self.station = station
+        self.attached = []
+        self.enumerated = []
+        self.in_use_while_enumerating = []
+        self.changed = True
+        self.lock = threading.Lock()
+
+    def attach(self, *probe_ids):
+        with self.lock:
+            self.attached += [FakeBoard(probe_id) for probe_id in probe_ids]
+            self.changed = True
+
+    def detach(self, probe_id):
+        with self.lock:
+            self.attached = [b for b in self.attached if b.probe.id != probe_id]
+            self.changed = True
+
+    def ports_changed(self):
+        return self.changed
+
+    def get_connected_boards(self, refresh=False):
+        with self.lock:
+            if self.changed:
+                self.in_use_while_enumerating.append(self.station.probes.users)
+                time.sleep(0.05)
+                self.enumerated = list(self.attached)
+                self.changed = False
+            return list(self.enumerated)
+
+
+@pytest.fixture
+def station(tmp_path, monkeypatch):
+    flashed = []
+
+    def flash_board_common_lib(board, minidriver, firmware, chip_erase=False):
+        flashed.append((board.probe.id, time.monotonic()))
+        time.sleep(FLASH_SECONDS)
+        if board.probe.id.startswith('bad'):
+            raise RuntimeError('No response')
+
+    monkeypatch.setattr(FlashStation, 'flash_board_common_lib', flash_board_common_lib)
+    s = Station('minidriver.hex', 'firmware.hex', workers=2, results_file=str(tmp_path / 'results.jsonl'),
+                poll_interval=0.01, check=False)
+    s.discovery = FakeDiscovery(s)
+    s.flashed = flashed
+    yield s
+    if s.threads:
+        s.stop()
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def done(station) -> int:
+    metrics = station.metrics()
+    return metrics['boards_passed'] + metrics['boards_failed']
+
+
+def test_usb_workers():
+    assert Station.usb_workers(8, 800000, 3000000) == 2
+    assert Station.usb_workers(8, 800000, 115200) == 8
+    assert Station.usb_workers(8, 100000, 3000000) == 1
+
+
+def test_boards_are_flashed_once_per_attach(station):
+    station.discovery.attach('a', 'b', 'c')
+    station.start()
+    wait_for(lambda: done(station) == 3)
+    time.sleep(0.05)
+    assert sorted(probe_id for probe_id, _ in station.flashed) == ['a', 'b', 'c']
+    station.discovery.detach('a')
+    wait_for(lambda: 'a' not in station.boards)
+    station.discovery.attach('a')
+    wait_for(lambda: done(station) == 4)
+    assert [probe_id for probe_id, _ in station.flashed].count('a') == 2
+
+
+def test_workers_flash_at_the_same_time(station):
+    station.discovery.attach('a', 'b')
+    station.start()
+    wait_for(lambda: done(station) == 2)
+    (_, first), (_, second) = station.flashed
+    assert abs(second - first) < FLASH_SECONDS
+
+
+def test_enumeration_waits_for_probes_in_use(station):
+    station.discovery.attach('a')
+    station.start()
+    wait_for(lambda: station.flashed)
+    # Attached while a is flashing
+    station.discovery.attach('b')
+    wait_for(lambda: done(station) == 2)
+    assert station.discovery.in_use_while_enumerating == [0, 0]
+    (_, a_started), (_, b_started) = station.flashed
+    assert b_started - a_started >= FLASH_SECONDS
+
+
+def test_results_are_json_lines(station):
+    station.discovery.attach('a', 'bad1')
+    station.start()
+    wait_for(lambda: done(station) == 2)
+    station.stop()
+    station.threads = []
+    with open(station.results_file) as f:
+        results = {r['probe_id']: r for r in map(json.loads, f)}
+    assert results['a']['result'] == 'PASS'
+    assert results['a']['seconds'] >= FLASH_SECONDS
+    assert results['bad1']['result'] == 'FAIL'
+    assert results['bad1']['error'] == 'No response'
+    metrics = station.metrics()
+    assert (metrics['boards_passed'], metrics['boards_failed']) == (1, 1)
+
+
+def test_probe_lock_holds_off_workers_while_enumerating():
+    probes = ProbeLock()
+    events = []
+
+    def work():
+        with probes.use():
+            events.append('used')
+
+    with probes.enumerate():
+        worker = threading.Thread(target=work)
+        worker.start()
+        time.sleep(0.05)
+        events.append('enumerated')
+    worker.join()
+    assert events == ['enumerated', 'used']
+
+
+def http_get(connection, path: str) -> dict:
+    connection.request('GET', path)
+    response = connection.getresponse()
+    assert response.status == 200
+    return json.loads(response.read())
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super().__init__('localhost')
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def test_status_and_metrics_over_tcp(station):
+    station.discovery.attach('a')
+    station.start()
+    wait_for(lambda: done(station) == 1)
+    server = if820_flasher_station.start_status_server(station, '127.0.0.1:0')
+    try:
+        connection = http.client.HTTPConnection(*server.server_address)
+        status = http_get(connection, '/status')
+        assert status['workers'] == 2
+        assert [(b['probe_id'], b['state']) for b in status['boards']] == [('a', STATE_PASSED)]
+        assert http_get(connection, '/metrics')['boards_passed'] == 1
+        connection.request('GET', '/other')
+        assert connection.getresponse().status == 404
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs Unix sockets')
+def test_metrics_over_unix_socket(station, tmp_path):
+    path = str(tmp_path / 'station.sock')
+    server = if820_flasher_station.start_status_server(station, path)
+    try:
+        assert http_get(UnixHTTPConnection(path), '/metrics')['boards_queued'] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,182 @@
+import os
+import struct
+import pytest
+import FirmwareImage
+from FirmwareImage import ImageCache
+from FlashTiming import PHASE_PROBE, PHASE_WRITE
+from HciDownloader import (HciDownloader, HciError, HCI_VSC_CHIP_ERASE, HCI_VSC_DOWNLOAD_MINIDRIVER,
+                           HCI_VSC_READ_RAM, HCI_VSC_VERIFY_CRC, SKIP_TARGET, VERIFY_CRC, VERIFY_READBACK)
+from HciFakeTarget import HciFakeTarget
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='needs a pseudo terminal')
+
+MINIDRIVER = os.path.join(os.path.dirname(__file__), '..', '..', 'files', 'v1.4.16.16_int-ant',
+                          'minidriver-20820A1-uart-patchram.hex')
+SECTOR = 0x1000
+# Two sectors of firmware, with an erased run the writes can skip
+SEGMENTS = [(0x500000, bytes(range(256)) * 8 + b'\xff' * 512 + b'\x5a' * 1536),
+            (0x501000, b'\xa5' * 3000)]
+
+
+@pytest.fixture(autouse=True)
+def image_cache(tmp_path, monkeypatch):
+    # Keep parsed images out of the user's cache
+    monkeypatch.setattr(FirmwareImage, 'image_cache', ImageCache(str(tmp_path / 'cache')))
+
+
+def hcd_file(path, segments: list) -> str:
+    with open(path, 'wb') as f:
+        for address, data in segments:
+            for offset in range(0, len(data), 200):
+                chunk = data[offset:offset + 200]
+                f.write(struct.pack('<HBI', 0xFC4C, 4 + len(chunk), address + offset) + chunk)
+    return str(path)
+
+
+@pytest.fixture
+def firmware(tmp_path) -> str:
+    return hcd_file(tmp_path / 'firmware.hcd', SEGMENTS)
+
+
+@pytest.fixture
+def other_firmware(tmp_path) -> str:
+    # Same first sector, the second one differs
+    return hcd_file(tmp_path / 'other.hcd', [SEGMENTS[0], (0x501000, b'\x3c' * 3000)])
+
+
+def assert_holds(target: HciFakeTarget, segments: list):
+    for address, data in segments:
+        assert target.read(address, len(data)) == data
+
+
+def test_program_and_read_back(firmware):
+    with HciFakeTarget() as target:
+        downloader = HciDownloader(target.port_name, verify=VERIFY_READBACK)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert_holds(target, SEGMENTS)
+        assert target.commands[HCI_VSC_READ_RAM] > 0
+        assert target.commands[HCI_VSC_VERIFY_CRC] == 0
+        assert downloader.retransmits == 0
+
+
+def test_crc_is_only_sent_when_asked_for(firmware):
+    with HciFakeTarget() as target:
+        downloader = HciDownloader(target.port_name, verify=VERIFY_CRC)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert target.commands[HCI_VSC_VERIFY_CRC] == 2
+        assert downloader.crc_trusted
+
+
+def test_rejected_crc_falls_back_to_read_back(firmware):
+    with HciFakeTarget(crc=False) as target:
+        downloader = HciDownloader(target.port_name, verify=VERIFY_CRC)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert not downloader.crc_supported
+        assert target.commands[HCI_VSC_VERIFY_CRC] == 1
+        assert target.commands[HCI_VSC_READ_RAM] > 0
+        assert_holds(target, SEGMENTS)
+
+
+def test_wrong_crc_on_good_data_disables_crc(firmware, monkeypatch):
+    with HciFakeTarget() as target:
+        downloader = HciDownloader(target.port_name, verify=VERIFY_CRC)
+        monkeypatch.setattr(downloader, 'read_crc', lambda address, length: 0)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert not downloader.crc_supported
+        assert_holds(target, SEGMENTS)
+
+
+def test_write_over_old_firmware_fails_verify(firmware, other_firmware):
+    with HciFakeTarget() as target:
+        HciDownloader(target.port_name).program_firmware(MINIDRIVER, firmware)
+        target.reset()
+        with pytest.raises(HciError, match='Verify failed at 0x501000'):
+            HciDownloader(target.port_name, verify=VERIFY_READBACK).program_firmware(MINIDRIVER, other_firmware)
+        assert target.corrupted_writes > 0
+        target.reset()
+        HciDownloader(target.port_name, verify=VERIFY_READBACK).program_firmware(
+            MINIDRIVER, other_firmware, chip_erase=True)
+
+
+def test_skip_unchanged_image(firmware):
+    with HciFakeTarget() as target:
+        HciDownloader(target.port_name).program_firmware(MINIDRIVER, firmware)
+        target.reset()
+        downloader = HciDownloader(target.port_name)
+        downloader.program_firmware(MINIDRIVER, firmware, skip_unchanged=SKIP_TARGET)
+        assert downloader.unchanged_sectors == [0x500000, 0x501000]
+        assert PHASE_WRITE not in downloader.timing.phases
+        assert target.commands[HCI_VSC_CHIP_ERASE] == 0
+
+
+def test_skip_unchanged_writes_a_changed_image_in_full(firmware, other_firmware):
+    with HciFakeTarget() as target:
+        HciDownloader(target.port_name).program_firmware(MINIDRIVER, firmware)
+        target.reset()
+        downloader = HciDownloader(target.port_name, verify=VERIFY_READBACK)
+        downloader.program_firmware(MINIDRIVER, other_firmware, skip_unchanged=SKIP_TARGET)
+        assert downloader.unchanged_sectors == [0x500000]
+        assert target.commands[HCI_VSC_CHIP_ERASE] == 1
+        assert_holds(target, [SEGMENTS[0], (0x501000, b'\x3c' * 3000)])
+
+
+def test_dry_run_writes_nothing(firmware, other_firmware):
+    with HciFakeTarget() as target:
+        HciDownloader(target.port_name).program_firmware(MINIDRIVER, firmware)
+        target.reset()
+        downloader = HciDownloader(target.port_name)
+        downloader.program_firmware(MINIDRIVER, other_firmware, skip_unchanged=SKIP_TARGET, dry_run=True)
+        assert downloader.unchanged_sectors == [0x500000]
+        assert target.commands[HCI_VSC_CHIP_ERASE] == 0
+        assert_holds(target, SEGMENTS)
+
+
+def fail_writes_after_first_progress(target: HciFakeTarget):
+    def progress(written, total):
+        target.error_rate = 1.0
+    return progress
+
+
+def test_retry_reuses_resident_minidriver(firmware):
+    with HciFakeTarget() as target:
+        downloader = HciDownloader(target.port_name)
+        with pytest.raises(HciError, match='failed after'):
+            downloader.program_firmware(MINIDRIVER, firmware, progress=fail_writes_after_first_progress(target))
+        target.error_rate = 0.0
+        downloader.program_firmware(MINIDRIVER, firmware, hci_mode=pytest.fail)
+        assert PHASE_PROBE in downloader.timing.phases
+        assert target.commands[HCI_VSC_DOWNLOAD_MINIDRIVER] == 1
+        assert_holds(target, SEGMENTS)
+
+
+def test_retry_after_reset_downloads_minidriver_again(firmware):
+    with HciFakeTarget() as target:
+        downloader = HciDownloader(target.port_name)
+        with pytest.raises(HciError):
+            downloader.program_firmware(MINIDRIVER, firmware, progress=fail_writes_after_first_progress(target))
+        target.error_rate = 0.0
+        target.reset()
+        calls = []
+        downloader.program_firmware(MINIDRIVER, firmware, hci_mode=lambda: calls.append(1))
+        assert calls == [1]
+        assert target.commands[HCI_VSC_DOWNLOAD_MINIDRIVER] == 2
+        assert_holds(target, SEGMENTS)
+
+
+@pytest.mark.parametrize('credits', [1, 4])
+def test_window_is_capped_by_credits(firmware, credits):
+    with HciFakeTarget(latency=0.001, credits=credits) as target:
+        downloader = HciDownloader(target.port_name, window=4, verify=VERIFY_READBACK)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert target.overruns == 0
+        assert downloader.retransmits == 0
+        assert downloader.credits == credits
+        assert_holds(target, SEGMENTS)
+
+
+def test_window_resends_failed_writes(firmware):
+    with HciFakeTarget(error_rate=0.2, seed=1, credits=8) as target:
+        downloader = HciDownloader(target.port_name, window=8, verify=VERIFY_READBACK)
+        downloader.program_firmware(MINIDRIVER, firmware)
+        assert downloader.retransmits == target.errors > 0
+        assert_holds(target, SEGMENTS)
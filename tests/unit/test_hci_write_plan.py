@@ -0,0 +1,61 @@
+import zlib
+import pytest
+from FirmwareImage import FirmwareImage
+from HciWritePlan import HCI_MAX_WRITE_SIZE, HCI_WRITE_OVERHEAD, compile_write_plan, iter_writes
+
+
+def writes(segments, max_write_size=240, erased=False) -> list:
+    return [(address, bytes(data)) for address, data in iter_writes(segments, max_write_size, erased)]
+
+
+def test_segments_are_split_at_max_write_size():
+    assert writes([(0x1000, bytes(10))], 4) == [(0x1000, bytes(4)), (0x1004, bytes(4)), (0x1008, bytes(2))]
+
+
+def test_invalid_max_write_size():
+    for size in (0, HCI_MAX_WRITE_SIZE + 1):
+        with pytest.raises(ValueError):
+            writes([(0, b'\x00')], size)
+
+
+def test_erased_runs_are_skipped_after_an_erase():
+    data = b'\x01' * 4 + b'\xff' * 100 + b'\x02' * 4
+    assert writes([(0x500000, data)], erased=True) == [(0x500000, b'\x01' * 4), (0x500068, b'\x02' * 4)]
+    assert writes([(0x500000, data)]) == [(0x500000, data)]
+
+
+def test_short_erased_runs_are_written():
+    # Splitting costs more than the run
+    data = b'\x01' + b'\xff' * HCI_WRITE_OVERHEAD + b'\x02'
+    assert writes([(0x500000, data)], erased=True) == [(0x500000, data)]
+
+
+def test_all_erased_segment_is_skipped():
+    assert writes([(0x500000, b'\xff' * 300)], erased=True) == []
+
+
+def test_compile_write_plan():
+    image = FirmwareImage([(0x500000, b'\x11' * 500), (0x600000, b'\x22' * 10)], 0x500010, 7)
+    plan = compile_write_plan(image, 200)
+    assert plan.commands == len(plan) == 4
+    assert plan.size == 510
+    assert plan.source_commands == 7
+    assert plan.launch_address == 0x500010
+    assert compile_write_plan(image, 200) is plan
+
+
+def test_regions_end_on_region_boundaries():
+    data = bytes(range(256)) * 32
+    plan = compile_write_plan(FirmwareImage([(0x500800, data)]), 240)
+    regions = plan.regions(0x1000)
+    assert [(address, len(chunk)) for address, chunk, _ in regions] == [
+        (0x500800, 0x800), (0x501000, 0x1000), (0x502000, 0x800)]
+    assert b''.join(chunk for _, chunk, _ in regions) == data
+    assert all(crc == zlib.crc32(chunk) for _, chunk, crc in regions)
+
+
+def test_regions_leave_out_skipped_runs():
+    data = b'\x01' * 16 + b'\xff' * 64 + b'\x02' * 16
+    plan = compile_write_plan(FirmwareImage([(0x500000, data)]), 240, erased=True)
+    assert [(address, chunk) for address, chunk, _ in plan.regions()] == [
+        (0x500000, b'\x01' * 16), (0x500050, b'\x02' * 16)]